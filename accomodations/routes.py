@@ -1,14 +1,60 @@
-from flask import Blueprint, make_response, jsonify, request
-from config import db
-from models import Accommodation, EntityMedia, EntityMediaType, RoomType
-from werkzeug.utils import secure_filename
-from products.utils import upload_file_to_azure
+from datetime import datetime, timezone
 
+from flask import Blueprint, current_app, make_response, jsonify, request
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import Range
+from sqlalchemy.exc import IntegrityError
+from cache import reference_cache
+from config import db
+from models import Accommodation, Booking, EntityMedia, EntityMediaType, RoomType
+from media import (
+    MediaUploadError,
+    attach_media,
+    discard_media,
+    queue_ingest,
+    stage_media,
+)
+from geo import nearby, nearby_items, parse_coordinates, parse_nearby
+from utils import (
+    batch_get,
+    catalog_validator,
+    load_fields,
+    not_modified,
+    number_arg,
+    parse_batch_ids,
+    parse_fields,
+    set_validators,
+)
 
 accommodations = Blueprint(
     "accommodations", __name__, url_prefix="/api/v1/accommodations"
 )
 
+UNBOOKABLE_STATUSES = ("unavailable", "maintenance")
+# SQLSTATE of a bookings_no_overlap violation.
+EXCLUSION_VIOLATION = "23P01"
+
+
+def _parse_stay(data):
+    """
+    Read ``check_in``/``check_out`` ISO 8601 timestamps, naive values are UTC.
+    :return: Tuple of (half-open Range, error).
+    """
+    try:
+        check_in, check_out = (
+            datetime.fromisoformat(data[key]) for key in ("check_in", "check_out")
+        )
+    except (KeyError, TypeError, ValueError):
+        return None, "check_in and check_out must be ISO 8601 timestamps"
+    check_in, check_out = (
+        value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        for value in (check_in, check_out)
+    )
+    if check_out <= check_in:
+        return None, "check_out must be after check_in"
+    return Range(check_in, check_out, bounds="[)"), None
+
 
 @accommodations.route("/create", methods=["POST"])
 def create_accommodation():
@@ -25,25 +71,37 @@ def create_accommodation():
             ),
             400,
         )
-    try:
+    (latitude, longitude), error = parse_coordinates(data)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    if data.get("status") not in [
+        "available",
+        "unavailable",
+        "booked",
+        "maintenance",
+    ]:
+        return make_response(jsonify({"error": "Invalid status value"}), 400)
+    room_type = reference_cache.by_name(RoomType, data.get("roomType"))
+    if not room_type:
+        return make_response(jsonify({"error": "Invalid room type"}), 400)
+    entity_type = reference_cache.by_name(EntityMediaType, "accommodation")
+    if not entity_type:
+        return make_response(jsonify({"error": "Entity type not found"}), 404)
 
-        if data.get("status") not in [
-            "available",
-            "unavailable",
-            "booked",
-            "maintenance",
-        ]:
-            return make_response(jsonify({"error": "Invalid status value"}), 400)
-        room_type = RoomType.query.filter_by(name=data.get("roomType")).first()
-        if not room_type:
-            return make_response(jsonify({"error": "Invalid room type"}), 400)
-        entity_type = EntityMediaType.query.filter_by(name="accommodation").first()
-        if not entity_type:
-            return make_response(jsonify({"error": "Entity type not found"}), 404)
+    # Upload (or spool) before opening the write transaction; undo it if that fails.
+    try:
+        staged = stage_media(request.files.getlist("media"))
+    except MediaUploadError as e:
+        return make_response(
+            jsonify({"message": "An error occurred", "error": str(e)}), 500
+        )
 
+    try:
         accommodation = Accommodation(
             name=data["name"],
             location=data["location"],
+            latitude=latitude,
+            longitude=longitude,
             description=data.get("description"),
             price=data["price"],
             status=data.get("status", "available"),
@@ -51,66 +109,71 @@ def create_accommodation():
         )
         db.session.add(accommodation)
         db.session.flush()
-
-        files = request.files.getlist("media")
-        for idx, file_obj in enumerate(files):
-            safe_filename = secure_filename(file_obj.filename)
-            blob_name = f"accommodations/{accommodation.id}/{idx}_{safe_filename}"
-            result = upload_file_to_azure(file_obj, blob_name)
-            if isinstance(result, dict) and result.get("url"):
-                url = result.get("url")
-                entity_media = EntityMedia(
-                    entity_id=accommodation.id,
-                    entity_type_id=entity_type.id,
-                    url=url,
-                    storage_type=2,
-                )
-                db.session.add(entity_media)
+        attach_media(accommodation.id, entity_type.id, staged)
         db.session.commit()
-        return make_response(
-            jsonify(
-                {
-                    "message": "Accommodation created successfully",
-                    "accomodation": accommodation.to_dict(),
-                }
-            ),
-            201,
-        )
-
     except Exception as e:
         db.session.rollback()
+        discard_media(staged)
         return make_response(
             jsonify({"message": "An error occurred", "error": str(e)}), 500
         )
 
+    return make_response(
+        jsonify(
+            {
+                "message": "Accommodation created successfully",
+                "accomodation": accommodation.to_dict(),
+            }
+        ),
+        202 if queue_ingest(staged) else 201,
+    )
+
 
 @accommodations.route("/getone/<int:accommodation_id>", methods=["GET"])
 def get_accommodation(accommodation_id):
-    """get a single accommodation"""
-    accommodation = Accommodation.query.filter_by(id=accommodation_id).first()
+    """get a single accommodation, supports a sparse ``fields`` list"""
+    fields, error = parse_fields(Accommodation)
+    if error:
+        return error
+    query = Accommodation.query.filter_by(id=accommodation_id)
+    accommodation = load_fields(query, Accommodation, fields).first()
     if not accommodation:
         return make_response(jsonify({"error": "Accommodation not found"}), 404)
     media = EntityMedia.query.filter_by(
         entity_id=accommodation.id,
-        entity_type_id=EntityMediaType.query.filter_by(name="accommodation").first().id,
+        entity_type_id=reference_cache.by_name(EntityMediaType, "accommodation").id,
+        status="ready",
+    ).all()
+    etag, last_modified = catalog_validator(
+        Accommodation, [accommodation], related=media
     )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
     accommodation.media = [m.url for m in media]
     accommodation.image_url = media[0].url if media else None
     if not accommodation.media:
         accommodation.media = []
-    return make_response(jsonify(accommodation.to_dict()), 200)
+    return set_validators(
+        make_response(jsonify(accommodation.to_dict(only=fields or ())), 200),
+        etag,
+        last_modified,
+    )
 
 
 @accommodations.route("/getall", methods=["GET"])
 def get_accommodations():
-    """get all accommodations"""
+    """get all accommodations, supports a sparse ``fields`` list"""
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
     room_type = request.args.get("roomType", None, type=str)
+    fields, error = parse_fields(Accommodation)
+    if error:
+        return error
 
     existing_room_type = None
     if room_type:
-        existing_room_type = RoomType.query.filter_by(name=room_type).first()
+        existing_room_type = reference_cache.by_name(RoomType, room_type)
         if not existing_room_type:
             return make_response(jsonify({"error": "Invalid room type"}), 400)
 
@@ -118,21 +181,23 @@ def get_accommodations():
     if existing_room_type:
         query = query.filter_by(room_type_id=existing_room_type.id)
 
-    accommodations_pagination = query.paginate(
+    accommodations_pagination = load_fields(query, Accommodation, fields).paginate(
         page=page, per_page=per_page, error_out=False
     )
-    accommodations = []
-    entity_type = EntityMediaType.query.filter_by(name="accommodation").first()
-    for accommodation in accommodations_pagination.items:
-        if not accommodation.image_url:
-            media = EntityMedia.query.filter_by(
-                entity_id=accommodation.id, entity_type_id=entity_type.id
-            ).all()
-            accommodation.media = [m.url for m in media]
-            accommodation.image_url = media[0].url if media else None
-        accommodations.append(accommodation.to_dict())
+    etag, last_modified = catalog_validator(
+        Accommodation,
+        accommodations_pagination.items,
+        accommodations_pagination.total,
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    accommodations = [
+        accommodation.to_dict(only=fields or ())
+        for accommodation in accommodations_pagination.items
+    ]
 
-    return make_response(
+    response = make_response(
         jsonify(
             {
                 "items": accommodations,
@@ -146,6 +211,168 @@ def get_accommodations():
         ),
         200,
     )
+    return set_validators(response, etag, last_modified)
+
+
+@accommodations.route("/nearby", methods=["GET"])
+def get_accommodations_nearby():
+    """
+    Endpoint to find the accommodations closest to ``lat``/``lng``, optionally
+    within ``radius_km`` and limited to the ``k`` nearest.
+    """
+    params, error = parse_nearby()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Accommodation)
+    if error:
+        return error
+
+    items = nearby_items(Accommodation, nearby(Accommodation, **params), fields)
+    return make_response(jsonify({"items": items, "total": len(items)}), 200)
+
+
+@accommodations.route("/available", methods=["GET"])
+def get_available_accommodations():
+    """
+    Endpoint to list accommodations free for the whole ``check_in``-``check_out``
+    stay, filtered by ``roomType``, ``min_price``, ``max_price`` and ``bedrooms``
+    (minimum). Overlapping bookings are excluded by the same query through the
+    bookings GiST index.
+    """
+    stay, error = _parse_stay(request.args)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    page = request.args.get("page", 1, type=int)
+    per_page = min(
+        request.args.get("per_page", 10, type=int), current_app.config["MAX_PER_PAGE"]
+    )
+    fields, error = parse_fields(Accommodation)
+    if error:
+        return error
+
+    booked = (
+        Booking.query.with_entities(Booking.id)
+        .filter(
+            Booking.accommodation_id == Accommodation.id,
+            Booking.status != "cancelled",
+            Booking.period.overlaps(stay),
+        )
+        .exists()
+    )
+    query = Accommodation.query.filter(
+        ~booked,
+        or_(
+            Accommodation.status.is_(None),
+            Accommodation.status.notin_(UNBOOKABLE_STATUSES),
+        ),
+    )
+    room_type = request.args.get("roomType", type=str)
+    if room_type:
+        existing_room_type = reference_cache.by_name(RoomType, room_type)
+        if not existing_room_type:
+            return make_response(jsonify({"error": "Invalid room type"}), 400)
+        query = query.filter(Accommodation.room_type_id == existing_room_type.id)
+    for name, convert, condition in (
+        ("min_price", float, lambda value: Accommodation.price >= value),
+        ("max_price", float, lambda value: Accommodation.price <= value),
+        ("bedrooms", int, lambda value: Accommodation.bedrooms >= value),
+    ):
+        value, error = number_arg(name, convert)
+        if error:
+            return make_response(jsonify({"error": error}), 400)
+        if value is not None:
+            query = query.filter(condition(value))
+
+    pagination = (
+        load_fields(query, Accommodation, fields)
+        .order_by(Accommodation.price, Accommodation.id)
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
+    return make_response(
+        jsonify(
+            {
+                "items": [a.to_dict(only=fields or ()) for a in pagination.items],
+                "total": pagination.total,
+                "page": pagination.page,
+                "pages": pagination.pages,
+                "per_page": pagination.per_page,
+                "has_next": pagination.has_next,
+                "has_prev": pagination.has_prev,
+            }
+        ),
+        200,
+    )
+
+
+@accommodations.route("/<int:accommodation_id>/book", methods=["POST"])
+@jwt_required()
+def book_accommodation(accommodation_id):
+    """
+    Endpoint to book an accommodation for a ``check_in``-``check_out`` stay.
+    Overlapping stays are rejected by the database, so concurrent attempts at
+    the same dates produce exactly one booking and 409 for the rest.
+    """
+    stay, error = _parse_stay(request.get_json(silent=True) or {})
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    accommodation = Accommodation.query.get(accommodation_id)
+    if not accommodation:
+        return make_response(jsonify({"error": "Accommodation not found"}), 404)
+    if accommodation.status in UNBOOKABLE_STATUSES:
+        return make_response(jsonify({"error": "Accommodation cannot be booked"}), 409)
+
+    booking = Booking(
+        accommodation_id=accommodation.id,
+        user_id=get_jwt_identity(),
+        period=stay,
+    )
+    db.session.add(booking)
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        # Only an overlap is a conflict. Anything else, e.g. a token of a
+        # deleted user, is a bad request.
+        if getattr(e.orig, "pgcode", None) != EXCLUSION_VIOLATION:
+            return make_response(jsonify({"error": "Booking is invalid"}), 400)
+        return make_response(
+            jsonify({"error": "Accommodation is already booked for these dates"}),
+            409,
+        )
+    return make_response(
+        jsonify({"message": "Booking confirmed", "booking": booking.to_dict()}), 201
+    )
+
+
+@accommodations.route("/bookings/<int:booking_id>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_booking(booking_id):
+    """Endpoint to cancel one of the current user's bookings, freeing its dates."""
+    booking = Booking.query.get(booking_id)
+    if not booking or booking.user_id != get_jwt_identity():
+        return make_response(jsonify({"error": "Booking not found"}), 404)
+    booking.status = "cancelled"
+    db.session.commit()
+    return make_response(
+        jsonify({"message": "Booking cancelled", "booking": booking.to_dict()}), 200
+    )
+
+
+@accommodations.route("/batch", methods=["POST"])
+def get_accommodations_batch():
+    """
+    Endpoint to retrieve several accommodations and their media in one call,
+    returned in the order the ids were requested.
+    """
+    ids, error = parse_batch_ids()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Accommodation)
+    if error:
+        return error
+
+    items, missing = batch_get(Accommodation, "accommodation", ids, fields)
+    return make_response(jsonify({"items": items, "missing": missing}), 200)
 
 
 @accommodations.route("/patch/<int:accommodation_id>", methods=["PATCH"])
@@ -157,13 +384,19 @@ def patch_accommodation(accommodation_id):
         return make_response(jsonify({"error": "Accommodation not found"}), 404)
     if data.get("status") not in ["available", "unavailable", "booked", "maintenance"]:
         return make_response(jsonify({"error": "Invalid status value"}), 400)
+    (latitude, longitude), error = parse_coordinates(
+        data, (accommodation.latitude, accommodation.longitude)
+    )
+    if error:
+        return make_response(jsonify({"error": error}), 400)
     room_type = None
     if data.get("roomType"):
-        room_type = RoomType.query.filter_by(name=data.get("roomType")).first()
+        room_type = reference_cache.by_name(RoomType, data.get("roomType"))
         if not room_type:
             return make_response(jsonify({"error": "Invalid room type"}), 400)
     accommodation.name = data.get("name", accommodation.name)
     accommodation.location = data.get("location", accommodation.location)
+    accommodation.latitude, accommodation.longitude = latitude, longitude
     accommodation.description = data.get("description", accommodation.description)
     accommodation.price = data.get("price", accommodation.price)
     accommodation.status = data.get("status", accommodation.status)
@@ -1,4 +1,13 @@
 from config import app, db
+from availability import init_availability
+from cache import reference_cache
+from importer import init_import_cli
+from inventory import init_inventory
+from media import init_media_ingest
+from passwords import init_passwords
+from rankings import init_rankings
+from revocation import init_revocation
+from synthetic import init_generate_cli
 from products.routes import products
 from auth.routes import auth
 from foods.routes import foods
@@ -19,6 +28,15 @@ with app.app_context():
     # db.session.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
     db.session.commit()
     db.create_all()
+    reference_cache.load()
+init_rankings(app)
+init_import_cli(app)
+init_generate_cli(app)
+init_inventory(app)
+init_media_ingest(app)
+init_revocation(app)
+init_passwords(app)
+init_availability(app)
 
 
 @app.route("/")
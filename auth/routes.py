@@ -1,21 +1,32 @@
 from sqlalchemy.exc import IntegrityError
 
-from flask import Blueprint, jsonify, make_response, request
+from flask import Blueprint, current_app, jsonify, make_response, request
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
-    get_jwt_identity,
     jwt_required,
     get_jwt,
 )
-from sqlalchemy import or_
 import uuid
-from config import db, blacklist
+from availability import taken_names
+from cache import reference_cache
+from config import db
+from identity import current_identity, invalidate_user
 from models import User, UserType
+from passwords import PasswordHasherBusy, login_retry_after, password_hasher
+from revocation import revocation_store
 
 auth = Blueprint("auth", __name__, url_prefix="/api/v1/auth")
 
 
+def _busy():
+    response = make_response(
+        jsonify({"error": "Too many logins in progress, try again shortly"}), 503
+    )
+    response.headers["Retry-After"] = "1"
+    return response
+
+
 @auth.route("/signup", methods=["POST"])
 def signup():
     """
@@ -41,7 +52,7 @@ def signup():
             400,
         )
     try:
-        user_type = UserType.query.filter_by(name=data["userType"]).first()
+        user_type = reference_cache.by_name(UserType, data["userType"])
         if not user_type:
             return make_response(
                 jsonify(
@@ -52,11 +63,9 @@ def signup():
                 ),
                 400,
             )
-        existing_user = User.query.filter(
-            or_(User.username == data["username"], User.email == data["email"])
-        ).first()
-
-        if existing_user:
+        if taken_names.taken("username", [data["username"]]) or taken_names.taken(
+            "email", [data["email"]]
+        ):
             return make_response(
                 jsonify(
                     {
@@ -66,6 +75,8 @@ def signup():
                 ),
                 400,
             )
+        # Hashing takes a while: give the connection back to the pool meanwhile.
+        db.session.rollback()
         new_user = User(
             id=str(uuid.uuid4())[:9],
             first_name=data["firstName"],
@@ -79,6 +90,7 @@ def signup():
 
         db.session.add(new_user)
         db.session.commit()
+        taken_names.add(data["username"], data["email"])
         return make_response(
             jsonify(
                 {
@@ -92,6 +104,9 @@ def signup():
         db.session.rollback()
         error_message = str(e.orig)
         return make_response(jsonify({"msg": f" {error_message}"}), 400)
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return _busy()
 
     except Exception as e:
         db.session.rollback()
@@ -119,12 +134,31 @@ def signin():
             ),
             400,
         )
+    invalid_fields = [k for k in required_fields if not isinstance(data[k], str)]
+    if invalid_fields:
+        return make_response(
+            jsonify({"error": "Must be strings", "invalid_fields": invalid_fields}),
+            400,
+        )
+    retry_after = login_retry_after(data["username"], request.remote_addr)
+    if retry_after:
+        response = make_response(jsonify({"error": "Too many login attempts"}), 429)
+        response.headers["Retry-After"] = str(retry_after)
+        return response
     try:
         user = User.query.filter_by(username=data["username"]).first()
-        if not user or not user.check_password(data["password"]):
+        pwhash = user.password if user else None
+        # Hashing takes a while: give the connection back to the pool meanwhile.
+        db.session.rollback()
+        if not user or not password_hasher.verify(pwhash, data["password"]):
             return make_response(
                 jsonify({"error": "Invalid username or password"}), 401
             )
+        if password_hasher.needs_rehash(pwhash):
+            # Only now is the plain password at hand to hash with new parameters.
+            user.set_password(data["password"])
+            db.session.commit()
+            invalidate_user(user.id)
 
         access_token = create_access_token(
             identity=user.id,
@@ -144,11 +178,13 @@ def signin():
             ),
             200,
         )
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return _busy()
     except Exception as e:
         return make_response(jsonify({"msg": str(e)}), 400)
 
 
-# Assume you have a set to store blacklisted tokens
 @auth.route("/check", methods=["POST"])
 def check_username_email():
     """
@@ -162,8 +198,7 @@ def check_username_email():
             return make_response(
                 jsonify({"error": "Username is required to check availability"}), 400
             )
-        user = User.query.filter_by(username=username).first()
-        if user:
+        if taken_names.taken("username", [username]):
             return make_response(
                 jsonify({"available": False, "message": "Username already taken"}), 200
             )
@@ -174,8 +209,7 @@ def check_username_email():
         email = data.get("email")
         if not email:
             return make_response(jsonify({"error": "Email is required"}), 400)
-        user = User.query.filter_by(email=email).first()
-        if user:
+        if taken_names.taken("email", [email]):
             return make_response(
                 jsonify({"available": False, "message": "Email already taken"}), 200
             )
@@ -184,20 +218,52 @@ def check_username_email():
         )
 
 
+@auth.route("/check/batch", methods=["POST"])
+def check_batch():
+    """
+    Endpoint to check several usernames and emails at once, e.g. suggestions.
+    Takes ``usernames`` and ``emails`` lists and maps each name to whether it
+    is available.
+    """
+    data = request.get_json() or {}
+    candidates = {
+        "usernames": data.get("usernames", []),
+        "emails": data.get("emails", []),
+    }
+    if not all(
+        isinstance(names, list)
+        and all(isinstance(name, str) and name for name in names)
+        for names in candidates.values()
+    ):
+        return make_response(
+            jsonify({"error": "usernames and emails must be lists of names"}), 400
+        )
+    limit = current_app.config["AVAILABILITY_BATCH_MAX"]
+    if sum(map(len, candidates.values())) > limit:
+        return make_response(
+            jsonify({"error": f"At most {limit} names can be checked at once"}), 400
+        )
+    result = {}
+    for key, field in (("usernames", "username"), ("emails", "email")):
+        taken = taken_names.taken(field, candidates[key])
+        result[key] = {name: name not in taken for name in candidates[key]}
+    return make_response(jsonify(result), 200)
+
+
 @auth.route("/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh():
     """Endpoint to refresh the JWT token."""
-    current_user = get_jwt_identity()
-    user = User.query.get(current_user)
+    identity = current_identity()
+    user = identity.user
     if not user:
         return make_response(jsonify({"error": "User not found"}), 404)
 
     access_token = create_access_token(
-        identity=user.id,
+        identity=identity.id,
         additional_claims={
-            "email": user.email,
-            "role": user.user_type,
+            "email": user["email"],
+            "role": user["user_type"],
         },
     )
     return make_response(jsonify({"access_token": access_token}), 200)
@@ -206,19 +272,18 @@ def refresh():
 @auth.route("/currentuser", methods=["GET"])
 @jwt_required()
 def get_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_identity().user
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    return jsonify(user.to_dict()), 200
+    return jsonify(user), 200
 
 
 @auth.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
-    """Endpoint to handle user logout. Blacklist the JWT token."""
-    jti = get_jwt()["jti"]
-    blacklist.add(jti)
+    """Endpoint to handle user logout. Revokes the JWT token on every worker."""
+    token = get_jwt()
+    revocation_store.revoke(token["jti"], token["type"], token["sub"], token["exp"])
     return make_response(jsonify({"message": "Logged out successfully"}), 200)
@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from cache import BloomFilter
+from config import db
+from models import User
+
+users = User.__table__
+
+# Users created this long before the last sync are read again, so a signup
+# that committed late is not missed.
+SYNC_MARGIN = timedelta(seconds=30)
+
+
+def _key(field, value):
+    return f"{field}:{value.lower()}"
+
+
+class TakenNames:
+    """
+    Bloom filter of the lowercased usernames and emails of ``app_users``, so
+    checking a name nobody uses costs no query. A name the filter has never
+    seen is available; the rare filter hit is settled by the table. Each
+    worker adds its own signups at once, reads those of the others at most
+    once per ``sync_interval`` seconds, and rebuilds the filter every
+    ``rebuild_interval`` seconds or when it fills up, forgetting deleted users.
+    """
+
+    def __init__(
+        self,
+        capacity=200000,
+        error_rate=0.01,
+        sync_interval=1.0,
+        rebuild_interval=3600.0,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_to = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    def add(self, username, email):
+        """Record a new user's names before other workers sync them."""
+        self._sync()
+        # Under the lock, so a rebuild cannot swap in a filter without them.
+        with self._lock:
+            self._bloom.add(_key("username", username))
+            self._bloom.add(_key("email", email))
+
+    def taken(self, field, values):
+        """
+        Which of values are in use.
+        :param field: "username" or "email".
+        :param values: The candidate names, compared exactly like signup does.
+        :return: The set of values already taken.
+        """
+        self._sync()
+        maybe = {value for value in values if _key(field, value) in self._bloom}
+        if not maybe:
+            return set()
+        column = users.c[field]
+        return set(db.session.scalars(select(column).where(column.in_(maybe))))
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._bloom is not None and now - self._checked_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._bloom is not None and now - self._checked_at < self.sync_interval:
+                return
+            if (
+                self._bloom is None
+                or self._bloom.full
+                or now - self._built_at >= self.rebuild_interval
+            ):
+                self.rebuild()
+            else:
+                self._read_new()
+            self._checked_at = time.monotonic()
+
+    def _add_rows(self, bloom, rows):
+        for username, email in rows:
+            bloom.add(_key("username", username))
+            bloom.add(_key("email", email))
+
+    def _read_new(self):
+        with db.engine.connect() as conn:
+            db_now = conn.execute(select(func.now())).scalar()
+            rows = conn.execute(
+                select(users.c.username, users.c.email).where(
+                    users.c.created_at >= self._synced_to - SYNC_MARGIN
+                )
+            )
+            self._add_rows(self._bloom, rows)
+        self._synced_to = db_now
+
+    def rebuild(self):
+        """
+        Load every username and email into a new filter, sized for twice as
+        many users.
+        """
+        with db.engine.connect() as conn:
+            db_now = conn.execute(select(func.now())).scalar()
+            count = conn.execute(select(func.count()).select_from(users)).scalar()
+            # Two names per user.
+            bloom = BloomFilter(max(self.capacity, 4 * count), self.error_rate)
+            rows = conn.execution_options(yield_per=10000).execute(
+                select(users.c.username, users.c.email)
+            )
+            self._add_rows(bloom, rows)
+        self._bloom, self._synced_to = bloom, db_now
+        self._built_at = time.monotonic()
+
+
+taken_names = TakenNames()
+
+
+def init_availability(app):
+    """Configure the username and email filter of /auth/check."""
+    taken_names.capacity = app.config["AVAILABILITY_BLOOM_CAPACITY"]
+    taken_names.error_rate = app.config["AVAILABILITY_BLOOM_ERROR_RATE"]
+    taken_names.sync_interval = app.config["AVAILABILITY_SYNC_INTERVAL"]
+    taken_names.rebuild_interval = app.config["AVAILABILITY_REBUILD_INTERVAL"]
@@ -0,0 +1,115 @@
+"""
+Username and email availability checks through the filter and the database.
+
+Needs the configured database with a user type seeded. Inserts --users
+throwaway users, then checks --checks names that are free and as many that
+are taken, one at a time with the lookup /auth/check used to run and with
+the availability filter, and through the filter in batches of --batch
+names like /auth/check/batch. Also reports the filter's size and its
+measured false positive rate. The users are deleted afterwards.
+
+    python -m benchmarks.availability --users 200000 --checks 2000
+"""
+
+import argparse
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import app
+from availability import taken_names
+from config import db
+from models import User, UserType
+
+# Backdated, or every sync would read them again as recent signups.
+GENERATE = """
+    INSERT INTO app_users (id, first_name, last_name, username, email, password,
+        user_type_id, created_at)
+    SELECT :prefix || i, 'Bench', 'User', :prefix || 'user' || i,
+        :prefix || 'user' || i || '@example.com', 'x', :user_type_id,
+        now() - interval '1 day'
+    FROM generate_series(1, :users) i
+    """
+CLEANUP = "DELETE FROM app_users WHERE id LIKE :prefix || '%'"
+
+
+def timed(fn, names):
+    start = time.perf_counter()
+    for name in names:
+        fn(name)
+    return (time.perf_counter() - start) / len(names) * 1e6
+
+
+def database(name):
+    # What /auth/check ran for every request before the filter.
+    found = User.query.filter_by(username=name).first()
+    db.session.rollback()
+    return found
+
+
+def filtered(name):
+    taken = taken_names.taken("username", [name])
+    db.session.rollback()
+    return taken
+
+
+def batched(names, size):
+    # What /auth/check/batch runs, one filter pass and query per batch.
+    start = time.perf_counter()
+    for i in range(0, len(names), size):
+        taken_names.taken("username", names[i : i + size])
+        db.session.rollback()
+    return (time.perf_counter() - start) / len(names) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--checks", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_type = UserType.query.first()
+        if user_type is None:
+            raise SystemExit("Seed at least one user type first")
+        prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+        params = {"prefix": prefix, "users": args.users, "user_type_id": user_type.id}
+        try:
+            db.session.execute(text(GENERATE), params)
+            db.session.commit()
+            db.session.execute(text("ANALYZE app_users"))
+            db.session.commit()
+
+            start = time.perf_counter()
+            taken_names.rebuild()
+            rebuilt = time.perf_counter() - start
+            bloom = taken_names._bloom
+            print(
+                f"filter of {bloom.count} names built in {rebuilt:.2f}s, "
+                f"{bloom.size / 8 / 2**20:.1f} MiB, {bloom.hashes} hashes"
+            )
+
+            step = max(1, args.users // args.checks)
+            taken = [f"{prefix}user{i}" for i in range(1, args.users + 1, step)]
+            free = [f"{prefix}free{i}" for i in range(len(taken))]
+            misses = sum(f"username:{name.lower()}" in bloom for name in free)
+            print(f"false positives {misses}/{len(free)} = {misses / len(free):.2%}\n")
+
+            print(f"{'per name':<20} {'database':>10} {'filter':>10} {'batch':>10}")
+            for label, names in (("free", free), ("taken", taken)):
+                print(
+                    f"{label:<20} {timed(database, names):>8.1f}us "
+                    f"{timed(filtered, names):>8.1f}us "
+                    f"{batched(names, args.batch):>8.1f}us"
+                )
+        finally:
+            db.session.rollback()
+            db.session.execute(text(CLEANUP), params)
+            db.session.commit()
+            taken_names.rebuild()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Bytes on the wire and CPU per request for identity, gzip and zstd responses.
+
+Serves a synthetic product list page through the compression middleware and
+reports the average body size and process CPU time of each encoding.
+
+    python -m benchmarks.compression --rows 10 100 1000 --requests 200
+"""
+
+import argparse
+import json
+import random
+import time
+
+from flask import Flask, jsonify
+
+from compression import init_compression
+
+
+def make_app(rows):
+    app = Flask(__name__)
+    app.json.compact = False
+    app.config.update(
+        COMPRESS_MIN_SIZE=1024, COMPRESS_ZSTD_LEVEL=3, COMPRESS_GZIP_LEVEL=6
+    )
+    init_compression(app)
+
+    rng = random.Random(42)
+    words = ["wireless", "premium", "cotton", "steel", "classic", "smart", "organic"]
+    items = [
+        {
+            "id": i,
+            "name": " ".join(rng.choices(words, k=3)).title(),
+            "description": " ".join(rng.choices(words, k=30)),
+            "price": round(rng.uniform(1, 500), 2),
+            "category": rng.choice(["electronics", "fashion", "books", "toys"]),
+            "business_name": f"Business {rng.randint(1, 40)}",
+            "stock": rng.randint(0, 500),
+            "rating": rng.randint(0, 5),
+            "image_url": f"https://example.blob.core.windows.net/media/products/{i}/0.jpg",
+            "created_at": "2025-05-26 19:02:43",
+            "updated_at": "2025-05-26 19:02:43",
+        }
+        for i in range(rows)
+    ]
+
+    @app.route("/page")
+    def page():
+        return jsonify({"items": items, "total": rows})
+
+    @app.route("/stream")
+    def stream():
+        def generate():
+            for item in items:
+                yield json.dumps(item) + "\n"
+
+        return app.response_class(generate(), mimetype="application/x-ndjson")
+
+    return app
+
+
+def run(app, path, encoding, requests):
+    client = app.test_client()
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    size = 0
+    start = time.process_time()
+    for _ in range(requests):
+        size += len(client.get(path, headers=headers).get_data())
+    cpu = time.process_time() - start
+    return size / requests, cpu / requests * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(
+        f"{'path':<8}{'rows':>6}  {'encoding':<9}{'bytes':>10}{'ratio':>8}{'cpu ms':>9}"
+    )
+    for rows in args.rows:
+        app = make_app(rows)
+        for path in ("/page", "/stream"):
+            baseline = None
+            for encoding in (None, "gzip", "zstd"):
+                size, cpu = run(app, path, encoding, args.requests)
+                baseline = baseline or size
+                print(
+                    f"{path:<8}{rows:>6}  {encoding or 'identity':<9}"
+                    f"{size:>10.0f}{baseline / size:>8.2f}{cpu:>9.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
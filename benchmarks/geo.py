@@ -0,0 +1,93 @@
+"""
+Build and query time of the in-process k-d tree against a brute-force scan.
+
+Generates synthetic points clustered around a handful of cities, builds the
+KDTree used by geo.nearby() when earthdistance is not installed, and times
+k-nearest and radius queries against a full numpy scan of the same points.
+
+    python -m benchmarks.geo --points 1000000 --queries 200 --k 10 --radius-km 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from geo import KDTree, chord_for_km, to_unit_vectors
+
+CITIES = [
+    (-1.2921, 36.8219),
+    (-4.0435, 39.6682),
+    (0.3476, 32.5825),
+    (-6.7924, 39.2083),
+    (6.5244, 3.3792),
+    (51.5072, -0.1276),
+]
+
+
+def make_points(count, seed):
+    rng = np.random.default_rng(seed)
+    centers = np.array(CITIES)[rng.integers(len(CITIES), size=count)]
+    offsets = rng.normal(scale=0.25, size=(count, 2))
+    latitudes = np.clip(centers[:, 0] + offsets[:, 0], -90, 90)
+    longitudes = (centers[:, 1] + offsets[:, 1] + 180) % 360 - 180
+    return to_unit_vectors(latitudes, longitudes)
+
+
+def brute_knn(points, point, k):
+    d = np.sqrt(((points - point) ** 2).sum(axis=1))
+    nearest = np.argpartition(d, k)[:k]
+    return nearest[np.argsort(d[nearest])]
+
+
+def brute_radius(points, point, radius):
+    d = np.sqrt(((points - point) ** 2).sum(axis=1))
+    return np.flatnonzero(d <= radius)
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    points = make_points(args.points, args.seed)
+    queries = make_points(args.queries, args.seed + 1)
+    ids = np.arange(args.points)
+
+    start = time.perf_counter()
+    tree = KDTree(points, ids)
+    print(f"build {args.points} points: {time.perf_counter() - start:.2f}s")
+
+    radius = chord_for_km(args.radius_km)
+    tree_knn, tree_knn_ms = timed(lambda q: tree.query_knn(q, args.k)[0], queries)
+    scan_knn, scan_knn_ms = timed(lambda q: brute_knn(points, q, args.k), queries)
+    tree_rad, tree_rad_ms = timed(lambda q: tree.query_radius(q, radius)[0], queries)
+    scan_rad, scan_rad_ms = timed(lambda q: brute_radius(points, q, radius), queries)
+
+    knn_ok = all(np.array_equal(a, b) for a, b in zip(tree_knn, scan_knn))
+    rad_ok = all(set(a) == set(b) for a, b in zip(tree_rad, scan_rad))
+    hits = np.mean([len(r) for r in tree_rad])
+
+    print(f"{'query':<22}{'kd-tree ms':>12}{'scan ms':>10}{'speedup':>9}{'match':>7}")
+    print(
+        f"{f'k={args.k} nearest':<22}{tree_knn_ms:>12.3f}{scan_knn_ms:>10.3f}"
+        f"{scan_knn_ms / tree_knn_ms:>9.1f}{str(knn_ok):>7}"
+    )
+    print(
+        f"{f'{args.radius_km:g} km ({hits:.0f} hits)':<22}{tree_rad_ms:>12.3f}"
+        f"{scan_rad_ms:>10.3f}{scan_rad_ms / tree_rad_ms:>9.1f}{str(rad_ok):>7}"
+    )
+
+
+if __name__ == "__main__":
+    main()
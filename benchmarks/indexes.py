@@ -0,0 +1,313 @@
+"""
+Plans and latency of the hot lookups with and without the lookup indexes.
+
+Needs the configured database with its property, room and media types
+seeded. Generates a scaled throwaway catalog (businesses, categories,
+products, foods, properties, accommodations and product media), then runs
+the lookups the handlers make under EXPLAIN ANALYZE and times the read
+endpoints, first with the indexes of the pack dropped and then with them
+rebuilt from models.py. Everything the benchmark wrote is deleted afterwards
+and the indexes are always rebuilt.
+
+    python -m benchmarks.indexes --businesses 2000 --rows 200000 --repeat 50
+"""
+
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+from sqlalchemy import func, select, text
+
+from app import app
+from config import db
+from models import (
+    Accommodation,
+    Business,
+    Category,
+    EntityMedia,
+    EntityMediaType,
+    Food,
+    Product,
+    Property,
+    PropertyType,
+    RoomType,
+)
+
+# The indexes of migration 6c8e3b1f4d92, rebuilt from their models.
+PACK = {
+    "ix_m_business_name": Business,
+    "ix_m_business_user_id": Business,
+    "ix_categories_name": Category,
+    "ix_products_category_id": Product,
+    "ix_food_business_id": Food,
+    "ix_food_category_id": Food,
+    "ix_food_available_category": Food,
+    "ix_property_business_id": Property,
+    "ix_accomodation_business_id": Accommodation,
+    "ix_entity_media_entity": EntityMedia,
+}
+
+CATEGORY_IDS = """
+    (SELECT array_agg(id ORDER BY id) FROM categories
+     WHERE name LIKE :prefix || '%')
+    """
+GENERATE = [
+    """
+    INSERT INTO m_business (id, name, location)
+    SELECT :prefix || i, :prefix || 'shop ' || i, 'Nairobi'
+    FROM generate_series(1, :businesses) i
+    """,
+    """
+    INSERT INTO categories (name, description)
+    SELECT :prefix || 'category ' || i, 'generated'
+    FROM generate_series(1, :categories) i
+    """,
+    f"""
+    INSERT INTO products (business_id, name, description, price, category_id,
+        stock, rating)
+    SELECT :prefix || (1 + i % :businesses), 'product ' || i, 'generated',
+        round((random() * 500)::numeric, 2), c.ids[1 + i % :categories],
+        (random() * 100)::int, (random() * 5)::int
+    FROM generate_series(1, :rows) i, (SELECT {CATEGORY_IDS} AS ids) c
+    """,
+    f"""
+    INSERT INTO food (business_id, name, description, price, category_id,
+        is_available)
+    SELECT :prefix || (1 + i % :businesses), 'food ' || i, 'generated',
+        round((random() * 50)::numeric, 2), c.ids[1 + i % :categories],
+        random() < :available_rate
+    FROM generate_series(1, :rows) i, (SELECT {CATEGORY_IDS} AS ids) c
+    """,
+    """
+    INSERT INTO property (business_id, property_type_id, name, bedrooms, price)
+    SELECT :prefix || (1 + i % :businesses), :property_type_id, 'property ' || i,
+        1 + i % 5, round((random() * 1000000)::numeric, 2)
+    FROM generate_series(1, :rows) i
+    """,
+    """
+    INSERT INTO accomodation (business_id, room_type_id, name, bedrooms, price)
+    SELECT :prefix || (1 + i % :businesses), :room_type_id, 'room ' || i,
+        1 + i % 3, round((random() * 300)::numeric, 2)
+    FROM generate_series(1, :rows) i
+    """,
+    """
+    INSERT INTO entity_media (entity_type_id, entity_id, url, storage_type, status)
+    SELECT :media_type_id, p.id, 'memory://media/' || p.id || '/' || n, 3, 'ready'
+    FROM products p, generate_series(1, 2) n
+    WHERE p.business_id LIKE :prefix || '%'
+    """,
+]
+CLEANUP = [
+    """
+    DELETE FROM entity_media WHERE entity_type_id = :media_type_id
+        AND entity_id IN (SELECT id FROM products WHERE business_id LIKE :prefix || '%')
+    """,
+    "DELETE FROM products WHERE business_id LIKE :prefix || '%'",
+    "DELETE FROM food WHERE business_id LIKE :prefix || '%'",
+    "DELETE FROM property WHERE business_id LIKE :prefix || '%'",
+    "DELETE FROM accomodation WHERE business_id LIKE :prefix || '%'",
+    "DELETE FROM m_business WHERE id LIKE :prefix || '%'",
+    "DELETE FROM categories WHERE name LIKE :prefix || '%'",
+]
+TABLES = (
+    "m_business",
+    "categories",
+    "products",
+    "food",
+    "property",
+    "accomodation",
+    "entity_media",
+)
+
+
+def reference_ids():
+    ids = {
+        "property_type_id": db.session.scalar(select(func.min(PropertyType.id))),
+        "room_type_id": db.session.scalar(select(func.min(RoomType.id))),
+        "media_type_id": db.session.scalar(
+            select(EntityMediaType.id).filter_by(name="product")
+        ),
+    }
+    missing = [name for name, id in ids.items() if id is None]
+    if missing:
+        raise SystemExit(f"Seed the reference data first, missing {missing}")
+    return ids
+
+
+def generate(params, seed):
+    start = time.perf_counter()
+    db.session.execute(text("SELECT setseed(:seed)"), {"seed": seed / 2**31})
+    for statement in GENERATE:
+        db.session.execute(text(statement), params)
+    db.session.commit()
+    for table in TABLES:
+        db.session.execute(text(f"ANALYZE {table}"))
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def lookups(sample):
+    """The queries the handlers run, labelled by the handler."""
+    return {
+        "create_*: business by name": select(Business).filter_by(
+            name=sample["business_name"]
+        ),
+        "business profile: by owner": select(Business).filter_by(
+            user_id="no-such-user"
+        ),
+        "category by name": select(Category).filter_by(name=sample["category_name"]),
+        "products/getall?category": select(
+            func.max(Product.updated_at), func.count()
+        ).filter_by(category_id=sample["category_id"]),
+        "foods/getall?category": select(
+            func.max(Food.updated_at), func.count()
+        ).filter_by(category_id=sample["category_id"]),
+        "foods/getall?available": select(func.max(Food.updated_at), func.count())
+        .filter_by(category_id=sample["category_id"])
+        .filter_by(is_available=True),
+        "export: foods of business": select(Food).filter_by(
+            business_id=sample["business_id"]
+        ),
+        "export: properties of business": select(Property).filter_by(
+            business_id=sample["business_id"]
+        ),
+        "export: rooms of business": select(Accommodation).filter_by(
+            business_id=sample["business_id"]
+        ),
+        "getone: media of product": select(EntityMedia).filter_by(
+            entity_id=sample["product_id"],
+            entity_type_id=sample["media_type_id"],
+            status="ready",
+        ),
+    }
+
+
+def endpoints(sample):
+    category = sample["category_name"]
+    return {
+        "GET products/getall?category": f"/api/v1/products/getall?category={category}",
+        "GET products/getone": f"/api/v1/products/getone/{sample['product_id']}",
+        "GET foods/getall?category": f"/api/v1/foods/getall?category={category}",
+        "GET foods/getall?available": (
+            f"/api/v1/foods/getall?category={category}&available=true"
+        ),
+    }
+
+
+def _scans(node):
+    # Leaf-most access paths of a JSON plan, e.g. "Index Scan ix_food_category_id".
+    children = node.get("Plans", [])
+    if not children or node["Node Type"].endswith("Scan"):
+        yield " ".join(filter(None, [node["Node Type"], node.get("Index Name")]))
+    for child in children:
+        yield from _scans(child)
+
+
+def explain(statement):
+    sql = statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    plan = db.session.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    db.session.rollback()
+    return ", ".join(dict.fromkeys(_scans(plan[0]["Plan"]))), plan[0]["Execution Time"]
+
+
+def latency(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise SystemExit(f"{url} answered {response.status_code}")
+    return statistics.median(timings)
+
+
+def measure(sample, repeat):
+    plans = {label: explain(query) for label, query in lookups(sample).items()}
+    client = app.test_client()
+    timings = {
+        label: latency(client, url, repeat) for label, url in endpoints(sample).items()
+    }
+    return plans, timings
+
+
+def drop_pack():
+    for name in PACK:
+        db.session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    db.session.commit()
+
+
+def build_pack():
+    with db.engine.begin() as conn:
+        for name, model in PACK.items():
+            index = next(i for i in model.__table__.indexes if i.name == name)
+            index.create(conn, checkfirst=True)
+    for table in TABLES:
+        db.session.execute(text(f"ANALYZE {table}"))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--businesses", type=int, default=2000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--available-rate", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+        params = {
+            "prefix": prefix,
+            "businesses": args.businesses,
+            "categories": args.categories,
+            "rows": args.rows,
+            "available_rate": args.available_rate,
+            **reference_ids(),
+        }
+        try:
+            elapsed = generate(params, args.seed)
+            print(
+                f"generated {args.rows} rows per catalog table for "
+                f"{args.businesses} businesses in {elapsed:.1f}s"
+            )
+            business = Business.query.filter_by(id=f"{prefix}1").one()
+            category = Category.query.filter_by(name=f"{prefix}category 1").one()
+            product = Product.query.filter_by(business_id=business.id).first()
+            sample = {
+                "business_id": business.id,
+                "business_name": business.name,
+                "category_id": category.id,
+                "category_name": category.name,
+                "product_id": product.id,
+                "media_type_id": params["media_type_id"],
+            }
+            db.session.rollback()
+
+            drop_pack()
+            before = measure(sample, args.repeat)
+            build_pack()
+            after = measure(sample, args.repeat)
+        finally:
+            db.session.rollback()
+            build_pack()
+            for statement in CLEANUP:
+                db.session.execute(text(statement), params)
+            db.session.commit()
+
+    print(f"\n{'lookup':<32} {'without':>10} {'with':>10}  plan with the indexes")
+    for label, (plan, ms) in after[0].items():
+        print(f"{label:<32} {before[0][label][1]:>8.2f}ms {ms:>8.2f}ms  {plan}")
+        print(f"{'':<56}without: {before[0][label][0]}")
+    print(f"\n{'endpoint (median)':<32} {'without':>10} {'with':>10}")
+    for label, ms in after[1].items():
+        print(f"{label:<32} {before[1][label]:>8.2f}ms {ms:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
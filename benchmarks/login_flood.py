@@ -0,0 +1,165 @@
+"""
+Catalog latency and login outcomes while a login flood hits the same worker.
+
+Needs the configured database. Creates --accounts throwaway users, then for
+each scenario runs --attackers threads posting wrong passwords for those
+accounts to /auth/signin from rotating addresses, one member signing in
+correctly every two seconds, and one shopper reading the category list.
+Scenarios: no flood, hashing inline on the request threads with no cap (how
+signin used to work), and the configured PasswordHasher pool. A last
+scenario floods from a single address to show the rate limit. The users are
+deleted afterwards.
+
+    python -m benchmarks.login_flood --attackers 32 --accounts 500 --seconds 10
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+
+from app import app
+from config import db
+from models import User, UserType
+import passwords
+from passwords import password_hasher
+
+SIGNIN = "/api/v1/auth/signin"
+CATALOG = "/api/v1/categories/categories"
+
+
+def run(seconds, attackers, accounts, single_address=False):
+    member, targets = accounts[0], accounts[1:]
+    stop = threading.Event()
+    outcomes = Counter()
+    member_outcomes = Counter()
+    catalog_ms = []
+    lock = threading.Lock()
+
+    def attacker(n):
+        client = app.test_client()
+        i = 0
+        while not stop.is_set():
+            i += 1
+            address = (
+                "10.9.9.9" if single_address else f"10.{n}.{i // 256 % 256}.{i % 256}"
+            )
+            response = client.post(
+                SIGNIN,
+                json={"username": targets[(n + i) % len(targets)], "password": "x"},
+                environ_base={"REMOTE_ADDR": address},
+            )
+            with lock:
+                outcomes[response.status_code] += 1
+
+    def member_login():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.post(
+                SIGNIN,
+                json={"username": member, "password": "bench-password"},
+                environ_base={"REMOTE_ADDR": "192.0.2.1"},
+            )
+            with lock:
+                member_outcomes[response.status_code] += 1
+            stop.wait(max(0, 2 - (time.perf_counter() - start)))
+
+    def shopper():
+        client = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get(CATALOG)
+            catalog_ms.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=attacker, args=(n,)) for n in range(attackers)]
+    threads += [threading.Thread(target=member_login), threading.Thread(target=shopper)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return outcomes, member_outcomes, catalog_ms
+
+
+def report(name, seconds, outcomes, member_outcomes, catalog_ms):
+    catalog_ms.sort()
+    p99 = catalog_ms[int(len(catalog_ms) * 0.99)] if catalog_ms else float("nan")
+    attempts = sum(outcomes.values())
+    print(
+        f"{name:<24} catalog p50 {statistics.median(catalog_ms):>7.1f}ms "
+        f"p99 {p99:>7.1f}ms  {attempts / seconds:>6.0f} logins/s "
+        f"{dict(sorted(outcomes.items()))}  member {dict(sorted(member_outcomes.items()))}"
+    )
+
+
+def reset_limits():
+    for limiter in (passwords.ip_login_limiter, passwords.user_login_limiter):
+        limiter._buckets.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attackers", type=int, default=32)
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    config = app.config
+    pooled = (
+        config["PASSWORD_HASH_METHOD"],
+        config["PASSWORD_HASH_WORKERS"],
+        config["PASSWORD_HASH_MAX_PENDING"],
+        config["PASSWORD_HASH_WAIT"],
+    )
+    with app.app_context():
+        user_type = UserType.query.first()
+        if user_type is None:
+            raise SystemExit("Seed at least one user type first")
+        prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+        # One hash for all accounts, hashing each would take a while.
+        pwhash = password_hasher.hash("bench-password")
+        accounts = [f"{prefix}{n}" for n in range(max(2, args.accounts))]
+        db.session.add_all(
+            User(
+                id=username,
+                first_name="Bench",
+                last_name="User",
+                username=username,
+                email=f"{username}@example.com",
+                password=pwhash,
+                user_type_id=user_type.id,
+            )
+            for username in accounts
+        )
+        db.session.commit()
+        db.session.close()
+
+    try:
+        scenarios = [
+            ("no flood", 0, pooled, False),
+            ("inline, no cap", args.attackers, (pooled[0], 0, 10**6, 60), False),
+            (f"pool of {pooled[1]}", args.attackers, pooled, False),
+            ("one address", args.attackers, pooled, True),
+        ]
+        for name, attackers, hasher, single in scenarios:
+            password_hasher.configure(*hasher)
+            reset_limits()
+            if hasher[1]:
+                # Start the pool before timing.
+                password_hasher.verify("", "")
+            results = run(args.seconds, attackers, accounts, single)
+            report(name, args.seconds, *results)
+    finally:
+        password_hasher.configure(*pooled)
+        password_hasher.shutdown()
+        with app.app_context():
+            User.query.filter(User.id.startswith(prefix)).delete()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
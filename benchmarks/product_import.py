@@ -0,0 +1,106 @@
+"""
+Rows per second of the bulk product import against one-by-one creates.
+
+Needs the configured database. Creates a throwaway business, imports
+synthetic CSV rows through importer.import_products (COPY into staging and a
+set-based merge), then inserts a smaller sample the way POST /products/create
+does: category and business lookups and a commit per row. Everything the
+benchmark wrote is deleted afterwards.
+
+    python -m benchmarks.product_import --rows 100000 --baseline-rows 2000
+"""
+
+import argparse
+import io
+import random
+import time
+import uuid
+
+from app import app
+from cache import reference_cache
+from config import db
+from importer import import_products, read_rows
+from models import Business, Category, Product
+
+
+def make_csv(rows, business, categories, seed):
+    rng = random.Random(seed)
+    lines = ["name,description,category,stock,price,businessName,rating"]
+    for i in range(rows):
+        lines.append(
+            f"Bench product {i},Synthetic row {i},{rng.choice(categories)},"
+            f"{rng.randint(0, 500)},{rng.uniform(1, 500):.2f},{business},"
+            f"{rng.randint(0, 5)}"
+        )
+    return ("\n".join(lines) + "\n").encode()
+
+
+def bulk(data):
+    start = time.perf_counter()
+    summary = import_products(read_rows(io.BytesIO(data), "csv"))
+    return summary, time.perf_counter() - start
+
+
+def one_by_one(rows, business, categories, seed):
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for i in range(rows):
+        category = reference_cache.by_name(Category, rng.choice(categories))
+        owner = Business.query.filter_by(name=business).first()
+        db.session.add(
+            Product(
+                name=f"Baseline product {i}",
+                description=f"Synthetic row {i}",
+                category_id=category.id,
+                stock=rng.randint(0, 500),
+                price=rng.uniform(1, 500),
+                rating=rng.randint(0, 5),
+                business_id=owner.id,
+            )
+        )
+        db.session.commit()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--baseline-rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        categories = [name for (name,) in db.session.query(Category.name) if name]
+        if not categories:
+            raise SystemExit("Seed at least one category first")
+        business = Business(id=str(uuid.uuid4())[:9], name=f"bench-{uuid.uuid4()}")
+        db.session.add(business)
+        db.session.commit()
+        try:
+            data = make_csv(args.rows, business.name, categories, args.seed)
+            summary, elapsed = bulk(data)
+            print(
+                f"bulk import   {summary['inserted']:>8} rows  {elapsed:>7.2f}s  "
+                f"{summary['rows'] / elapsed:>9.0f} rows/s"
+            )
+            summary, elapsed = bulk(data)
+            print(
+                f"bulk re-import{summary['updated']:>8} rows  {elapsed:>7.2f}s  "
+                f"{summary['rows'] / elapsed:>9.0f} rows/s"
+            )
+            elapsed = one_by_one(
+                args.baseline_rows, business.name, categories, args.seed
+            )
+            print(
+                f"one by one    {args.baseline_rows:>8} rows  {elapsed:>7.2f}s  "
+                f"{args.baseline_rows / elapsed:>9.0f} rows/s"
+            )
+        finally:
+            db.session.rollback()
+            Product.query.filter_by(business_id=business.id).delete()
+            db.session.delete(business)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Correctness and throughput of stock reservations under concurrent buyers.
+
+Needs the configured database. Creates a throwaway business, product and
+user, then lets --buyers threads check out one unit at a time until the
+stock runs out: each reserves with inventory.reserve_stock and commits, or
+releases with probability --release-rate. The same crowd then buys the way
+PATCH /products/patch/<id> changes stock, reading the product and writing
+stock - 1 back. Reports checkouts/s and whether units were oversold or lost.
+Everything the benchmark wrote is deleted afterwards.
+
+    python -m benchmarks.stock_reservation --buyers 200 --stock 2000
+"""
+
+import argparse
+import random
+import threading
+import time
+import uuid
+
+from app import app
+from config import db
+from inventory import (
+    ReservationError,
+    commit_reservation,
+    release_reservation,
+    reserve_stock,
+)
+from models import Business, Product, StockReservation, User, UserType
+
+
+def crowd(buyers, buy, think):
+    """
+    Run buy(user_id) in each buyer thread until it returns False, pausing up
+    to think seconds between checkouts.
+    """
+    barrier = threading.Barrier(len(buyers))
+    errors = []
+
+    def run(user_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                # Like a request, each checkout returns its connection.
+                while buy(user_id):
+                    db.session.close()
+                    time.sleep(random.uniform(0, think))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.close()
+
+    threads = [threading.Thread(target=run, args=(user_id,)) for user_id in buyers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return time.perf_counter() - start
+
+
+def reservations(product_id, buyers, release_rate, think, seed):
+    rng = random.Random(seed)
+    sold = [0]
+    lock = threading.Lock()
+
+    def buy(user_id):
+        try:
+            reservation = reserve_stock(product_id, 1, user_id, ttl=60)
+        except ReservationError:
+            return False
+        with lock:
+            release = rng.random() < release_rate
+        if release:
+            release_reservation(reservation.id, user_id)
+        else:
+            commit_reservation(reservation.id, user_id)
+            with lock:
+                sold[0] += 1
+        return True
+
+    return crowd(buyers, buy, think), sold[0]
+
+
+def read_modify_write(product_id, buyers, think):
+    sold = [0]
+    lock = threading.Lock()
+
+    def buy(user_id):
+        product = db.session.get(Product, product_id)
+        if product.stock < 1:
+            db.session.rollback()
+            return False
+        product.stock = product.stock - 1
+        db.session.commit()
+        with lock:
+            sold[0] += 1
+        return True
+
+    return crowd(buyers, buy, think), sold[0]
+
+
+def report(name, stock, sold, left, elapsed):
+    lost = stock - sold - left
+    print(
+        f"{name:<18} {sold:>6} sold  {left:>5} left  {elapsed:>7.2f}s  "
+        f"{sold / elapsed:>7.0f} checkouts/s  "
+        + ("consistent" if lost == 0 else f"{-lost} units oversold")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--release-rate", type=float, default=0.2)
+    parser.add_argument("--think-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_type = UserType.query.first()
+        if user_type is None:
+            raise SystemExit("Seed at least one user type first")
+        tag = uuid.uuid4().hex[:8]
+        user = User(
+            id=f"bench-{tag}",
+            first_name="Bench",
+            last_name="Buyer",
+            username=f"bench-{tag}",
+            email=f"bench-{tag}@example.com",
+            password="bench",
+            user_type_id=user_type.id,
+        )
+        business = Business(id=f"bench-{tag}", name=f"bench-{tag}")
+        db.session.add_all([user, business])
+        db.session.flush()
+        product = Product(
+            name=f"bench-{tag}",
+            price=1,
+            stock=args.stock,
+            rating=0,
+            business_id=business.id,
+        )
+        db.session.add(product)
+        db.session.commit()
+        product_id, user_id, business_id = product.id, user.id, business.id
+        # Buyers share one account; reservations are still per request.
+        buyers = [user_id] * args.buyers
+
+        think = args.think_ms / 1000
+        try:
+            db.session.close()
+            elapsed, sold = reservations(
+                product_id, buyers, args.release_rate, think, args.seed
+            )
+            left = db.session.get(Product, product_id).stock
+            held = StockReservation.query.filter_by(
+                product_id=product_id, status="held"
+            ).count()
+            report("reservations", args.stock, sold, left, elapsed)
+            if held:
+                print(f"{held} reservations still held")
+
+            Product.query.filter_by(id=product_id).update({"stock": args.stock})
+            db.session.commit()
+            elapsed, sold = read_modify_write(product_id, buyers, think)
+            left = db.session.get(Product, product_id).stock
+            report("read-modify-write", args.stock, sold, left, elapsed)
+        finally:
+            db.session.rollback()
+            StockReservation.query.filter_by(product_id=product_id).delete()
+            Product.query.filter_by(id=product_id).delete()
+            User.query.filter_by(id=user_id).delete()
+            Business.query.filter_by(id=business_id).delete()
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Uploads per second of the storage drivers against a local Azure stand-in.
+
+Starts a small HTTP server on localhost that accepts the Blob service's
+upload requests, then uploads the same synthetic files with a new client per
+file (how upload_file_to_azure used to work), with one pooled
+AzureBlobStorage shared by the upload threads, and with the filesystem and
+in-memory drivers. Needs neither Azure nor the database.
+
+    python -m benchmarks.storage_upload --files 500 --size 65536 --workers 8
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from storage import AzureBlobStorage, FilesystemStorage, MemoryStorage
+
+CONTAINER = "media"
+CREDENTIAL = "sv=2024-11-04&sig=bench"
+
+
+class BlobHandler(BaseHTTPRequestHandler):
+    """Accepts Put Blob, Put Block and Put Block List, keeping connections open."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header("ETag", '"0x8D000000000000"')
+        self.send_header("Last-Modified", formatdate(usegmt=True))
+        self.send_header("x-ms-request-id", "bench")
+        self.send_header("x-ms-version", "2024-11-04")
+        self.send_header("x-ms-request-server-encrypted", "true")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply(201)
+
+    def do_DELETE(self):
+        self._reply(202)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BlobHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def run(upload, files, size, workers):
+    payload = os.urandom(size)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(
+            executor.map(
+                lambda i: upload(io.BytesIO(payload), f"bench/{i}.bin"), range(files)
+            )
+        )
+    return time.perf_counter() - start
+
+
+def report(name, files, size, elapsed):
+    print(
+        f"{name:<22} {files:>6} files  {elapsed:>7.2f}s  "
+        f"{files / elapsed:>8.0f} uploads/s  {files * size / elapsed / 2**20:>7.1f} MiB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    server, account_url = start_server()
+    options = {"chunk_size": args.chunk_size, "max_concurrency": args.concurrency}
+    try:
+
+        def per_upload_client(file_obj, blob_name):
+            client = AzureBlobStorage(
+                account_url, CREDENTIAL, CONTAINER, pool_size=1, **options
+            )
+            return client.upload_fileobj(file_obj, blob_name)
+
+        elapsed = run(per_upload_client, args.files, args.size, args.workers)
+        report("azure, client per file", args.files, args.size, elapsed)
+
+        pooled = AzureBlobStorage(
+            account_url, CREDENTIAL, CONTAINER, pool_size=args.workers, **options
+        )
+        elapsed = run(pooled.upload_fileobj, args.files, args.size, args.workers)
+        report("azure, pooled client", args.files, args.size, elapsed)
+    finally:
+        server.shutdown()
+
+    with tempfile.TemporaryDirectory() as root:
+        filesystem = FilesystemStorage(root)
+        elapsed = run(filesystem.upload_fileobj, args.files, args.size, args.workers)
+        report("filesystem", args.files, args.size, elapsed)
+
+    memory = MemoryStorage()
+    elapsed = run(memory.upload_fileobj, args.files, args.size, args.workers)
+    report("memory", args.files, args.size, elapsed)
+
+
+if __name__ == "__main__":
+    main()
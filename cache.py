@@ -0,0 +1,235 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import text
+
+from config import app, db
+from models import (
+    BusinessType,
+    Category,
+    EntityMediaType,
+    PropertyType,
+    ReferenceVersion,
+    RoomType,
+    UserType,
+)
+from replica import use_primary
+
+Reference = namedtuple("Reference", ["id", "name", "description"])
+
+# One statement, so concurrent bumps queue on the row instead of racing to
+# insert it.
+BUMP_VERSION = text("""
+    INSERT INTO reference_versions (id, version) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE
+    SET version = reference_versions.version + 1, updated_at = now()
+    """)
+
+
+class ReferenceCache:
+    """
+    Process-local copy of the small lookup tables, keyed by name and id.
+    Writers bump the shared version row; every worker re-checks it at most once
+    per ``check_interval`` seconds and reloads all tables when it moved.
+    """
+
+    models = (BusinessType, Category, EntityMediaType, PropertyType, RoomType, UserType)
+
+    def __init__(self, check_interval=5.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._by_name = {}
+        self._by_id = {}
+
+    def _current_version(self):
+        # The snapshot is shared by the worker's later requests, so it must
+        # never come from a lagging replica.
+        use_primary()
+        row = db.session.get(ReferenceVersion, 1)
+        return row.version if row else 0
+
+    def load(self):
+        """Read every lookup table and swap in the new snapshot."""
+        with self._lock:
+            version = self._current_version()
+            by_name, by_id = {}, {}
+            for model in self.models:
+                rows = db.session.query(model.id, model.name, model.description).all()
+                by_name[model] = {row.name: Reference(*row) for row in rows}
+                by_id[model] = {row.id: Reference(*row) for row in rows}
+            self._by_name, self._by_id = by_name, by_id
+            self._version = version
+            self._checked_at = self._loaded_at = time.monotonic()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        if self._version is None or self._current_version() != self._version:
+            self.load()
+        else:
+            self._checked_at = now
+
+    def _reload_on_miss(self):
+        # Rows seeded straight into the database never bump the version row.
+        if time.monotonic() - self._loaded_at < self.check_interval:
+            return False
+        self.load()
+        return True
+
+    def by_name(self, model, name):
+        """
+        Look up a reference row by name.
+        :return: Reference tuple, or None when no such row exists.
+        """
+        self._refresh()
+        found = self._by_name[model].get(name)
+        if found is None and self._reload_on_miss():
+            found = self._by_name[model].get(name)
+        return found
+
+    def by_id(self, model, id):
+        """
+        Look up a reference row by primary key.
+        :return: Reference tuple, or None when no such row exists.
+        """
+        self._refresh()
+        found = self._by_id[model].get(id)
+        if found is None and self._reload_on_miss():
+            found = self._by_id[model].get(id)
+        return found
+
+    def bump(self):
+        """
+        Advance the shared version inside the caller's transaction.
+        Call before committing a write to any lookup table.
+        """
+        use_primary()
+        db.session.execute(BUMP_VERSION)
+        self._version = None
+
+
+reference_cache = ReferenceCache(app.config["REFERENCE_CACHE_INTERVAL"])
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache whose entries expire after ``ttl`` seconds.
+    Writers call ``invalidate`` so the local worker never serves stale entries;
+    other workers converge within one ttl.
+    """
+
+    def __init__(self, ttl=60.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                self._entries.pop(next(iter(self._entries)), None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, prefix=None):
+        """Drop every entry, or only those whose tuple key starts with prefix."""
+        with self._lock:
+            if prefix is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[: len(prefix)] == prefix]:
+                del self._entries[key]
+
+
+class LRUCache:
+    """
+    Thread-safe in-process mapping that keeps the ``maxsize`` most recently
+    used entries.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class BloomFilter:
+    """
+    Set of strings that answers "definitely absent" or "maybe present".
+    Sized for ``capacity`` items at a false positive rate of ``error_rate``.
+    Items cannot be removed: build a new filter instead.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(
+            64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
@@ -0,0 +1,79 @@
+import zlib
+
+import zstandard
+from flask import request
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+
+def _compressor(encoding, app):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(
+            level=app.config["COMPRESS_ZSTD_LEVEL"]
+        ).compressobj()
+    return zlib.compressobj(app.config["COMPRESS_GZIP_LEVEL"], zlib.DEFLATED, 31)
+
+
+def _stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(
+            chunk if isinstance(chunk, bytes) else chunk.encode()
+        )
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Pick the best supported content coding from an Accept-Encoding header.
+    :return: "zstd", "gzip" or None for identity.
+    """
+    return accept_encodings.best_match(["zstd", "gzip"])
+
+
+def init_compression(app):
+    """
+    Compress text responses with zstd or gzip, negotiated from Accept-Encoding.
+    Buffered bodies below COMPRESS_MIN_SIZE are sent as is, streamed bodies are
+    compressed chunk by chunk without buffering.
+    """
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding(request.accept_encodings)
+        if not encoding:
+            return response
+
+        if response.is_streamed:
+            response.response = _stream(response.response, _compressor(encoding, app))
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+                return response
+            compressor = _compressor(encoding, app)
+            response.set_data(compressor.compress(data) + compressor.flush())
+
+        response.headers["Content-Encoding"] = encoding
+        # The compressed bytes differ per coding, so a strong tag no longer holds.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,173 @@
+from flask import current_app, request
+from sqlalchemy import case, func, or_, select, tuple_
+
+from cache import TTLCache, reference_cache
+from config import app, db
+from models import Category
+from utils import contains_pattern, load_fields, number_arg
+
+facet_cache = TTLCache(app.config["FACET_CACHE_TTL"])
+
+
+def _price_bucket(column):
+    edges = current_app.config["PRICE_BUCKETS"]
+    return case(
+        *[(column < edge, idx) for idx, edge in enumerate(edges)], else_=len(edges)
+    )
+
+
+def _bucket_label(idx):
+    edges = current_app.config["PRICE_BUCKETS"]
+    low = edges[idx - 1] if idx else 0
+    return f"{low}+" if idx == len(edges) else f"{low}-{edges[idx]}"
+
+
+def _dimensions(model):
+    dims = {"category": model.category_id, "price": _price_bucket(model.price)}
+    if hasattr(model, "rating"):
+        dims["rating"] = model.rating
+    return dims
+
+
+def parse_page():
+    """
+    Read the ``page`` and ``per_page`` query parameters of a search.
+    per_page is clamped to 1..MAX_PER_PAGE like the business listing does.
+    :return: Tuple of (page, per_page, error).
+    """
+    page, error = number_arg("page", int)
+    if error:
+        return None, None, error
+    if page is not None and page < 1:
+        return None, None, "page must be at least 1"
+    per_page, error = number_arg("per_page", int)
+    if error:
+        return None, None, error
+    if per_page is None:
+        per_page = 10
+    per_page = max(1, min(per_page, current_app.config["MAX_PER_PAGE"]))
+    return page or 1, per_page, None
+
+
+def parse_search(model):
+    """
+    Translate the search query parameters into filter conditions on model.
+    :return: Tuple of (conditions, error, status). conditions is empty when
+        unfiltered; status is 404 for an unknown category, 400 otherwise.
+    """
+    conditions = []
+    q = request.args.get("q", type=str)
+    if q:
+        pattern = contains_pattern(q)
+        conditions.append(
+            or_(
+                model.name.ilike(pattern, escape="\\"),
+                model.description.ilike(pattern, escape="\\"),
+            )
+        )
+    category = request.args.get("category", type=str)
+    if category:
+        existing_category = reference_cache.by_name(Category, category)
+        if not existing_category:
+            return None, "Category not found", 404
+        conditions.append(model.category_id == existing_category.id)
+    min_price, error = number_arg("min_price", float)
+    if error:
+        return None, error, 400
+    if min_price is not None:
+        conditions.append(model.price >= min_price)
+    max_price, error = number_arg("max_price", float)
+    if error:
+        return None, error, 400
+    if max_price is not None:
+        conditions.append(model.price <= max_price)
+    min_rating, error = number_arg("min_rating", int)
+    if error:
+        return None, error, 400
+    if min_rating is not None and hasattr(model, "rating"):
+        conditions.append(model.rating >= min_rating)
+    return conditions, None, None
+
+
+def _facets_subquery(model, conditions):
+    # One pass over the filtered rows, one grouping set per facet plus the total.
+    dims = _dimensions(model)
+    filtered = (
+        select(*(expr.label(name) for name, expr in dims.items()))
+        .where(*conditions)
+        .subquery("filtered")
+    )
+    columns = [filtered.c[name] for name in dims]
+    counts = (
+        select(
+            *columns,
+            func.grouping(*columns).label("grouping_id"),
+            func.count().label("count"),
+        )
+        .group_by(func.grouping_sets(*(tuple_(c) for c in columns), tuple_()))
+        .subquery("facets")
+    )
+    return select(func.json_agg(counts.table_valued())).scalar_subquery()
+
+
+def _decode_facets(model, rows):
+    names = list(_dimensions(model))
+    full = (1 << len(names)) - 1
+    facets = {name: [] for name in names}
+    total = 0
+    for row in rows or []:
+        if row["grouping_id"] == full:
+            total = row["count"]
+            continue
+        for idx, name in enumerate(names):
+            if row["grouping_id"] != full ^ (1 << (len(names) - 1 - idx)):
+                continue
+            value = row[name]
+            if name == "category":
+                category = value and reference_cache.by_id(Category, value)
+                entry = {"id": value, "name": category.name if category else None}
+            elif name == "price":
+                entry = {"bucket": _bucket_label(value)}
+            else:
+                entry = {name: value}
+            entry["count"] = row["count"]
+            facets[name].append(entry)
+    for entries in facets.values():
+        entries.sort(key=lambda entry: -entry["count"])
+    return facets, total
+
+
+def faceted_search(model, conditions, page, per_page, fields=None):
+    """
+    Load one page of model rows matching conditions together with facet counts.
+    The counts ride along the page query as a single scalar subquery; counts for
+    the unfiltered catalog are served from facet_cache.
+    :return: Tuple of (items, facets, total).
+    """
+    cache_key = ("facets", model.__tablename__)
+    cached = None if conditions else facet_cache.get(cache_key)
+
+    query = load_fields(model.query, model, fields).filter(*conditions)
+    query = query.order_by(model.id).limit(per_page).offset((page - 1) * per_page)
+    if cached:
+        rows = [(row, None) for row in query.all()]
+        facets, total = cached
+    else:
+        rows = query.add_columns(_facets_subquery(model, conditions)).all()
+        if rows:
+            facet_rows = rows[0][1]
+        else:
+            facet_rows = db.session.execute(
+                select(_facets_subquery(model, conditions))
+            ).scalar()
+        facets, total = _decode_facets(model, facet_rows)
+        if not conditions:
+            facet_cache.set(cache_key, (facets, total))
+
+    items = [row.to_dict(only=fields or ()) for row, _ in rows]
+    return items, facets, total
+
+
+def invalidate_facets(model):
+    """Drop cached facet counts for model after a write."""
+    facet_cache.invalidate(("facets", model.__tablename__))
@@ -1,8 +1,26 @@
 from flask import Blueprint, request, make_response, jsonify
+from cache import reference_cache
 from config import db
+from facets import faceted_search, invalidate_facets, parse_page, parse_search
+from identity import current_identity, role_required
+from inventory import bulk_patch, parse_bulk_items
 from models import Category, Business, Food, EntityMedia, EntityMediaType
-from products.utils import upload_file_to_azure
-from werkzeug.utils import secure_filename
+from media import (
+    MediaUploadError,
+    attach_media,
+    discard_media,
+    queue_ingest,
+    stage_media,
+)
+from utils import (
+    batch_get,
+    catalog_validator,
+    load_fields,
+    not_modified,
+    parse_batch_ids,
+    parse_fields,
+    set_validators,
+)
 
 foods = Blueprint("foods", __name__, url_prefix="/api/v1/foods")
 
@@ -17,7 +35,7 @@ def create_food():
     required_fields = [
         "name",
         "category",
-        "businame",
+        "businessName",
         "description",
         "price",
         "isAvailable",
@@ -32,106 +50,123 @@ def create_food():
             "missing_fields": missing_fields,
         }, 400
 
-    try:
-        category = Category.query.filter_by(name=data["category"]).first()
-        if not category:
-            return make_response(jsonify({"error": "Category not found"}), 404)
+    category = reference_cache.by_name(Category, data["category"])
+    if not category:
+        return make_response(jsonify({"error": "Category not found"}), 404)
 
-        business = Business.query.filter_by(name=data["businessName"]).first()
-        if not business:
-            return make_response(jsonify({"error": "Business not found"}), 404)
+    business = Business.query.filter_by(name=data["businessName"]).first()
+    if not business:
+        return make_response(jsonify({"error": "Business not found"}), 404)
 
-        entity_type = EntityMediaType.query.filter_by(name="food").first()
-        if not entity_type:
-            return make_response(jsonify({"error": "Entity type not found"}), 404)
+    entity_type = reference_cache.by_name(EntityMediaType, "food")
+    if not entity_type:
+        return make_response(jsonify({"error": "Entity type not found"}), 404)
+
+    # Upload (or spool) before opening the write transaction; undo it if that fails.
+    try:
+        staged = stage_media(request.files.getlist("media"))
+    except MediaUploadError as e:
+        return make_response(jsonify({"error": str(e)}), 500)
 
+    try:
         food = Food(
             name=data["name"],
             description=data.get("description"),
             price=float(data["price"]),
-            is_available=data.get("isAvailable", True),
+            is_available=str(data.get("isAvailable", True)).lower()
+            in ("true", "1", "yes"),
             category_id=category.id,
             business_id=business.id,
         )
 
         db.session.add(food)
         db.session.flush()
-
-        files = request.files.getlist("media")
-        for idx, file_obj in enumerate(files):
-
-            safe_filename = secure_filename(file_obj.filename)
-            blob_name = f"foods/{food.id}/{idx}_{safe_filename}"
-            result = upload_file_to_azure(file_obj, blob_name)
-
-            if isinstance(result, dict) and result.get("url"):
-                url = result.get("url")
-                entity_media = EntityMedia(
-                    entity_id=food.id,
-                    entity_type=entity_type.id,
-                    url=url,
-                    storage_type=2,
-                )
-                db.session.add(entity_media)
+        attach_media(food.id, entity_type.id, staged)
         db.session.commit()
-
-        return {"message": "Food created successfully"}, 201
     except Exception as e:
         db.session.rollback()
+        discard_media(staged)
         return make_response(jsonify({"error": str(e)}), 500)
 
+    invalidate_facets(Food)
+    return {"message": "Food created successfully"}, (
+        202 if queue_ingest(staged) else 201
+    )
+
 
 @foods.route("/getone/<int:food_id>", methods=["GET"])
 def get_food(food_id):
     """
-    Endpoint to get a single food item by ID.
+    Endpoint to get a single food item by ID, supports a sparse ``fields`` list.
     """
-    food = Food.query.filter_by(id=food_id).first()
+    fields, error = parse_fields(Food)
+    if error:
+        return error
+
+    query = Food.query.filter_by(id=food_id)
+    food = load_fields(query, Food, fields).first()
     if not food:
         return {"error": "Food not found"}, 404
 
     media = EntityMedia.query.filter_by(
         entity_id=food.id,
-        entity_type=EntityMediaType.query.filter_by(name="food").first().id,
+        entity_type_id=reference_cache.by_name(EntityMediaType, "food").id,
+        status="ready",
     ).all()
+    etag, last_modified = catalog_validator(Food, [food], related=media)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
     food.media = [m.url for m in media]
     food.image_url = media[0].url if media else None
     if not food.media:
         food.media = []
 
-    return make_response(jsonify(food.to_dict()), 200)
+    return set_validators(
+        make_response(jsonify(food.to_dict(only=fields or ())), 200),
+        etag,
+        last_modified,
+    )
 
 
 @foods.route("/getall", methods=["GET"])
 def get_all_foods():
-    """Get paginated food items"""
+    """
+    Get paginated food items, supports a sparse ``fields`` list.
+    ``available=true`` lists only the items that can be ordered.
+    """
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
     category = request.args.get("category", None, type=str)
+    available_only = request.args.get("available", "false", type=str).lower() == "true"
+    fields, error = parse_fields(Food)
+    if error:
+        return error
 
     existing_category = None
     if category:
-        existing_category = Category.query.filter_by(name=category).first()
+        existing_category = reference_cache.by_name(Category, category)
         if not existing_category:
             return make_response(jsonify({"error": "Category not found"}), 404)
 
     query = Food.query
     if existing_category:
         query = query.filter_by(category_id=existing_category.id)
+    if available_only:
+        # Compared with = so the planner can use ix_food_available_category.
+        query = query.filter_by(is_available=True)
 
-    foods_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    foods = []
-    entity_type = EntityMediaType.query.filter_by(name="food").first()
-
-    for food in foods_pagination.items:
-        if not food.image_url:
-            media = EntityMedia.query.filter_by(
-                entity_id=food.id, entity_type_id=entity_type.id
-            ).first()
-            if media:
-                food.image_url = media.url
-        foods.append(food.to_dict())
-    return make_response(
+    foods_pagination = load_fields(query, Food, fields).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    etag, last_modified = catalog_validator(
+        Food, foods_pagination.items, foods_pagination.total
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    foods = [food.to_dict(only=fields or ()) for food in foods_pagination.items]
+    response = make_response(
         jsonify(
             {
                 "items": foods,
@@ -145,6 +180,73 @@ def get_all_foods():
         ),
         200,
     )
+    return set_validators(response, etag, last_modified)
+
+
+@foods.route("/batch", methods=["POST"])
+def get_foods_batch():
+    """
+    Endpoint to retrieve several food items and their media in one call,
+    returned in the order the ids were requested.
+    """
+    ids, error = parse_batch_ids()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Food)
+    if error:
+        return error
+
+    items, missing = batch_get(Food, "food", ids, fields)
+    return make_response(jsonify({"items": items, "missing": missing}), 200)
+
+
+@foods.route("/search", methods=["GET"])
+def search_foods():
+    """
+    Faceted food search. Returns one page of matches together with
+    category and price-bucket facet counts for the same filters.
+    """
+    page, per_page, error = parse_page()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Food)
+    if error:
+        return error
+    conditions, error, status = parse_search(Food)
+    if error:
+        return make_response(jsonify({"error": error}), status)
+
+    items, facets, total = faceted_search(Food, conditions, page, per_page, fields)
+    return make_response(
+        jsonify(
+            {
+                "items": items,
+                "facets": facets,
+                "total": total,
+                "page": page,
+                "pages": (total + per_page - 1) // per_page,
+                "per_page": per_page,
+            }
+        ),
+        200,
+    )
+
+
+@foods.route("/bulk", methods=["PATCH"])
+@role_required("business_owner")
+def bulk_patch_foods():
+    """
+    Endpoint to update the price and availability of many food items in one
+    transaction. Items carrying ``updatedAt`` are only applied when the item
+    has not changed since; each item gets its own outcome.
+    """
+    items, error = parse_bulk_items()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    summary = bulk_patch(Food, items, current_identity().owner_id)
+    return make_response(
+        jsonify(summary), 422 if summary["invalid"] and not summary["updated"] else 200
+    )
 
 
 @foods.route("/patch/<int:food_id>", methods=["PATCH"])
@@ -156,7 +258,7 @@ def patch_food(food_id):
         return make_response(jsonify({"error": "Food not found"}), 404)
     category = None
     if data.get("category"):
-        category = Category.query.filter_by(name=data.get("category")).first()
+        category = reference_cache.by_name(Category, data.get("category"))
         if not category:
             return make_response(jsonify({"error": "Category not found"}), 404)
 
@@ -167,6 +269,7 @@ def patch_food(food_id):
     food.category_id = category.id if category else food.category_id
 
     db.session.commit()
+    invalidate_facets(Food)
     return make_response(
         jsonify({"message": "Food updated successfully", "food": food.to_dict()}), 200
     )
@@ -0,0 +1,311 @@
+import heapq
+import threading
+import time
+
+import numpy as np
+from flask import current_app, request
+from sqlalchemy import func, text
+
+from config import db
+from utils import load_fields
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """Project degrees of latitude/longitude onto the unit sphere."""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lng = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack(
+        (np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat))
+    )
+
+
+def chord_for_km(km):
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def km_for_chord(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+class KDTree:
+    """
+    Static k-d tree over 3D unit vectors, so straight-line (chord) distance
+    orders points exactly like great-circle distance.
+    """
+
+    def __init__(self, points, ids, leaf_size=64):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.ids = np.asarray(ids)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(self.points))
+        self.start, self.end, self.lo, self.hi, self.left, self.right = (
+            [],
+            [],
+            [],
+            [],
+            [],
+            [],
+        )
+        if len(self.points):
+            self._build(0, len(self.points))
+        self.points = self.points[self.order]
+        self.ids = self.ids[self.order]
+
+    def _build(self, start, end):
+        node = len(self.start)
+        idx = self.order[start:end]
+        pts = self.points[idx]
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        self.start.append(start)
+        self.end.append(end)
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.left.append(-1)
+        self.right.append(-1)
+        if end - start > self.leaf_size:
+            mid = (start + end) // 2
+            dim = int(np.argmax(hi - lo))
+            self.order[start:end] = idx[np.argpartition(pts[:, dim], mid - start)]
+            self.left[node] = self._build(start, mid)
+            self.right[node] = self._build(mid, end)
+        return node
+
+    def _box_distance(self, node, point):
+        gap = np.maximum(self.lo[node] - point, 0) + np.maximum(
+            point - self.hi[node], 0
+        )
+        return float(np.sqrt(gap @ gap))
+
+    def _leaf_distances(self, node, point):
+        pts = self.points[self.start[node] : self.end[node]]
+        return np.sqrt(((pts - point) ** 2).sum(axis=1))
+
+    def query_radius(self, point, radius):
+        """
+        :return: Tuple of (ids, chord distances) within radius, nearest first.
+        """
+        if not self.start:
+            return self.ids[:0], np.empty(0)
+        ids, dists, stack = [], [], [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > radius:
+                continue
+            if self.left[node] < 0:
+                d = self._leaf_distances(node, point)
+                hit = d <= radius
+                ids.append(self.ids[self.start[node] : self.end[node]][hit])
+                dists.append(d[hit])
+            else:
+                stack.extend((self.left[node], self.right[node]))
+        if not ids:
+            return self.ids[:0], np.empty(0)
+        ids, dists = np.concatenate(ids), np.concatenate(dists)
+        order = np.argsort(dists, kind="stable")
+        return ids[order], dists[order]
+
+    def query_knn(self, point, k, radius=np.inf):
+        """
+        :return: Tuple of (ids, chord distances) of the k nearest points
+            no further than radius, nearest first.
+        """
+        best_ids, best_dists = self.ids[:0], np.empty(0)
+        if not self.start or k <= 0:
+            return best_ids, best_dists
+        heap = [(self._box_distance(0, point), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            limit = best_dists[-1] if len(best_dists) == k else radius
+            if bound > limit:
+                break
+            if self.left[node] < 0:
+                d = self._leaf_distances(node, point)
+                best_ids = np.concatenate(
+                    (best_ids, self.ids[self.start[node] : self.end[node]])
+                )
+                best_dists = np.concatenate((best_dists, d))
+                keep = np.argsort(best_dists, kind="stable")[:k]
+                keep = keep[best_dists[keep] <= radius]
+                best_ids, best_dists = best_ids[keep], best_dists[keep]
+            else:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(heap, (self._box_distance(child, point), child))
+        return best_ids, best_dists
+
+
+class GeoIndex:
+    """
+    In-process k-d tree over the located rows of a model.
+    Rebuilt when max(updated_at) or the row count moves, checked at most once
+    per ``check_interval`` seconds.
+    """
+
+    def __init__(self, model, check_interval=30.0):
+        self.model = model
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._validator = None
+        self._tree = None
+
+    def _located(self):
+        return self.model.query.filter(
+            self.model.latitude.isnot(None), self.model.longitude.isnot(None)
+        )
+
+    def tree(self):
+        if self._tree is not None and (
+            time.monotonic() - self._checked_at < self.check_interval
+        ):
+            return self._tree
+        with self._lock:
+            validator = tuple(
+                self._located()
+                .with_entities(func.max(self.model.updated_at), func.count())
+                .one()
+            )
+            if self._tree is None or validator != self._validator:
+                rows = (
+                    self._located()
+                    .with_entities(
+                        self.model.id, self.model.latitude, self.model.longitude
+                    )
+                    .all()
+                )
+                ids = [row[0] for row in rows]
+                points = (
+                    to_unit_vectors([r[1] for r in rows], [r[2] for r in rows])
+                    if rows
+                    else np.empty((0, 3))
+                )
+                self._tree = KDTree(points, ids)
+                self._validator = validator
+            self._checked_at = time.monotonic()
+        return self._tree
+
+
+_indexes = {}
+_earthdistance = None
+
+
+def has_earthdistance():
+    """Whether the earthdistance extension is installed, checked once per worker."""
+    global _earthdistance
+    if _earthdistance is None:
+        try:
+            _earthdistance = bool(
+                db.session.execute(
+                    text("SELECT 1 FROM pg_extension WHERE extname = 'earthdistance'")
+                ).scalar()
+            )
+        except Exception:
+            db.session.rollback()
+            _earthdistance = False
+    return _earthdistance
+
+
+def nearby(model, latitude, longitude, radius_km=None, k=None):
+    """
+    Find the rows of model closest to a point.
+    Uses the earthdistance GiST index when the extension is installed and an
+    in-process k-d tree otherwise.
+    :param radius_km: Only return rows within this distance.
+    :param k: Return at most this many rows.
+    :return: List of (id, distance_km) tuples, nearest first.
+    """
+    if has_earthdistance():
+        origin = func.ll_to_earth(latitude, longitude)
+        point = func.ll_to_earth(model.latitude, model.longitude)
+        distance = func.earth_distance(point, origin)
+        query = db.session.query(model.id, distance).filter(
+            model.latitude.isnot(None), model.longitude.isnot(None)
+        )
+        if radius_km is not None:
+            radius_m = radius_km * 1000
+            query = query.filter(
+                func.earth_box(origin, radius_m).op("@>")(point),
+                distance <= radius_m,
+            )
+        query = query.order_by(point.op("<->")(origin))
+        if k is not None:
+            query = query.limit(k)
+        return [(id, meters / 1000) for id, meters in query]
+
+    if model not in _indexes:
+        _indexes[model] = GeoIndex(model, current_app.config["GEO_INDEX_INTERVAL"])
+    tree = _indexes[model].tree()
+    point = to_unit_vectors([latitude], [longitude])[0]
+    radius = chord_for_km(radius_km) if radius_km is not None else np.inf
+    if k is None:
+        ids, chords = tree.query_radius(point, radius)
+    else:
+        ids, chords = tree.query_knn(point, k, radius)
+    return [(id.item(), float(km)) for id, km in zip(ids, km_for_chord(chords))]
+
+
+def parse_coordinates(data, current=(None, None)):
+    """
+    Read an optional ``latitude``/``longitude`` pair from form or JSON data.
+    :param current: Coordinates to keep when the pair is not given.
+    :return: Tuple of ((latitude, longitude), error).
+    """
+    if data.get("latitude") is None and data.get("longitude") is None:
+        return current, None
+    try:
+        latitude, longitude = float(data["latitude"]), float(data["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return (None, None), "latitude and longitude must be given together as numbers"
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return (None, None), "latitude or longitude out of range"
+    return (latitude, longitude), None
+
+
+def parse_nearby():
+    """
+    Read the ``lat``, ``lng``, ``radius_km`` and ``k`` query parameters.
+    k defaults to 10 when no radius is given and is capped at MAX_PER_PAGE.
+    :return: Tuple of (dict of nearby() arguments, error).
+    """
+    (latitude, longitude), error = parse_coordinates(
+        {
+            "latitude": request.args.get("lat"),
+            "longitude": request.args.get("lng"),
+        }
+    )
+    if error or latitude is None:
+        return None, error or "lat and lng are required"
+    radius_km = request.args.get("radius_km", type=float)
+    if radius_km is not None and radius_km <= 0:
+        return None, "radius_km must be positive"
+    k = request.args.get("k", type=int)
+    if k is None and radius_km is None:
+        k = 10
+    if k is not None and k <= 0:
+        return None, "k must be positive"
+    limit = current_app.config["MAX_PER_PAGE"]
+    k = min(k, limit) if k is not None else limit
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "radius_km": radius_km,
+        "k": k,
+    }, None
+
+
+def nearby_items(model, results, fields=None):
+    """
+    Serialize the rows found by nearby(), nearest first.
+    :return: List of row dicts carrying a ``distance_km`` key.
+    """
+    ids = [id for id, _ in results]
+    rows = load_fields(model.query, model, fields).filter(model.id.in_(ids)).all()
+    found = {row.id: row for row in rows}
+    items = []
+    for id, distance in results:
+        if id in found:
+            item = found[id].to_dict(only=fields or ())
+            item["distance_km"] = round(distance, 3)
+            items.append(item)
+    return items
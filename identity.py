@@ -0,0 +1,95 @@
+from functools import wraps
+
+from flask import g, jsonify, make_response
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+
+from cache import TTLCache
+from config import app, db
+from models import Business, User
+
+profile_cache = TTLCache(
+    app.config["IDENTITY_CACHE_TTL"], app.config["IDENTITY_CACHE_SIZE"]
+)
+
+
+class Identity:
+    """
+    The signed-in user as the request's token describes it. ``id``, ``email``
+    and ``role`` come from the token's claims and cost nothing; ``user`` and
+    ``business`` load the serialized user and the business they own on first
+    use, shared by the worker's requests for IDENTITY_CACHE_TTL seconds.
+    """
+
+    def __init__(self, user_id, claims):
+        self.id = user_id
+        self.email = claims.get("email")
+        self.role = claims.get("role")
+
+    @property
+    def owner_id(self):
+        """The user whose businesses writes are limited to, None for admins."""
+        return None if self.role == "admin" else self.id
+
+    @property
+    def user(self):
+        """The user's to_dict(), or None when the user no longer exists."""
+        return _cached(("user", self.id), lambda: db.session.get(User, self.id))
+
+    @property
+    def business(self):
+        """The to_dict() of the business the user owns, or None."""
+        return _cached(
+            ("business", self.id),
+            lambda: Business.query.filter_by(user_id=self.id).first(),
+        )
+
+
+def _cached(key, load):
+    found = profile_cache.get(key)
+    if found is None:
+        row = load()
+        if row is None:
+            return None
+        found = row.to_dict()
+        profile_cache.set(key, found)
+    return found
+
+
+def current_identity():
+    """The Identity of the current request, built once from its JWT."""
+    if "identity" not in g:
+        g.identity = Identity(get_jwt_identity(), get_jwt())
+    return g.identity
+
+
+def role_required(*roles):
+    """
+    jwt_required() that also wants one of roles in the token's ``role``
+    claim, answering 403 otherwise. Admins pass every role check.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            role = current_identity().role
+            if role != "admin" and role not in roles:
+                return make_response(
+                    jsonify({"error": f"Requires one of the roles {list(roles)}"}),
+                    403,
+                )
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_user(user_id):
+    """Drop the cached user after a write to it."""
+    profile_cache.invalidate(("user", user_id))
+
+
+def invalidate_business(user_id):
+    """Drop the cached business profile of its owner after a write to it."""
+    profile_cache.invalidate(("business", user_id))
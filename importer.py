@@ -0,0 +1,302 @@
+import csv
+import io
+import json
+import math
+import time
+
+import click
+from sqlalchemy import text
+
+from cache import reference_cache
+from config import db
+from facets import invalidate_facets
+from models import Business, Category, Product
+from rankings import top_products_refresher
+
+IMPORT_FORMATS = ("csv", "ndjson")
+STAGING_COLUMNS = (
+    "line",
+    "business_id",
+    "category_id",
+    "name",
+    "description",
+    "price",
+    "stock",
+    "image_url",
+    "rating",
+)
+
+# Existing products are matched on (business_id, name): re-importing a file
+# updates the rows it created instead of duplicating them.
+MERGE_UPDATE = text("""
+    UPDATE products p
+    SET category_id = s.category_id, description = s.description,
+        price = s.price, stock = s.stock,
+        image_url = COALESCE(s.image_url, p.image_url),
+        rating = COALESCE(s.rating, p.rating), updated_at = now()
+    FROM product_import s
+    WHERE p.business_id = s.business_id AND p.name = s.name
+    """)
+MERGE_INSERT = text("""
+    INSERT INTO products
+        (business_id, category_id, name, description, price, stock, image_url, rating)
+    SELECT s.business_id, s.category_id, s.name, s.description, s.price,
+        s.stock, s.image_url, COALESCE(s.rating, 0)
+    FROM product_import s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM products p
+        WHERE p.business_id = s.business_id AND p.name = s.name
+    )
+    ORDER BY s.line
+    """)
+
+
+def read_rows(stream, fmt):
+    """
+    Parse an uploaded file lazily.
+    :param stream: Binary file object.
+    :param fmt: "csv" (with a header row) or "ndjson".
+    :return: Generator of (line number, row dict or None when unparseable).
+    """
+    lines = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else None
+
+
+class ProductImport:
+    """
+    Validate product rows and load them into ``products`` in bulk.
+    Category names are resolved through the reference cache and business names
+    through a map loaded once per import, of ``owner_id``'s businesses only
+    when given. Valid rows are copied into a temporary
+    staging table in batches and merged with two set-based statements.
+    """
+
+    def __init__(
+        self, business_name=None, owner_id=None, batch_size=10000, max_errors=1000
+    ):
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        businesses = db.session.query(Business.id, Business.name)
+        if owner_id is not None:
+            businesses = businesses.filter(Business.user_id == owner_id)
+        self.businesses = {name: id for id, name in businesses}
+        self.default_business = business_name
+        self.seen = {}
+        self.rows = 0
+        self.staged = 0
+        self.errors = []
+        self.error_count = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = 0
+
+        self.connection = db.session.connection()
+        self.connection.execute(text("""
+            CREATE TEMP TABLE product_import (
+                line integer,
+                business_id varchar(255),
+                category_id integer,
+                name varchar(255),
+                description varchar(255),
+                price double precision,
+                stock integer,
+                image_url varchar(255),
+                rating integer
+            ) ON COMMIT DROP
+            """))
+
+    def _error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "errors": errors})
+
+    def validate(self, line, row):
+        """
+        Check one row and resolve its names.
+        :return: Tuple of (staging values, errors dict).
+        """
+        if row is None:
+            return None, {"row": "Not a JSON object"}
+        errors = {}
+
+        def text_field(key, required=False):
+            value = row.get(key)
+            value = str(value).strip() if value not in (None, "") else None
+            if value is None and required:
+                errors[key] = "Required"
+            elif value and len(value) > 255:
+                errors[key] = "Longer than 255 characters"
+            return value
+
+        def number(key, cast, required=False, minimum=None, maximum=None):
+            value = row.get(key)
+            if value in (None, ""):
+                if required:
+                    errors[key] = "Required"
+                return None
+            try:
+                value = cast(value)
+            except (TypeError, ValueError, OverflowError):
+                errors[key] = f"Not a valid {cast.__name__}"
+                return None
+            if cast is float and not math.isfinite(value):
+                errors[key] = "Must be a finite number"
+                return None
+            if (minimum is not None and value < minimum) or (
+                maximum is not None and value > maximum
+            ):
+                errors[key] = "Out of range"
+            return value
+
+        name = text_field("name", required=True)
+        description = text_field("description")
+        image_url = text_field("image_url")
+        price = number("price", float, required=True, minimum=0)
+        stock = number("stock", int, minimum=0)
+        rating = number("rating", int, minimum=0, maximum=5)
+
+        category_id = None
+        category = text_field("category")
+        if category:
+            found = reference_cache.by_name(Category, category)
+            if found is None:
+                errors["category"] = "Category not found"
+            else:
+                category_id = found.id
+
+        business_name = text_field("businessName") or self.default_business
+        business_id = self.businesses.get(business_name)
+        if not business_name:
+            errors["businessName"] = "Required"
+        elif business_id is None:
+            errors["businessName"] = "Business not found"
+
+        if name and business_id and not errors:
+            first = self.seen.setdefault((business_id, name), line)
+            if first != line:
+                errors["name"] = f"Duplicate of line {first}"
+
+        values = (
+            line,
+            business_id,
+            category_id,
+            name,
+            description,
+            price,
+            stock,
+            image_url,
+            rating,
+        )
+        return values, errors
+
+    def add(self, line, row):
+        self.rows += 1
+        values, errors = self.validate(line, row)
+        if errors:
+            self._error(line, errors)
+            return
+        self._writer.writerow(["" if v is None else v for v in values])
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """COPY the buffered rows into the staging table."""
+        if not self._pending:
+            return
+        self._buffer.seek(0)
+        cursor = self.connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY product_import ({', '.join(STAGING_COLUMNS)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            self._buffer,
+        )
+        self.staged += self._pending
+        self._pending = 0
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def merge(self, dry_run=False):
+        """
+        Merge the staged rows into products and commit, or roll back on dry_run.
+        :return: Summary dict with counts and per-row errors.
+        """
+        self.flush()
+        updated = self.connection.execute(MERGE_UPDATE).rowcount
+        inserted = self.connection.execute(MERGE_INSERT).rowcount
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+            if updated or inserted:
+                invalidate_facets(Product)
+                top_products_refresher.mark_dirty()
+        return {
+            "rows": self.rows,
+            "inserted": inserted,
+            "updated": updated,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "dry_run": dry_run,
+        }
+
+
+def import_products(rows, business_name=None, dry_run=False, owner_id=None, **options):
+    """
+    Import (line, row) pairs produced by read_rows().
+    :param business_name: Business used for rows without a businessName.
+    :param dry_run: Validate and merge, then roll back.
+    :param owner_id: When set, rows may only name this user's businesses.
+    :return: Summary dict, see ProductImport.merge().
+    """
+    job = ProductImport(business_name, owner_id, **options)
+    try:
+        for line, row in rows:
+            job.add(line, row)
+        return job.merge(dry_run)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def init_import_cli(app):
+    """Register the ``flask import-products`` command."""
+
+    @app.cli.command("import-products")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS))
+    @click.option("--business", help="Business name for rows without businessName.")
+    @click.option("--dry-run", is_flag=True, help="Validate without saving.")
+    def import_products_command(path, fmt, business, dry_run):
+        """Bulk import products from a CSV or NDJSON file."""
+        fmt = fmt or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        start = time.perf_counter()
+        with open(path, "rb") as stream:
+            summary = import_products(
+                read_rows(stream, fmt),
+                business,
+                dry_run,
+                batch_size=app.config["IMPORT_BATCH_SIZE"],
+                max_errors=app.config["IMPORT_MAX_ERRORS"],
+            )
+        elapsed = time.perf_counter() - start
+        for error in summary["errors"]:
+            click.echo(f"line {error['line']}: {error['errors']}", err=True)
+        click.echo(
+            f"{summary['rows']} rows, {summary['inserted']} inserted, "
+            f"{summary['updated']} updated, {summary['failed']} failed "
+            f"in {elapsed:.2f}s ({summary['rows'] / max(elapsed, 1e-9):.0f} rows/s)"
+            + (" [dry run]" if dry_run else "")
+        )
@@ -0,0 +1,413 @@
+import math
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import bindparam, text
+
+from config import db
+from facets import invalidate_facets
+from models import Food, Product, StockReservation
+from rankings import top_products_refresher
+
+# Request key: (column, parser, SQL type) of the fields a bulk patch may set.
+BULK_FIELDS = {
+    Product: {
+        "price": ("price", float, "double precision"),
+        "stock": ("stock", int, "integer"),
+    },
+    Food: {
+        "price": ("price", float, "numeric"),
+        "isAvailable": ("is_available", bool, "boolean"),
+    },
+}
+
+
+def parse_bulk_items():
+    """
+    Read the ``items`` list of a bulk patch request body.
+    :return: Tuple of (items, error).
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return None, "items must be a non-empty list"
+    limit = current_app.config["BULK_PATCH_MAX_ROWS"]
+    if len(items) > limit:
+        return None, f"At most {limit} items can be patched at once"
+    return items, None
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "1", "yes"):
+        return True
+    if str(value).lower() in ("false", "0", "no"):
+        return False
+    raise ValueError(value)
+
+
+def _validate(item, fields):
+    """
+    Check one bulk patch item.
+    :return: Tuple of (row values, errors dict).
+    """
+    if not isinstance(item, dict):
+        return None, {"item": "Not an object"}
+    errors = {}
+    values = {}
+    try:
+        values["id"] = int(item["id"])
+    except (KeyError, TypeError, ValueError):
+        errors["id"] = "Required integer"
+
+    for key, (column, cast, _) in fields.items():
+        value = item.get(key)
+        if value is None:
+            values[column] = None
+            continue
+        try:
+            value = _parse_bool(value) if cast is bool else cast(value)
+        except (TypeError, ValueError, OverflowError):
+            errors[key] = f"Not a valid {cast.__name__}"
+            continue
+        if cast is float and not math.isfinite(value):
+            errors[key] = "Must be a finite number"
+            continue
+        if cast is not bool and value < 0:
+            errors[key] = "Must not be negative"
+        values[column] = value
+    if not errors and all(values[column] is None for column, _, _ in fields.values()):
+        errors["item"] = f"Nothing to update, expected one of {list(fields)}"
+
+    values["expected"] = None
+    if item.get("updatedAt") is not None:
+        try:
+            values["expected"] = datetime.fromisoformat(str(item["updatedAt"]))
+        except ValueError:
+            errors["updatedAt"] = "Not an ISO 8601 timestamp"
+    return values, errors
+
+
+# Restricts a bulk patch to the rows of the businesses an owner has.
+OWNED_ROWS = "business_id IN (SELECT id FROM m_business WHERE user_id = :owner_id)"
+
+
+def _update_statement(model, fields, rows, owned=False):
+    """
+    Build one UPDATE ... FROM (VALUES ...) for a chunk of rows, only over the
+    rows of ``:owner_id``'s businesses when owned.
+    Values are cast so columns that are NULL in every row keep their type.
+    A NULL value keeps the current column value. updatedAt matches at the
+    precision it was given, so whole-second timestamps from the read endpoints
+    work as well as the exact ones this endpoint returns.
+    """
+    columns = [column for column, _, _ in fields.values()]
+    types = ["integer"] + [sql_type for _, _, sql_type in fields.values()]
+    tuples = []
+    for i in range(rows):
+        casts = [
+            f"CAST(:{name}_{i} AS {sql_type})"
+            for name, sql_type in zip(["id"] + columns, types)
+        ]
+        casts.append(f"CAST(:expected_{i} AS timestamp)")
+        tuples.append(f"({', '.join(casts)})")
+    assignments = ", ".join(f"{c} = COALESCE(v.{c}, t.{c})" for c in columns)
+    return text(f"""
+        UPDATE {model.__tablename__} t
+        SET {assignments}, updated_at = now()
+        FROM (VALUES {', '.join(tuples)}) AS v (id, {', '.join(columns)}, expected)
+        WHERE t.id = v.id
+            AND (v.expected IS NULL OR date_trunc(
+                CASE WHEN v.expected = date_trunc('second', v.expected)
+                    THEN 'second' ELSE 'microseconds' END,
+                t.updated_at
+            ) = v.expected)
+            {f"AND t.{OWNED_ROWS}" if owned else ""}
+        RETURNING t.id, t.updated_at
+        """)
+
+
+def bulk_patch(model, items, owner_id=None):
+    """
+    Apply price/stock changes to many rows of model in one transaction,
+    with one UPDATE per BULK_PATCH_CHUNK rows. Items carrying ``updatedAt``
+    are only applied when the row has not changed since.
+    :param model: Product or Food.
+    :param items: List of dicts with an ``id`` and the fields to set.
+    :param owner_id: When set, rows of other users' businesses are left
+        alone and reported as not found.
+    :return: Summary dict with counts and one result per item, in order.
+    """
+    fields = BULK_FIELDS[model]
+    chunk = current_app.config["BULK_PATCH_CHUNK"]
+    results = [None] * len(items)
+    valid = []
+    seen = {}
+    for index, item in enumerate(items):
+        values, errors = _validate(item, fields)
+        if not errors:
+            first = seen.setdefault(values["id"], index)
+            if first != index:
+                errors["id"] = f"Duplicate of item {first}"
+        if errors:
+            results[index] = {"index": index, "status": "invalid", "errors": errors}
+        else:
+            valid.append((index, values))
+
+    updated = {}
+    try:
+        for start in range(0, len(valid), chunk):
+            batch = valid[start : start + chunk]
+            params = {
+                f"{name}_{i}": value
+                for i, (_, values) in enumerate(batch)
+                for name, value in values.items()
+            }
+            params["owner_id"] = owner_id
+            rows = db.session.execute(
+                _update_statement(model, fields, len(batch), owner_id is not None),
+                params,
+            )
+            updated.update({id: updated_at for id, updated_at in rows})
+
+        missed = [values["id"] for _, values in valid if values["id"] not in updated]
+        current = {}
+        if missed:
+            current = dict(
+                db.session.execute(
+                    text(
+                        f"SELECT id, updated_at FROM {model.__tablename__} "
+                        "WHERE id IN :ids"
+                        + (f" AND {OWNED_ROWS}" if owner_id is not None else "")
+                    ).bindparams(bindparam("ids", expanding=True)),
+                    {"ids": missed, "owner_id": owner_id},
+                ).all()
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for index, values in valid:
+        id = values["id"]
+        if id in updated:
+            result = {"status": "updated", "updatedAt": updated[id].isoformat()}
+        elif id in current:
+            result = {"status": "conflict", "updatedAt": current[id].isoformat()}
+        else:
+            result = {"status": "not_found"}
+        results[index] = {"index": index, "id": id, **result}
+
+    if updated:
+        invalidate_facets(model)
+        if model is Product:
+            top_products_refresher.mark_dirty()
+    counts = {"updated": 0, "conflict": 0, "not_found": 0, "invalid": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {
+        "rows": len(items),
+        "updated": counts["updated"],
+        "conflicts": counts["conflict"],
+        "not_found": counts["not_found"],
+        "invalid": counts["invalid"],
+        "results": results,
+    }
+
+
+# Takes the units only when enough are left, in the same statement that
+# records the hold, so concurrent buyers can never oversell.
+RESERVE_STOCK = text("""
+    WITH taken AS (
+        UPDATE products
+        SET stock = stock - :quantity, updated_at = now()
+        WHERE id = :product_id AND stock >= :quantity
+        RETURNING id
+    )
+    INSERT INTO stock_reservations
+        (product_id, user_id, quantity, status, expires_at)
+    SELECT id, :user_id, :quantity, 'held', now() + make_interval(secs => :ttl)
+    FROM taken
+    RETURNING id
+    """)
+COMMIT_RESERVATION = text("""
+    UPDATE stock_reservations
+    SET status = 'committed', updated_at = now()
+    WHERE id = :id AND user_id = :user_id AND status = 'held'
+        AND expires_at > now()
+    RETURNING id
+    """)
+RELEASE_RESERVATION = text("""
+    WITH released AS (
+        UPDATE stock_reservations
+        SET status = 'released', updated_at = now()
+        WHERE id = :id AND user_id = :user_id AND status = 'held'
+        RETURNING product_id, quantity
+    )
+    UPDATE products p
+    SET stock = p.stock + r.quantity, updated_at = now()
+    FROM released r
+    WHERE p.id = r.product_id
+    RETURNING p.id
+    """)
+SWEEP_RESERVATIONS = text("""
+    WITH expired AS (
+        UPDATE stock_reservations
+        SET status = 'expired', updated_at = now()
+        WHERE id IN (
+            SELECT id FROM stock_reservations
+            WHERE status = 'held' AND expires_at <= now()
+            ORDER BY expires_at
+            LIMIT :limit
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING product_id, quantity
+    ), restocked AS (
+        UPDATE products p
+        SET stock = p.stock + e.quantity, updated_at = now()
+        FROM (
+            SELECT product_id, sum(quantity) AS quantity
+            FROM expired GROUP BY product_id
+        ) e
+        WHERE p.id = e.product_id
+    )
+    SELECT count(*) FROM expired
+    """)
+
+
+class ReservationError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _reservation_error(reservation_id, user_id):
+    reservation = db.session.get(StockReservation, reservation_id)
+    if reservation is None or reservation.user_id != user_id:
+        return ReservationError("Reservation not found", 404)
+    status = "expired" if reservation.status == "held" else reservation.status
+    return ReservationError(f"Reservation is {status}", 409)
+
+
+def reserve_stock(product_id, quantity, user_id, ttl):
+    """
+    Hold units of a product for ttl seconds.
+    :return: The StockReservation.
+    :raises ReservationError: When the product is missing or short of stock.
+    """
+    reservation_id = db.session.execute(
+        RESERVE_STOCK,
+        {
+            "product_id": product_id,
+            "quantity": quantity,
+            "user_id": user_id,
+            "ttl": ttl,
+        },
+    ).scalar()
+    db.session.commit()
+    if reservation_id is None:
+        stock = db.session.execute(
+            text("SELECT stock FROM products WHERE id = :id"), {"id": product_id}
+        ).scalar()
+        if stock is None:
+            raise ReservationError("Product not found", 404)
+        raise ReservationError(f"Only {stock} left in stock", 409)
+    return db.session.get(StockReservation, reservation_id)
+
+
+def commit_reservation(reservation_id, user_id):
+    """
+    Keep the held units sold.
+    :raises ReservationError: When the reservation is not held by user_id.
+    """
+    committed = db.session.execute(
+        COMMIT_RESERVATION, {"id": reservation_id, "user_id": user_id}
+    ).scalar()
+    db.session.commit()
+    if committed is None:
+        raise _reservation_error(reservation_id, user_id)
+    return db.session.get(StockReservation, reservation_id)
+
+
+def release_reservation(reservation_id, user_id):
+    """
+    Put the held units back in stock.
+    :raises ReservationError: When the reservation is not held by user_id.
+    """
+    released = db.session.execute(
+        RELEASE_RESERVATION, {"id": reservation_id, "user_id": user_id}
+    ).scalar()
+    db.session.commit()
+    if released is None:
+        raise _reservation_error(reservation_id, user_id)
+    return db.session.get(StockReservation, reservation_id)
+
+
+class ReservationSweeper:
+    """
+    Returns the units of expired reservations to stock from a background
+    thread, every ``interval`` seconds. A transaction-scoped advisory lock
+    keeps workers from sweeping at once.
+    """
+
+    lock_key = zlib.crc32(b"stock_reservations")
+
+    def __init__(self, interval=15.0, batch_size=1000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def sweep(self):
+        """
+        Expire one batch of overdue reservations.
+        :return: Number of reservations expired, 0 when another worker holds
+            the lock.
+        """
+        with db.engine.begin() as conn:
+            locked = conn.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": self.lock_key}
+            ).scalar()
+            if not locked:
+                return 0
+            return conn.execute(SWEEP_RESERVATIONS, {"limit": self.batch_size}).scalar()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.interval)
+            with app.app_context():
+                try:
+                    while self.sweep() == self.batch_size:
+                        pass
+                except Exception as e:
+                    app.logger.error(f"Sweeping stock reservations failed: {e}")
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(app,), name="reservation-sweeper"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+
+reservation_sweeper = ReservationSweeper()
+
+
+def init_inventory(app):
+    """Start sweeping expired stock reservations with the first request."""
+    reservation_sweeper.interval = app.config["RESERVATION_SWEEP_INTERVAL"]
+
+    @app.before_request
+    def start_reservation_sweeper():
+        if not reservation_sweeper.started:
+            reservation_sweeper.start(app)
@@ -0,0 +1,542 @@
+import hashlib
+import os
+import socket
+import threading
+import uuid
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import click
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, text, update
+from werkzeug.utils import secure_filename
+
+from cache import reference_cache
+from config import app, db
+from models import (
+    Accommodation,
+    EntityMedia,
+    EntityMediaType,
+    Food,
+    MediaBlob,
+    Product,
+    Property,
+)
+from rankings import top_products_refresher
+from replica import use_primary
+from storage import STORAGE_TYPES, get_storage
+
+# url is None while the file only exists in the local spool.
+StagedMedia = namedtuple(
+    "StagedMedia", ["blob_name", "url", "spool_path", "content_hash", "size"]
+)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Shared by all requests of a worker, so concurrent uploads stay bounded.
+_executor = ThreadPoolExecutor(
+    max_workers=app.config["MEDIA_UPLOAD_WORKERS"], thread_name_prefix="media-upload"
+)
+HOSTNAME = socket.gethostname()
+MEDIA_OWNERS = {
+    "accommodation": Accommodation,
+    "food": Food,
+    "product": Product,
+    "property": Property,
+}
+
+# Spool files live on local disk, so a worker only claims rows of its own host.
+CLAIM_PENDING = text("""
+    UPDATE entity_media
+    SET attempts = attempts + 1, updated_at = now()
+    WHERE id IN (
+        SELECT id FROM entity_media
+        WHERE status = 'pending' AND spool_host = :host
+            AND (attempts = 0 OR updated_at < now() - make_interval(secs => :retry))
+        ORDER BY id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, entity_id, entity_type_id, blob_name, spool_path, content_hash,
+        size, attempts
+    """)
+# Registers a stored blob, or adds references to one that is already known.
+REGISTER_BLOB = text("""
+    INSERT INTO media_blobs
+        (storage_type, content_hash, blob_name, url, size, ref_count)
+    VALUES (:storage_type, :content_hash, :blob_name, :url, :size, :refs)
+    ON CONFLICT (storage_type, content_hash) DO UPDATE
+    SET ref_count = media_blobs.ref_count + EXCLUDED.ref_count, updated_at = now()
+    """)
+# Looking a blob up restarts its grace period, so collect_media() leaves it
+# alone until the media rows referencing it are committed.
+TOUCH_BLOBS = text("""
+    UPDATE media_blobs SET updated_at = now()
+    WHERE id IN (
+        SELECT id FROM media_blobs
+        WHERE storage_type = :storage_type AND content_hash IN :hashes
+        ORDER BY content_hash
+        FOR UPDATE
+    )
+    RETURNING content_hash, blob_name, url
+    """).bindparams(bindparam("hashes", expanding=True))
+COLLECT_BLOBS = text("""
+    SELECT id, blob_name FROM media_blobs
+    WHERE ref_count <= 0 AND storage_type = :storage_type
+        AND updated_at < now() - make_interval(secs => :grace)
+    ORDER BY updated_at
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+    """)
+
+
+class MediaUploadError(Exception):
+    def __init__(self, filename):
+        super().__init__(f"Failed to upload media file: {filename}")
+        self.filename = filename
+
+
+def _storage_type():
+    return STORAGE_TYPES[current_app.config["MEDIA_STORAGE"]]
+
+
+def _content_blob_name(content_hash, filename):
+    extension = os.path.splitext(secure_filename(filename))[1].lower()
+    return f"sha256/{content_hash[:2]}/{content_hash}{extension}"
+
+
+def _hash_stream(stream, copy_to=None):
+    """
+    Read a stream to the end, hashing it and optionally copying it.
+    :return: Tuple of (sha256 hex digest, size in bytes).
+    """
+    digest, size = hashlib.sha256(), 0
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+        if copy_to is not None:
+            copy_to.write(chunk)
+    return digest.hexdigest(), size
+
+
+def stored_blobs(hashes):
+    """
+    Look up content that is already in the configured storage, and commit
+    restarting the grace period of the blobs found so they are not collected
+    before the caller references them.
+    :return: Dict of content hash to (blob_name, url).
+    """
+    if not hashes:
+        return {}
+    use_primary()
+    rows = db.session.execute(
+        TOUCH_BLOBS, {"storage_type": _storage_type(), "hashes": sorted(set(hashes))}
+    ).all()
+    db.session.commit()
+    return {content_hash: (blob_name, url) for content_hash, blob_name, url in rows}
+
+
+def _register(staged, refs):
+    """
+    Upsert media_blobs rows for staged files, adding refs[content_hash]
+    references to each. Rows are written in hash order so concurrent
+    transactions lock them in the same order.
+    """
+    storage_type = _storage_type()
+    rows = {media.content_hash: media for media in staged}
+    db.session.execute(
+        REGISTER_BLOB,
+        [
+            {
+                "storage_type": storage_type,
+                "content_hash": content_hash,
+                "blob_name": media.blob_name,
+                "url": media.url,
+                "size": media.size,
+                "refs": refs.get(content_hash, 0),
+            }
+            for content_hash, media in sorted(rows.items())
+        ],
+    )
+
+
+def upload_media(files):
+    """
+    Upload request files to blob storage concurrently, named by content hash.
+    Files whose bytes are already stored, or repeated within the request, are
+    not uploaded again. The session is closed before uploading so no
+    connection or transaction is held while the uploads run.
+    :param files: Werkzeug FileStorage objects.
+    :return: List of StagedMedia in the order of files.
+    :raises MediaUploadError: When an upload fails or times out.
+    """
+    hashed = []
+    for file_obj in files:
+        content_hash, size = _hash_stream(file_obj.stream)
+        file_obj.stream.seek(0)
+        hashed.append((file_obj, content_hash, size))
+    known = stored_blobs([content_hash for _, content_hash, _ in hashed])
+    db.session.close()
+
+    storage = get_storage()
+    staged = {
+        content_hash: StagedMedia(blob_name, url, None, content_hash, None)
+        for content_hash, (blob_name, url) in known.items()
+    }
+    futures = {}
+    for file_obj, content_hash, size in hashed:
+        if content_hash in staged:
+            continue
+        blob_name = _content_blob_name(content_hash, file_obj.filename)
+        staged[content_hash] = StagedMedia(blob_name, None, None, content_hash, size)
+        future = _executor.submit(storage.upload_fileobj, file_obj.stream, blob_name)
+        futures[future] = (content_hash, file_obj.filename)
+
+    done, pending = wait(futures, timeout=current_app.config["MEDIA_UPLOAD_TIMEOUT"])
+    uploaded, failed = [], None
+    for future, (content_hash, filename) in futures.items():
+        media = staged[content_hash]
+        if future in done and future.exception() is None:
+            staged[content_hash] = media._replace(url=future.result())
+            uploaded.append(staged[content_hash])
+        elif failed is None:
+            failed = filename
+            error = future.exception() if future in done else "timed out"
+            current_app.logger.error(f"Upload of {media.blob_name} failed: {error}")
+    if uploaded:
+        # Registered without references: collect-media removes them if the
+        # request fails, and concurrent uploads of the same bytes share them.
+        _register(uploaded, {})
+        db.session.commit()
+    if failed is not None:
+        # Uploads still running are left to finish; being named by content,
+        # their blobs are overwritten by the next upload of the same bytes.
+        for future in pending:
+            future.cancel()
+        raise MediaUploadError(failed)
+    return [staged[content_hash] for _, content_hash, _ in hashed]
+
+
+def spool_media(files):
+    """
+    Save request files to the local spool for the ingest worker to upload,
+    hashing them as they are written. Files whose bytes are already stored
+    are not spooled.
+    :param files: Werkzeug FileStorage objects.
+    :return: List of StagedMedia in the order of files.
+    :raises MediaUploadError: When a file cannot be written.
+    """
+    spool_dir = Path(current_app.config["MEDIA_SPOOL_DIR"])
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    spooled = []
+    for file_obj in files:
+        path = spool_dir / uuid.uuid4().hex
+        try:
+            with open(path, "wb") as spool:
+                content_hash, size = _hash_stream(file_obj.stream, spool)
+        except OSError as e:
+            current_app.logger.error(f"Spooling {file_obj.filename} failed: {e}")
+            discard_media(spooled + [StagedMedia(None, None, str(path), None, None)])
+            raise MediaUploadError(file_obj.filename)
+        blob_name = _content_blob_name(content_hash, file_obj.filename)
+        spooled.append(StagedMedia(blob_name, None, str(path), content_hash, size))
+
+    known = stored_blobs([media.content_hash for media in spooled])
+    staged = []
+    for media in spooled:
+        if media.content_hash in known:
+            discard_media([media])
+            blob_name, url = known[media.content_hash]
+            media = media._replace(blob_name=blob_name, url=url, spool_path=None)
+        staged.append(media)
+    return staged
+
+
+def stage_media(files):
+    """
+    Upload files now, or spool them when MEDIA_ASYNC_INGEST is on.
+    :return: List of StagedMedia for attach_media().
+    """
+    if current_app.config["MEDIA_ASYNC_INGEST"]:
+        return spool_media(files)
+    return upload_media(files)
+
+
+def discard_media(staged):
+    """
+    Remove the spooled files of staged media, used to compensate when the
+    database write fails. Uploaded blobs stay registered without references
+    for collect-media, since other entities may share them. Failures are
+    logged, not raised.
+    """
+    for media in staged:
+        if not media.spool_path:
+            continue
+        try:
+            os.remove(media.spool_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            current_app.logger.error(f"Removing {media.spool_path} failed: {e}")
+
+
+def attach_media(entity_id, entity_type_id, staged):
+    """
+    Add EntityMedia rows for staged files to the session and count their
+    references to the stored blobs. Spooled files get a pending row that the
+    ingest worker completes.
+    """
+    storage_type = _storage_type()
+    refs = Counter()
+    for media in staged:
+        db.session.add(
+            EntityMedia(
+                entity_id=entity_id,
+                entity_type_id=entity_type_id,
+                url=media.url,
+                storage_type=storage_type,
+                status="pending" if media.spool_path else "ready",
+                blob_name=media.blob_name,
+                spool_path=media.spool_path,
+                spool_host=HOSTNAME if media.spool_path else None,
+                content_hash=media.content_hash,
+                size=media.size,
+            )
+        )
+        if not media.spool_path:
+            refs[media.content_hash] += 1
+    if refs:
+        _register([media for media in staged if not media.spool_path], refs)
+
+
+def collect_media(grace_seconds, limit=500):
+    """
+    Delete stored blobs that no media row has referenced for grace_seconds.
+    The grace period covers uploads whose rows are not committed yet. Files
+    are deleted while their rows are still locked, so a concurrent lookup
+    of the same content waits and then uploads it again.
+    :return: Number of blobs deleted.
+    """
+    rows = db.session.execute(
+        COLLECT_BLOBS,
+        {"storage_type": _storage_type(), "grace": grace_seconds, "limit": limit},
+    ).all()
+    storage = get_storage()
+    deleted = []
+    for id, blob_name in rows:
+        try:
+            storage.delete_blob(blob_name)
+            deleted.append(id)
+        except Exception as e:
+            current_app.logger.error(f"Deleting {blob_name} failed: {e}")
+    if deleted:
+        db.session.execute(delete(MediaBlob).where(MediaBlob.id.in_(deleted)))
+    db.session.commit()
+    return len(deleted)
+
+
+def queue_ingest(staged):
+    """
+    Wake the ingest worker once the pending rows are committed.
+    :return: True when some files are still to be uploaded.
+    """
+    pending = any(media.spool_path for media in staged)
+    if pending:
+        ingest_worker.wake()
+    return pending
+
+
+class MediaIngestWorker:
+    """
+    Uploads spooled files from a background thread and marks their rows ready.
+    Rows are claimed with FOR UPDATE SKIP LOCKED so several workers on a host
+    share the spool. A failed upload is retried after ``retry_delay`` seconds,
+    up to ``max_attempts`` times, before the row is marked failed.
+    """
+
+    def __init__(self, batch_size=8, poll_interval=5.0, retry_delay=30.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = 5
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def wake(self):
+        self._wake.set()
+
+    def _claim(self):
+        rows = db.session.execute(
+            CLAIM_PENDING,
+            {"host": HOSTNAME, "retry": self.retry_delay, "limit": self.batch_size},
+        ).all()
+        db.session.commit()
+        return rows
+
+    def _upload(self, storage, row):
+        with open(row.spool_path, "rb") as spooled:
+            return storage.upload_fileobj(spooled, row.blob_name)
+
+    def _finish(self, row, blob_name, url):
+        db.session.execute(
+            text("""
+                UPDATE entity_media
+                SET status = 'ready', blob_name = :blob_name, url = :url,
+                    spool_path = NULL, spool_host = NULL, updated_at = now()
+                WHERE id = :id
+                """),
+            {"id": row.id, "blob_name": blob_name, "url": url},
+        )
+        entity_type = reference_cache.by_id(EntityMediaType, row.entity_type_id)
+        model = MEDIA_OWNERS.get(entity_type.name) if entity_type else None
+        if model is None:
+            return
+        # Touch the owner so its ETag changes now that the media is listed.
+        values = {"updated_at": func.now()}
+        if model is Product:
+            # Products created while their image was spooled get it now.
+            values["image_url"] = func.coalesce(Product.image_url, url)
+        db.session.execute(
+            update(model).where(model.id == row.entity_id).values(**values)
+        )
+        if model is Product:
+            top_products_refresher.mark_dirty()
+
+    def _fail(self, row, error):
+        """
+        Log a failed upload; after the last attempt mark the row failed.
+        :return: True when the row failed for good and its spool file can go.
+        """
+        current_app.logger.error(f"Ingesting {row.blob_name} failed: {error}")
+        if row.attempts < self.max_attempts:
+            return False
+        db.session.execute(
+            text("""
+                UPDATE entity_media
+                SET status = 'failed', spool_path = NULL, spool_host = NULL
+                WHERE id = :id
+                """),
+            {"id": row.id},
+        )
+        return True
+
+    def run_once(self):
+        """
+        Claim and upload one batch of pending media.
+        :return: Number of rows claimed.
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+        # Content already in storage, or repeated in the batch, is uploaded once.
+        known = stored_blobs([row.content_hash for row in rows if row.content_hash])
+        storage = get_storage()
+        uploads = {}
+        for row in rows:
+            key = row.content_hash or row.blob_name
+            if row.content_hash not in known and key not in uploads:
+                uploads[key] = (
+                    row.blob_name,
+                    _executor.submit(self._upload, storage, row),
+                )
+        wait([future for _, future in uploads.values()])
+
+        finished, failed, refs = [], [], Counter()
+        for row in rows:
+            if row.content_hash in known:
+                blob_name, url = known[row.content_hash]
+            else:
+                blob_name, future = uploads[row.content_hash or row.blob_name]
+                if future.exception() is not None:
+                    if self._fail(row, future.exception()):
+                        failed.append(
+                            StagedMedia(row.blob_name, None, row.spool_path, None, None)
+                        )
+                    continue
+                url = future.result()
+            self._finish(row, blob_name, url)
+            finished.append(
+                StagedMedia(blob_name, url, row.spool_path, row.content_hash, row.size)
+            )
+            if row.content_hash:
+                refs[row.content_hash] += 1
+        if refs:
+            _register([media for media in finished if media.content_hash], refs)
+        db.session.commit()
+        discard_media(finished + failed)
+        return len(rows)
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    while self.run_once() == self.batch_size:
+                        pass
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Media ingest failed: {e}")
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, args=(app,), name="media-ingest"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+
+ingest_worker = MediaIngestWorker()
+
+
+def init_media_ingest(app):
+    """
+    Start the ingest worker with the first request of each worker when
+    MEDIA_ASYNC_INGEST is on, and register ``flask ingest-media`` and
+    ``flask collect-media``.
+    """
+    ingest_worker.batch_size = app.config["MEDIA_UPLOAD_WORKERS"]
+    ingest_worker.poll_interval = app.config["MEDIA_INGEST_POLL_INTERVAL"]
+    ingest_worker.retry_delay = app.config["MEDIA_INGEST_RETRY_DELAY"]
+    ingest_worker.max_attempts = app.config["MEDIA_INGEST_MAX_ATTEMPTS"]
+
+    @app.before_request
+    def start_ingest_worker():
+        if app.config["MEDIA_ASYNC_INGEST"] and not ingest_worker.started:
+            ingest_worker.start(app)
+
+    @app.cli.command("ingest-media")
+    def ingest_media_command():
+        """Upload the media files spooled on this host."""
+        total = 0
+        while True:
+            claimed = ingest_worker.run_once()
+            total += claimed
+            if claimed < ingest_worker.batch_size:
+                break
+        click.echo(f"{total} media files processed")
+
+    @app.cli.command("collect-media")
+    @click.option(
+        "--grace",
+        type=float,
+        default=app.config["MEDIA_COLLECT_GRACE"],
+        show_default=True,
+        help="Seconds a blob must have been unreferenced.",
+    )
+    def collect_media_command(grace):
+        """Delete stored media files that nothing references."""
+        total = 0
+        while True:
+            deleted = collect_media(grace)
+            total += deleted
+            if not deleted:
+                break
+        click.echo(f"{total} unreferenced media files deleted")
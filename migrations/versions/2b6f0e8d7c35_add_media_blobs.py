@@ -0,0 +1,45 @@
+"""Store media blobs once per content hash
+
+Revision ID: 2b6f0e8d7c35
+Revises: e7a2c94b3f58
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "2b6f0e8d7c35"
+down_revision = "e7a2c94b3f58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS media_blobs (
+            id serial PRIMARY KEY,
+            storage_type integer NOT NULL,
+            content_hash varchar(64) NOT NULL,
+            blob_name varchar(512) NOT NULL,
+            url varchar(512) NOT NULL,
+            size bigint,
+            ref_count integer NOT NULL DEFAULT 0,
+            created_at timestamp DEFAULT now(),
+            updated_at timestamp DEFAULT now(),
+            CONSTRAINT uq_media_blobs_storage_hash UNIQUE (storage_type, content_hash)
+        )
+        """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_media_blobs_unreferenced "
+        "ON media_blobs (updated_at) WHERE ref_count <= 0"
+    )
+    op.execute(
+        "ALTER TABLE entity_media ADD COLUMN IF NOT EXISTS content_hash varchar(64)"
+    )
+
+
+def downgrade():
+    op.execute("ALTER TABLE entity_media DROP COLUMN IF EXISTS content_hash")
+    op.execute("DROP TABLE IF EXISTS media_blobs")
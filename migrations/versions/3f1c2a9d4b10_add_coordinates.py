@@ -0,0 +1,58 @@
+"""Add latitude/longitude and earthdistance indexes
+
+Revision ID: 3f1c2a9d4b10
+Revises:
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a9d4b10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# db.create_all() may already have created the columns on a fresh database.
+TABLES = ("property", "accomodation", "m_business")
+
+
+def upgrade():
+    for table in TABLES:
+        op.execute(
+            f"ALTER TABLE {table} "
+            "ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION, "
+            "ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION"
+        )
+
+    # Without earthdistance the API falls back to an in-process k-d tree.
+    available = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 1 FROM pg_available_extensions WHERE name = 'earthdistance'"
+            )
+        )
+        .scalar()
+    )
+    if not available:
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+    op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+    for table in TABLES:
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_earth ON {table} "
+            "USING gist (ll_to_earth(latitude, longitude)) "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+        )
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_earth")
+        op.execute(
+            f"ALTER TABLE {table} "
+            "DROP COLUMN IF EXISTS latitude, DROP COLUMN IF EXISTS longitude"
+        )
@@ -0,0 +1,27 @@
+"""Index products on (business_id, name) for bulk import merges
+
+Revision ID: 5d3b8f27a9e1
+Revises: c4a9e61f0d27
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5d3b8f27a9e1"
+down_revision = "c4a9e61f0d27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_products_business_name "
+        "ON products (business_id, name)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_products_business_name")
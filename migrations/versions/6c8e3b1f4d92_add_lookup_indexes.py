@@ -0,0 +1,44 @@
+"""Index the name, foreign key and media lookups of the hot handlers
+
+Revision ID: 6c8e3b1f4d92
+Revises: 9a41d6c2e8f3
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "6c8e3b1f4d92"
+down_revision = "9a41d6c2e8f3"
+branch_labels = None
+depends_on = None
+
+# products.business_id and accomodation.room_type_id are already the leading
+# columns of ix_products_business_name and ix_accomodation_room_type_price.
+INDEXES = {
+    "ix_m_business_name": "m_business (name)",
+    "ix_m_business_user_id": "m_business (user_id)",
+    "ix_categories_name": "categories (name)",
+    "ix_products_category_id": "products (category_id)",
+    "ix_food_business_id": "food (business_id)",
+    "ix_food_category_id": "food (category_id)",
+    "ix_food_available_category": "food (category_id) WHERE is_available",
+    "ix_property_business_id": "property (business_id)",
+    "ix_accomodation_business_id": "accomodation (business_id)",
+    "ix_entity_media_entity": "entity_media (entity_id, entity_type_id)",
+}
+
+
+def upgrade():
+    # Build without blocking writes; CONCURRENTLY cannot run in a transaction.
+    with op.get_context().autocommit_block():
+        for name, target in INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
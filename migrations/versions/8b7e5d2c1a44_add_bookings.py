@@ -0,0 +1,61 @@
+"""Add bookings with an overlap exclusion constraint
+
+Revision ID: 8b7e5d2c1a44
+Revises: 3f1c2a9d4b10
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "8b7e5d2c1a44"
+down_revision = "3f1c2a9d4b10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    # db.create_all() may already have created the table on a fresh database.
+    if not sa.inspect(op.get_bind()).has_table("bookings"):
+        op.create_table(
+            "bookings",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column(
+                "accommodation_id",
+                sa.Integer(),
+                sa.ForeignKey(
+                    "accomodation.id",
+                    name="fk_bookings_accommodation_id_accomodation",
+                ),
+                nullable=False,
+            ),
+            sa.Column(
+                "user_id",
+                sa.String(255),
+                sa.ForeignKey("app_users.id", name="fk_bookings_user_id_app_users"),
+            ),
+            sa.Column("period", postgresql.TSTZRANGE(), nullable=False),
+            sa.Column("status", sa.String(255), nullable=False),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+            postgresql.ExcludeConstraint(
+                ("accommodation_id", "="),
+                ("period", "&&"),
+                name="bookings_no_overlap",
+                using="gist",
+                where=sa.text("status <> 'cancelled'"),
+            ),
+        )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_accomodation_room_type_price "
+        "ON accomodation (room_type_id, price)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_accomodation_room_type_price")
+    op.drop_table("bookings")
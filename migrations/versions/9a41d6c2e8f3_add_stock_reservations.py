@@ -0,0 +1,39 @@
+"""Add stock reservations for checkout
+
+Revision ID: 9a41d6c2e8f3
+Revises: 2b6f0e8d7c35
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9a41d6c2e8f3"
+down_revision = "2b6f0e8d7c35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            id serial PRIMARY KEY,
+            product_id integer NOT NULL REFERENCES products (id),
+            user_id varchar(255) REFERENCES app_users (id),
+            quantity integer NOT NULL,
+            status varchar(16) NOT NULL,
+            expires_at timestamp NOT NULL,
+            created_at timestamp DEFAULT now(),
+            updated_at timestamp DEFAULT now()
+        )
+        """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_stock_reservations_held_expiry "
+        "ON stock_reservations (expires_at) WHERE status = 'held'"
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS stock_reservations")
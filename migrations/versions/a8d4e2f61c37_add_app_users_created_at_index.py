@@ -0,0 +1,30 @@
+"""Index app_users.created_at for the username availability filter
+
+Revision ID: a8d4e2f61c37
+Revises: f3d91a7c5b20
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "a8d4e2f61c37"
+down_revision = "f3d91a7c5b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Build without blocking signups; CONCURRENTLY cannot run in a transaction.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_app_users_created_at "
+            "ON app_users (created_at)"
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_app_users_created_at")
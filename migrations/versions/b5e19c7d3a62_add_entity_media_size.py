@@ -0,0 +1,24 @@
+"""Record the size of spooled media files
+
+Revision ID: b5e19c7d3a62
+Revises: a8d4e2f61c37
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b5e19c7d3a62"
+down_revision = "a8d4e2f61c37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE entity_media ADD COLUMN IF NOT EXISTS size bigint")
+
+
+def downgrade():
+    op.execute("ALTER TABLE entity_media DROP COLUMN IF EXISTS size")
@@ -0,0 +1,61 @@
+"""Add the top_products materialized view
+
+Revision ID: c4a9e61f0d27
+Revises: 8b7e5d2c1a44
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c4a9e61f0d27"
+down_revision = "8b7e5d2c1a44"
+branch_labels = None
+depends_on = None
+
+DEPTH = 50
+
+
+def upgrade():
+    op.execute(f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS top_products AS
+    SELECT * FROM (
+        SELECT p.id, p.business_id, p.category_id, c.name AS category_name,
+            p.name, p.description, p.price, p.rating, p.image_url,
+            row_number() OVER (
+                PARTITION BY p.category_id ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS category_rank,
+            row_number() OVER (
+                PARTITION BY p.business_id ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS business_rank,
+            row_number() OVER (
+                ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS overall_rank
+        FROM products p LEFT JOIN categories c ON c.id = p.category_id
+    ) ranked
+    WHERE category_rank <= {DEPTH}
+        OR business_rank <= {DEPTH}
+        OR overall_rank <= {DEPTH}
+    """)
+    # The unique index is what allows REFRESH ... CONCURRENTLY.
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_top_products_id ON top_products (id)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_top_products_overall "
+        "ON top_products (overall_rank)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_top_products_category "
+        "ON top_products (category_id, category_rank)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_top_products_business "
+        "ON top_products (business_id, business_rank)"
+    )
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS top_products")
@@ -0,0 +1,34 @@
+"""Keep the lookup tables' version in a single seeded row
+
+Revision ID: d2c7a5e91b48
+Revises: b5e19c7d3a62
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d2c7a5e91b48"
+down_revision = "b5e19c7d3a62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS reference_versions (
+            id integer PRIMARY KEY,
+            version integer NOT NULL DEFAULT 0,
+            updated_at timestamp DEFAULT now()
+        )
+        """)
+    op.execute(
+        "INSERT INTO reference_versions (id, version) VALUES (1, 0) "
+        "ON CONFLICT (id) DO NOTHING"
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS reference_versions")
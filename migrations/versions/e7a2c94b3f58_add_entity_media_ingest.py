@@ -0,0 +1,43 @@
+"""Track asynchronous media ingestion on entity_media
+
+Revision ID: e7a2c94b3f58
+Revises: 5d3b8f27a9e1
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e7a2c94b3f58"
+down_revision = "5d3b8f27a9e1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE entity_media
+            ADD COLUMN IF NOT EXISTS status varchar(16) NOT NULL DEFAULT 'ready',
+            ADD COLUMN IF NOT EXISTS blob_name varchar(512),
+            ADD COLUMN IF NOT EXISTS spool_path varchar(512),
+            ADD COLUMN IF NOT EXISTS spool_host varchar(255),
+            ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0
+        """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_entity_media_pending "
+        "ON entity_media (spool_host, id) WHERE status = 'pending'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_entity_media_pending")
+    op.execute("""
+        ALTER TABLE entity_media
+            DROP COLUMN IF EXISTS attempts,
+            DROP COLUMN IF EXISTS spool_host,
+            DROP COLUMN IF EXISTS spool_path,
+            DROP COLUMN IF EXISTS blob_name,
+            DROP COLUMN IF EXISTS status
+        """)
@@ -0,0 +1,40 @@
+"""Keep revoked JWTs in a table shared by all workers
+
+Revision ID: f3d91a7c5b20
+Revises: 6c8e3b1f4d92
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f3d91a7c5b20"
+down_revision = "6c8e3b1f4d92"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti varchar(64) PRIMARY KEY,
+            token_type varchar(16) NOT NULL,
+            user_id varchar(255),
+            expires_at timestamp NOT NULL,
+            created_at timestamp NOT NULL DEFAULT now()
+        )
+        """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_revoked_tokens_created_at "
+        "ON revoked_tokens (created_at)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at "
+        "ON revoked_tokens (expires_at)"
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS revoked_tokens")
@@ -1,7 +1,9 @@
+from sqlalchemy import DDL, event, text
+from sqlalchemy.dialects.postgresql import TSTZRANGE, ExcludeConstraint
 from sqlalchemy.sql import func
 from sqlalchemy_serializer import SerializerMixin
-from werkzeug.security import check_password_hash, generate_password_hash
 from config import db
+from passwords import password_hasher
 import enum
 
 
@@ -34,6 +36,8 @@ class UserType(db.Model, SerializerMixin):
 
 class User(db.Model, SerializerMixin):
     __tablename__ = "app_users"
+    # New signups are read by created_at to keep availability.py in sync.
+    __table_args__ = (db.Index("ix_app_users_created_at", "created_at"),)
     serialize_only = (
         "id",
         "first_name",
@@ -46,6 +50,7 @@ class User(db.Model, SerializerMixin):
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"user_type": "type"}
 
     id = db.Column(db.String(255), primary_key=True)
     first_name = db.Column(db.String(255), nullable=False)
@@ -63,10 +68,10 @@ class User(db.Model, SerializerMixin):
     type = db.relationship("UserType", back_populates="users", lazy=True)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
 
     @property
     def user_type(self):
@@ -94,6 +99,8 @@ class Business(db.Model, SerializerMixin):
         "business_type_id",
         "business_type",
         "location",
+        "latitude",
+        "longitude",
         "hospitality_type",
         "phone_number",
         "email",
@@ -102,10 +109,17 @@ class Business(db.Model, SerializerMixin):
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"business_type": "type", "owner_name": "owner"}
+    __table_args__ = (
+        db.Index("ix_m_business_name", "name"),
+        db.Index("ix_m_business_user_id", "user_id"),
+    )
     id = db.Column(db.String(255), primary_key=True)
     name = db.Column(db.String(255))
     business_type_id = db.Column(db.Integer, db.ForeignKey("business_types.id"))
     location = db.Column(db.String(255))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     hospitality_type = db.Column(db.Integer)
     phone_number = db.Column(db.String(255))
     email = db.Column(db.String(255))
@@ -164,11 +178,15 @@ class Property(db.Model, SerializerMixin):
         "land_size",
         "price",
         "location",
+        "latitude",
+        "longitude",
         "status",
         "year_built",
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"property_type": "type", "business_name": "business"}
+    __table_args__ = (db.Index("ix_property_business_id", "business_id"),)
     id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(
         db.String(255), db.ForeignKey("m_business.id"), nullable=False
@@ -183,6 +201,8 @@ class Property(db.Model, SerializerMixin):
     land_size = db.Column(db.String(255))
     price = db.Column(db.Numeric)
     location = db.Column(db.String(255))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     status = db.Column(db.String(255))  # For sale, for rent, sold, leased
     year_built = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, server_default=func.now())
@@ -228,11 +248,19 @@ class Accommodation(db.Model, SerializerMixin):
         "bedrooms",
         "price",
         "location",
+        "latitude",
+        "longitude",
         "check_in_time",
         "check_out_time",
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"business_name": "business", "room_type": "room_type_rel"}
+    # (room_type_id, price) also serves lookups on room_type_id alone.
+    __table_args__ = (
+        db.Index("ix_accomodation_room_type_price", "room_type_id", "price"),
+        db.Index("ix_accomodation_business_id", "business_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(
         db.String(255), db.ForeignKey("m_business.id"), nullable=False
@@ -245,6 +273,8 @@ class Accommodation(db.Model, SerializerMixin):
     bedrooms = db.Column(db.Integer)
     price = db.Column(db.Numeric)
     location = db.Column(db.String(255))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
     status = db.Column(db.String(255))
     check_in_time = db.Column(db.String(255))
     check_out_time = db.Column(db.String(255))
@@ -255,6 +285,7 @@ class Accommodation(db.Model, SerializerMixin):
     room_type_rel = db.relationship(
         "RoomType", back_populates="accommodations", lazy=True
     )
+    bookings = db.relationship("Booking", back_populates="accommodation", lazy=True)
 
     @property
     def business_name(self):
@@ -265,9 +296,64 @@ class Accommodation(db.Model, SerializerMixin):
         return self.room_type_rel.name if self.room_type_rel else None
 
 
+class Booking(db.Model, SerializerMixin):
+    __tablename__ = "bookings"
+    serialize_only = (
+        "id",
+        "accommodation_id",
+        "user_id",
+        "check_in",
+        "check_out",
+        "status",
+        "created_at",
+        "updated_at",
+    )
+    # The GiST exclusion constraint is what prevents double booking, even for
+    # concurrent requests; it also serves as the (accommodation, period) index.
+    __table_args__ = (
+        ExcludeConstraint(
+            ("accommodation_id", "="),
+            ("period", "&&"),
+            name="bookings_no_overlap",
+            using="gist",
+            where=db.text("status <> 'cancelled'"),
+        ),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    accommodation_id = db.Column(
+        db.Integer, db.ForeignKey("accomodation.id"), nullable=False
+    )
+    user_id = db.Column(db.String(255), db.ForeignKey("app_users.id"))
+    period = db.Column(TSTZRANGE, nullable=False)  # [check_in, check_out)
+    status = db.Column(db.String(255), nullable=False, default="confirmed")
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+    accommodation = db.relationship(
+        "Accommodation", back_populates="bookings", lazy=True
+    )
+
+    @property
+    def check_in(self):
+        return self.period.lower if self.period else None
+
+    @property
+    def check_out(self):
+        return self.period.upper if self.period else None
+
+
+# Integer equality in a GiST index needs btree_gist.
+event.listen(
+    Booking.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist"),
+)
+
+
 class Category(db.Model, SerializerMixin):
     __tablename__ = "categories"
     serialize_only = ("id", "name", "description", "created_at", "updated_at")
+    __table_args__ = (db.Index("ix_categories_name", "name"),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -280,7 +366,7 @@ class Category(db.Model, SerializerMixin):
     foods = db.relationship("Food", back_populates="category_rel", lazy=True)
 
 
-class Food(db.Model):
+class Food(db.Model, SerializerMixin):
     __tablename__ = "food"
     serialize_only = (
         "id",
@@ -295,6 +381,17 @@ class Food(db.Model):
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"category": "category_rel", "business_name": "business"}
+    __table_args__ = (
+        db.Index("ix_food_business_id", "business_id"),
+        db.Index("ix_food_category_id", "category_id"),
+        # Menus only list what can be ordered.
+        db.Index(
+            "ix_food_available_category",
+            "category_id",
+            postgresql_where=text("is_available"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(
@@ -338,6 +435,12 @@ class Product(db.Model, SerializerMixin):
         "created_at",
         "updated_at",
     )
+    serialize_relations = {"category": "category_rel", "business_name": "business"}
+    # (business_id, name) also serves lookups on business_id alone.
+    __table_args__ = (
+        db.Index("ix_products_business_name", "business_id", "name"),
+        db.Index("ix_products_category_id", "category_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     business_id = db.Column(
         db.String(255), db.ForeignKey("m_business.id"), nullable=False
@@ -365,6 +468,84 @@ class Product(db.Model, SerializerMixin):
         return self.business.name if self.business else None
 
 
+# Read model of the best rated products overall, per category and per business,
+# kept TOP_PRODUCTS_DEPTH deep and refreshed concurrently by rankings.py.
+TOP_PRODUCTS_DEPTH = 50
+
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS top_products AS
+    SELECT * FROM (
+        SELECT p.id, p.business_id, p.category_id, c.name AS category_name,
+            p.name, p.description, p.price, p.rating, p.image_url,
+            row_number() OVER (
+                PARTITION BY p.category_id ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS category_rank,
+            row_number() OVER (
+                PARTITION BY p.business_id ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS business_rank,
+            row_number() OVER (
+                ORDER BY p.rating DESC NULLS LAST, p.id
+            ) AS overall_rank
+        FROM products p LEFT JOIN categories c ON c.id = p.category_id
+    ) ranked
+    WHERE category_rank <= {TOP_PRODUCTS_DEPTH}
+        OR business_rank <= {TOP_PRODUCTS_DEPTH}
+        OR overall_rank <= {TOP_PRODUCTS_DEPTH};
+    CREATE UNIQUE INDEX IF NOT EXISTS ix_top_products_id ON top_products (id);
+    CREATE INDEX IF NOT EXISTS ix_top_products_overall
+        ON top_products (overall_rank);
+    CREATE INDEX IF NOT EXISTS ix_top_products_category
+        ON top_products (category_id, category_rank);
+    CREATE INDEX IF NOT EXISTS ix_top_products_business
+        ON top_products (business_id, business_rank);
+    """),
+)
+event.listen(
+    db.metadata,
+    "before_drop",
+    DDL("DROP MATERIALIZED VIEW IF EXISTS top_products"),
+)
+
+
+class StockReservation(db.Model, SerializerMixin):
+    """
+    Units of a product held for a buyer at checkout. Reserving takes the units
+    off Product.stock; releasing or expiring puts them back and committing
+    keeps them sold.
+    """
+
+    __tablename__ = "stock_reservations"
+    serialize_only = (
+        "id",
+        "product_id",
+        "user_id",
+        "quantity",
+        "status",
+        "expires_at",
+        "created_at",
+        "updated_at",
+    )
+    __table_args__ = (
+        db.Index(
+            "ix_stock_reservations_held_expiry",
+            "expires_at",
+            postgresql_where=text("status = 'held'"),
+        ),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+    user_id = db.Column(db.String(255), db.ForeignKey("app_users.id"))
+    quantity = db.Column(db.Integer, nullable=False)
+    # held, committed, released or expired
+    status = db.Column(db.String(16), nullable=False, default="held")
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+
 class EntityMediaType(db.Model, SerializerMixin):
     __tablename__ = "entity_media_types"
     serialize_only = ("id", "name", "description")
@@ -382,7 +563,17 @@ class EntityMediaType(db.Model, SerializerMixin):
 
 class EntityMedia(db.Model, SerializerMixin):
     __tablename__ = "entity_media"
-    serialize_only = ("id", "entity_type", "entity_id", "url", "storage_type")
+    serialize_only = ("id", "entity_type", "entity_id", "url", "storage_type", "status")
+    serialize_relations = {"entity_type": "media_type"}
+    __table_args__ = (
+        db.Index("ix_entity_media_entity", "entity_id", "entity_type_id"),
+        db.Index(
+            "ix_entity_media_pending",
+            "spool_host",
+            "id",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     entity_type_id = db.Column(
         db.Integer, db.ForeignKey("entity_media_types.id"), nullable=False
@@ -390,6 +581,16 @@ class EntityMedia(db.Model, SerializerMixin):
     entity_id = db.Column(db.Integer, nullable=False)
     url = db.Column(db.String(255))
     storage_type = db.Column(db.Integer)  # bucket, in-memory
+    # pending while the file waits in the local spool, then ready or failed
+    status = db.Column(
+        db.String(16), nullable=False, default="ready", server_default="ready"
+    )
+    blob_name = db.Column(db.String(512))
+    spool_path = db.Column(db.String(512))
+    spool_host = db.Column(db.String(255))
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    content_hash = db.Column(db.String(64))  # sha256 of the file, see MediaBlob
+    size = db.Column(db.BigInteger)  # bytes, recorded while spooling
     created_at = db.Column(db.DateTime, server_default=func.now())
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -400,3 +601,60 @@ class EntityMedia(db.Model, SerializerMixin):
     @property
     def entity_type(self):
         return self.media_type.name if self.media_type else None
+
+
+class MediaBlob(db.Model):
+    """
+    One stored file per distinct content, shared by every EntityMedia row with
+    the same hash. ref_count counts those rows; blobs left at zero are removed
+    by ``flask collect-media``.
+    """
+
+    __tablename__ = "media_blobs"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "storage_type", "content_hash", name="uq_media_blobs_storage_hash"
+        ),
+        db.Index(
+            "ix_media_blobs_unreferenced",
+            "updated_at",
+            postgresql_where=text("ref_count <= 0"),
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    storage_type = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    blob_name = db.Column(db.String(512), nullable=False)
+    url = db.Column(db.String(512), nullable=False)
+    size = db.Column(db.BigInteger)
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class RevokedToken(db.Model):
+    """
+    JWT revoked before it expired, e.g. on logout. Rows are kept until the
+    token's own expiry, see revocation.py.
+    """
+
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (
+        db.Index("ix_revoked_tokens_created_at", "created_at"),
+        db.Index("ix_revoked_tokens_expires_at", "expires_at"),
+    )
+
+    jti = db.Column(db.String(64), primary_key=True)
+    token_type = db.Column(db.String(16), nullable=False)
+    user_id = db.Column(db.String(255))
+    expires_at = db.Column(db.DateTime, nullable=False)  # UTC
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+
+class ReferenceVersion(db.Model):
+    __tablename__ = "reference_versions"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
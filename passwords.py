@@ -0,0 +1,180 @@
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """No hashing slot freed up in time, the caller should retry later."""
+
+
+@contextmanager
+def _bare_main():
+    """
+    Swap in an empty ``__main__`` while worker processes start. A spawned
+    child imports the parent's main module first, and for ``python app.py``
+    that runs create_all and every init_* hook. The workers only need this
+    module and werkzeug, which they import to unpickle their tasks.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _worker_started(barrier):
+    # Keeps each new worker busy until all have started, see _executor().
+    barrier.wait(timeout=60)
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords in a pool of ``workers`` processes, so a burst
+    of logins cannot take the CPU the request threads need. At most
+    ``max_pending`` hashes run or wait per web worker; a caller that finds no
+    slot within ``wait`` seconds gets PasswordHasherBusy. With ``workers=0``
+    hashes run on the calling thread, still capped.
+    """
+
+    def __init__(self, method="scrypt", workers=1, max_pending=4, wait=2.0):
+        self.method = method
+        self.workers = workers
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._prefix = None
+
+    def configure(self, method, workers, max_pending, wait):
+        with self._lock:
+            self.method = method
+            self.workers = workers
+            self.wait = wait
+            self._slots = threading.BoundedSemaphore(max_pending)
+            # "scrypt" is stored as "scrypt:32768:8:1", let werkzeug expand it
+            # once here rather than hash on a request thread.
+            self._prefix = generate_password_hash("", method).split("$", 1)[0]
+
+    def _executor(self):
+        # Created on first use in each web worker, never inherited by a fork.
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    context = multiprocessing.get_context("spawn")
+                    pool = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=context,
+                        initializer=_worker_started,
+                        initargs=(context.Barrier(self.workers),),
+                    )
+                    # A spawn pool starts a worker per task while none is idle,
+                    # and the barrier keeps them all busy until each of them
+                    # has started here rather than, with the app, on a later
+                    # burst of logins.
+                    with _bare_main():
+                        started = [pool.submit(os.getpid) for _ in range(self.workers)]
+                        for future in started:
+                            future.result()
+                    self._pool, self._pool_pid = pool, os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise PasswordHasherBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            return self._executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """
+        Whether pwhash was made with other parameters than ``method``, e.g.
+        before PASSWORD_HASH_METHOD was raised. Always False until
+        configure() has run.
+        """
+        if self._prefix is None:
+            return False
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+
+
+class RateLimiter:
+    """
+    Token bucket per key: ``burst`` attempts at once, refilled at
+    ``per_minute`` attempts a minute. Buckets are kept per web worker, for the
+    ``maxsize`` most recently seen keys.
+    """
+
+    def __init__(self, burst, per_minute, maxsize=100000):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """
+        Take one attempt for key.
+        :return: 0 when allowed, otherwise seconds until the next attempt is.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else math.ceil((1 - tokens) / self.rate)
+
+
+password_hasher = PasswordHasher()
+ip_login_limiter = RateLimiter(20, 10)
+user_login_limiter = RateLimiter(10, 5)
+
+
+def login_retry_after(username, ip):
+    """
+    Count a login attempt against its client address and username.
+    :return: 0 when allowed, otherwise seconds the client should wait.
+    """
+    return max(ip_login_limiter.hit(ip or ""), user_login_limiter.hit(username.lower()))
+
+
+def init_passwords(app):
+    """Configure the password hasher and the login rate limits."""
+    password_hasher.configure(
+        app.config["PASSWORD_HASH_METHOD"],
+        app.config["PASSWORD_HASH_WORKERS"],
+        app.config["PASSWORD_HASH_MAX_PENDING"],
+        app.config["PASSWORD_HASH_WAIT"],
+    )
+    for limiter, prefix in (
+        (ip_login_limiter, "LOGIN_IP"),
+        (user_login_limiter, "LOGIN_USER"),
+    ):
+        limiter.burst = app.config[f"{prefix}_BURST"]
+        limiter.rate = app.config[f"{prefix}_PER_MINUTE"] / 60
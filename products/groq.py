@@ -5,6 +5,7 @@ from flask import current_app
 from sqlalchemy import text
 
 from config import db
+from rankings import TOP_RATED_QUERY
 
 
 def query_groq(message):
@@ -157,7 +158,7 @@ def get_groq_response(message):
            - ALWAYS use EXACTLY this SELECT clause format:
              SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name
            - ALWAYS use JOIN with categories table:
-             FROM products p JOIN categories c ON p.category = c.id
+             FROM products p JOIN categories c ON p.category_id = c.id
            - ALWAYS search across ALL these fields using OR conditions:
              (p.name ILIKE '%keyword%' OR p.description ILIKE '%keyword%' OR c.name ILIKE '%keyword%' OR c.description ILIKE '%keyword%')
            - Apply appropriate filters based on user intent (price, rating, etc.)
@@ -176,7 +177,7 @@ def get_groq_response(message):
 
         {
           "response": "Your friendly explanation here",
-          "query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id WHERE ... ORDER BY ... LIMIT 10;"
+          "query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category_id = c.id WHERE ... ORDER BY ... LIMIT 10;"
         }
         """
 
@@ -213,9 +214,7 @@ def get_groq_response(message):
 
                 if "query" not in parsed:
                     # Default query if none provided
-                    parsed["query"] = (
-                        "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;"
-                    )
+                    parsed["query"] = TOP_RATED_QUERY
 
                 # For backward compatibility
                 parsed["sql_query"] = parsed["query"]
@@ -326,7 +325,7 @@ def get_groq_response(message):
                         where_clause = "1=1"  # Default condition if no search terms
 
                     # Generate the query
-                    query = f"SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id WHERE {where_clause} ORDER BY p.rating DESC LIMIT 10;"
+                    query = f"SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category_id = c.id WHERE {where_clause} ORDER BY p.rating DESC LIMIT 10;"
 
                 # Generate a response if we couldn't extract one
                 if not response_text or len(response_text) < 20:
@@ -349,21 +348,17 @@ def get_groq_response(message):
             )
             return {
                 "response": "I'm sorry, I encountered an error processing your request.",
-                "query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;",
-                "sql_query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;",
-                "queries": [
-                    "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;"
-                ],
+                "query": TOP_RATED_QUERY,
+                "sql_query": TOP_RATED_QUERY,
+                "queries": [TOP_RATED_QUERY],
             }
     except Exception as e:
         current_app.logger.error(f"Error in get_groq_response: {str(e)}")
         return {
             "response": "I'm sorry, I encountered an error processing your request.",
-            "query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;",
-            "sql_query": "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;",
-            "queries": [
-                "SELECT p.id, p.name,p.image_url, p.description, p.price, p.rating, c.name AS category_name FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 10;"
-            ],
+            "query": TOP_RATED_QUERY,
+            "sql_query": TOP_RATED_QUERY,
+            "queries": [TOP_RATED_QUERY],
         }
 
 
@@ -496,19 +491,19 @@ def get_groq_response_multiple_queries(message):
                         parsed["queries"] = [parsed["sql_query"]]
                     else:
                         parsed["queries"] = [
-                            "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5"
+                            "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5"
                         ]
 
                 # If queries is provided but empty, add a default query
                 if not parsed["queries"]:
                     parsed["queries"] = [
-                        "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5"
+                        "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5"
                     ]
 
                 # Ensure we have at least 2 queries
                 if len(parsed["queries"]) == 1:
                     parsed["queries"].append(
-                        "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.created_at DESC LIMIT 5"
+                        "SELECT p.* FROM products p JOIN categories c ON p.category_id = c.id ORDER BY p.created_at DESC LIMIT 5"
                     )
 
                 # For backward compatibility
@@ -549,13 +544,13 @@ def get_groq_response_multiple_queries(message):
                 # If still no queries found, use default
                 if not clean_queries:
                     clean_queries = [
-                        "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5"
+                        "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5"
                     ]
 
                 # Ensure we have at least 2 queries
                 if len(clean_queries) == 1:
                     clean_queries.append(
-                        "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.created_at DESC LIMIT 5"
+                        "SELECT p.* FROM products p JOIN categories c ON p.category_id = c.id ORDER BY p.created_at DESC LIMIT 5"
                     )
 
                 return {
@@ -570,10 +565,10 @@ def get_groq_response_multiple_queries(message):
             return {
                 "response": "I'm sorry, I encountered an error processing your request.",
                 "queries": [
-                    "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
-                    "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.created_at DESC LIMIT 5",
+                    "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
+                    "SELECT p.* FROM products p JOIN categories c ON p.category_id = c.id ORDER BY p.created_at DESC LIMIT 5",
                 ],
-                "sql_query": "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
+                "sql_query": "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
             }
     except Exception as e:
         current_app.logger.error(f"Error in get_groq_response: {str(e)}")
@@ -581,20 +576,20 @@ def get_groq_response_multiple_queries(message):
         return {
             "response": "I'm sorry, I encountered an error processing your request.",
             "queries": [
-                "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
-                "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.created_at DESC LIMIT 5",
+                "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
+                "SELECT p.* FROM products p JOIN categories c ON p.category_id = c.id ORDER BY p.created_at DESC LIMIT 5",
             ],
-            "sql_query": "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
+            "sql_query": "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
         }
     except Exception as e:
         current_app.logger.error(f"Error in get_groq_response: {str(e)}")
         return {
             "response": "I'm sorry, I encountered an error processing your request.",
             "queries": [
-                "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
-                "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.created_at DESC LIMIT 5",
+                "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
+                "SELECT p.* FROM products p JOIN categories c ON p.category_id = c.id ORDER BY p.created_at DESC LIMIT 5",
             ],
-            "sql_query": "SELECT p.* FROM products p JOIN categories c ON p.category = c.id ORDER BY p.rating DESC LIMIT 5",
+            "sql_query": "SELECT p.* FROM top_products t JOIN products p ON p.id = t.id ORDER BY t.overall_rank LIMIT 5",
         }
 
 
@@ -1,5 +1,6 @@
+import csv
+
 from flask import Blueprint, make_response, request, jsonify, current_app
-from werkzeug.utils import secure_filename
 from models import (
     Business,
     Category,
@@ -7,9 +8,38 @@ from models import (
     EntityMediaType,
     Product,
 )
-from .utils import run_pipeline, upload_file_to_azure
-from flask_jwt_extended import jwt_required
+from .utils import run_pipeline
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from cache import reference_cache
 from config import db
+from facets import faceted_search, invalidate_facets, parse_page, parse_search
+from identity import current_identity, role_required
+from inventory import (
+    ReservationError,
+    bulk_patch,
+    commit_reservation,
+    parse_bulk_items,
+    release_reservation,
+    reserve_stock,
+)
+from importer import IMPORT_FORMATS, import_products, read_rows
+from media import (
+    MediaUploadError,
+    attach_media,
+    discard_media,
+    queue_ingest,
+    stage_media,
+)
+from rankings import top_products, top_products_refresher
+from utils import (
+    batch_get,
+    catalog_validator,
+    load_fields,
+    not_modified,
+    parse_batch_ids,
+    parse_fields,
+    set_validators,
+)
 from .groq import (
     execute_product_query,
     get_groq_response,
@@ -22,7 +52,7 @@ products = Blueprint("products", __name__, url_prefix="/api/v1/products")
 
 
 @products.route("/create", methods=["POST"])
-@jwt_required("business_owner")
+@role_required("business_owner")
 def create_product():
     """
     Endpoint to create a new product.
@@ -47,16 +77,23 @@ def create_product():
             ),
             400,
         )
+    category = reference_cache.by_name(Category, data["category"])
+    if not category:
+        return make_response(jsonify({"error": "Category not found"}), 404)
+    business = Business.query.filter_by(name=data["businessName"]).first()
+    if not business:
+        return make_response(jsonify({"error": "Business not found"}), 404)
+    entity_type = reference_cache.by_name(EntityMediaType, "product")
+    if not entity_type:
+        return make_response(jsonify({"error": "Entity type not found"}), 404)
+
+    # Upload (or spool) before opening the write transaction; undo it if that fails.
     try:
-        category = Category.query.filter_by(name=data["category"]).first()
-        if not category:
-            return make_response(jsonify({"error": "Category not found"}), 404)
-        business = Business.query.filter_by(name=data["businessName"]).first()
-        if not business:
-            return make_response(jsonify({"error": "Business not found"}), 404)
-        files = request.files.getlist("media")
-        print(files)
+        staged = stage_media(request.files.getlist("media"))
+    except MediaUploadError as e:
+        return make_response(jsonify({"error": str(e)}), 500)
 
+    try:
         product = Product(
             name=data["name"],
             description=data["description"],
@@ -65,94 +102,80 @@ def create_product():
             price=float(data["price"]),
             rating=data.get("rating", 0.0),
             business_id=business.id,
+            # The first image doubles as the product's display image; a spooled
+            # image is set by the ingest worker once it is uploaded.
+            image_url=staged[0].url if staged else None,
         )
         db.session.add(product)
         db.session.flush()
-        entity_type = EntityMediaType.query.filter_by(name="product").first()
-        if not entity_type:
-            return make_response(jsonify({"error": "Entity type not found"}), 404)
-        files = request.files.getlist("media")
-        uploaded_urls = []
-        for idx, file_obj in enumerate(files):
-            # Create unique blob name, you could use UUID or product ID for structure
-            safe_filename = secure_filename(file_obj.filename)
-            blob_name = f"products/{product.id}/{idx}_{safe_filename}"
-            result = upload_file_to_azure(file_obj, blob_name)
-
-            if isinstance(result, dict) and result.get("url"):
-                url = result["url"]
-                uploaded_urls.append(url)
-
-                # Create entity media record
-                entity_media = EntityMedia(
-                    entity_id=product.id,
-                    entity_type_id=entity_type.id,
-                    url=url,
-                    storage_type=2,  # Assuming 2 means Azure
-                )
-                db.session.add(entity_media)
-
-            else:
-                current_app.logger.error(f"Upload failed: {result}")
-                return make_response(
-                    jsonify(
-                        {"error": f"Failed to upload media file: {file_obj.filename}"}
-                    ),
-                    500,
-                )
-
-        # Optional: save the first image as product's display image
-        if uploaded_urls:
-            product.image_url = uploaded_urls[0]
-
+        attach_media(product.id, entity_type.id, staged)
         db.session.commit()
-
-        return make_response(
-            jsonify(
-                {
-                    "message": "Product created successfully",
-                    "product": product.to_dict(),
-                }
-            ),
-            201,
-        )
-
     except Exception as e:
+        db.session.rollback()
+        discard_media(staged)
         return make_response(jsonify({"error": str(e)}), 500)
 
+    invalidate_facets(Product)
+    top_products_refresher.mark_dirty()
+    return make_response(
+        jsonify(
+            {
+                "message": "Product created successfully",
+                "product": product.to_dict(),
+            }
+        ),
+        202 if queue_ingest(staged) else 201,
+    )
+
 
 @products.route("/getone/<int:product_id>", methods=["GET"])
 def get_product(product_id):
     """
-    Endpoint to retrieve a product by its ID.
+    Endpoint to retrieve a product by its ID, supports a sparse ``fields`` list.
     """
-    product = Product.query.get(product_id)
+    fields, error = parse_fields(Product)
+    if error:
+        return error
+
+    query = Product.query.filter_by(id=product_id)
+    product = load_fields(query, Product, fields).first()
     if not product:
         return make_response(jsonify({"error": "Product not found"}), 404)
 
     media = EntityMedia.query.filter_by(
         entity_id=product.id,
-        entity_type=EntityMediaType.query.filter_by(name="product").first().id,
+        entity_type_id=reference_cache.by_name(EntityMediaType, "product").id,
+        status="ready",
     ).all()
+    etag, last_modified = catalog_validator(Product, [product], related=media)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
     product.media = [m.url for m in media]
 
     if not product.media:
         product.media = []
-    return make_response(jsonify(product.to_dict()))
+    return set_validators(
+        make_response(jsonify(product.to_dict(only=fields or ()))), etag, last_modified
+    )
 
 
 @products.route("/getall", methods=["GET"])
 def get_products():
     """
-    Endpoint to retrieve paginated products, supports filtering by category.
+    Endpoint to retrieve paginated products, supports filtering by category
+    and a sparse ``fields`` list.
     """
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
-    category = request.args.get("category", type=int)
+    category = request.args.get("category", type=str)
+    fields, error = parse_fields(Product)
+    if error:
+        return error
 
     existing_category = None
     if category:
-        existing_category = Category.query.filter_by(name=category).first()
+        existing_category = reference_cache.by_name(Category, category)
         if not existing_category:
             return make_response(jsonify({"error": "Category not found"}), 404)
 
@@ -160,10 +183,20 @@ def get_products():
     if existing_category:
         query = query.filter_by(category_id=existing_category.id)
 
-    products_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    products = [product.to_dict() for product in products_pagination.items]
+    products_pagination = load_fields(query, Product, fields).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    etag, last_modified = catalog_validator(
+        Product, products_pagination.items, products_pagination.total
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    products = [
+        product.to_dict(only=fields or ()) for product in products_pagination.items
+    ]
 
-    return make_response(
+    response = make_response(
         jsonify(
             {
                 "items": products,
@@ -176,10 +209,126 @@ def get_products():
             }
         )
     )
+    return set_validators(response, etag, last_modified)
+
+
+@products.route("/import", methods=["POST"])
+@role_required("business_owner")
+def import_products_file():
+    """
+    Endpoint to bulk import products from CSV or NDJSON, either as the raw
+    request body or as a ``file`` upload. Rows are validated while streaming;
+    invalid rows are reported by line and the valid ones are imported.
+    Supports ``format``, ``businessName`` (default for rows without one) and
+    ``dry_run`` query parameters.
+    """
+    upload = request.files.get("file")
+    fmt = request.args.get("format", type=str)
+    if not fmt:
+        mimetype = upload.mimetype if upload else request.mimetype
+        fmt = (
+            "ndjson"
+            if mimetype in ("application/x-ndjson", "application/jsonl")
+            else "csv"
+        )
+    if fmt not in IMPORT_FORMATS:
+        return make_response(jsonify({"error": "format must be csv or ndjson"}), 400)
+
+    try:
+        summary = import_products(
+            read_rows(upload.stream if upload else request.stream, fmt),
+            request.args.get("businessName", type=str),
+            request.args.get("dry_run", "false").lower() == "true",
+            owner_id=current_identity().owner_id,
+            batch_size=current_app.config["IMPORT_BATCH_SIZE"],
+            max_errors=current_app.config["IMPORT_MAX_ERRORS"],
+        )
+    except (UnicodeDecodeError, csv.Error) as e:
+        return make_response(jsonify({"error": f"Unreadable file: {e}"}), 400)
+    imported = summary["inserted"] or summary["updated"]
+    return make_response(
+        jsonify(summary), 422 if summary["failed"] and not imported else 200
+    )
+
+
+@products.route("/batch", methods=["POST"])
+def get_products_batch():
+    """
+    Endpoint to retrieve several products and their media in one call,
+    returned in the order the ids were requested.
+    """
+    ids, error = parse_batch_ids()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Product)
+    if error:
+        return error
+
+    items, missing = batch_get(Product, "product", ids, fields)
+    return make_response(jsonify({"items": items, "missing": missing}), 200)
+
+
+@products.route("/top", methods=["GET"])
+def get_top_products():
+    """
+    Endpoint to retrieve the best rated products overall, or within a
+    ``category`` or ``business_id``. Served from the top_products read model,
+    which trails writes by a few seconds.
+    """
+    limit = request.args.get("limit", 10, type=int)
+    category = request.args.get("category", type=str)
+    business_id = request.args.get("business_id", type=str)
+    if category and business_id:
+        return make_response(
+            jsonify({"error": "Filter by either category or business_id"}), 400
+        )
+
+    if category:
+        existing_category = reference_cache.by_name(Category, category)
+        if not existing_category:
+            return make_response(jsonify({"error": "Category not found"}), 404)
+        items = top_products("category", existing_category.id, limit)
+    elif business_id:
+        items = top_products("business", business_id, limit)
+    else:
+        items = top_products(limit=limit)
+    return make_response(jsonify({"items": items}), 200)
+
+
+@products.route("/search", methods=["GET"])
+def search_products():
+    """
+    Faceted product search. Returns one page of matches together with
+    category, price-bucket and rating facet counts for the same filters.
+    """
+    page, per_page, error = parse_page()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Product)
+    if error:
+        return error
+    conditions, error, status = parse_search(Product)
+    if error:
+        return make_response(jsonify({"error": error}), status)
+
+    items, facets, total = faceted_search(Product, conditions, page, per_page, fields)
+    return make_response(
+        jsonify(
+            {
+                "items": items,
+                "facets": facets,
+                "total": total,
+                "page": page,
+                "pages": (total + per_page - 1) // per_page,
+                "per_page": per_page,
+            }
+        ),
+        200,
+    )
 
 
 @products.route("/patch/<int:product_id>", methods=["PATCH"])
-@jwt_required("business_owner")
+@role_required("business_owner")
 def patch_product(product_id):
     """
     Endpoint to update a product by its ID.
@@ -194,7 +343,7 @@ def patch_product(product_id):
 
     category = None
     if data.get("category"):
-        category = Category.query.filter_by(name=data.get("category")).first()
+        category = reference_cache.by_name(Category, data.get("category"))
         if not category:
             return make_response(jsonify({"error": "Category not found"}), 404)
 
@@ -206,6 +355,8 @@ def patch_product(product_id):
     product.rating = float(data.get("rating", product.rating))
 
     db.session.commit()
+    invalidate_facets(Product)
+    top_products_refresher.mark_dirty()
     return make_response(
         jsonify(
             {"message": "Product updated successfully", "product": product.to_dict()}
@@ -213,6 +364,88 @@ def patch_product(product_id):
     )
 
 
+@products.route("/bulk", methods=["PATCH"])
+@role_required("business_owner")
+def bulk_patch_products():
+    """
+    Endpoint to update the price and stock of many products in one
+    transaction. Items carrying ``updatedAt`` are only applied when the
+    product has not changed since; each item gets its own outcome.
+    """
+    items, error = parse_bulk_items()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    summary = bulk_patch(Product, items, current_identity().owner_id)
+    return make_response(
+        jsonify(summary), 422 if summary["invalid"] and not summary["updated"] else 200
+    )
+
+
+@products.route("/<int:product_id>/reserve", methods=["POST"])
+@jwt_required()
+def reserve_product(product_id):
+    """
+    Endpoint to hold ``quantity`` units of a product for checkout. The units
+    leave stock at once and come back if the reservation is released or not
+    committed within RESERVATION_TTL seconds. Concurrent buyers can never take
+    more than is in stock; the ones that come short get 409.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        quantity = int(data.get("quantity", 1))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        return make_response(
+            jsonify({"error": "quantity must be a positive integer"}), 400
+        )
+    try:
+        reservation = reserve_stock(
+            product_id,
+            quantity,
+            get_jwt_identity(),
+            current_app.config["RESERVATION_TTL"],
+        )
+    except ReservationError as e:
+        return make_response(jsonify({"error": str(e)}), e.status_code)
+    return make_response(
+        jsonify({"message": "Stock reserved", "reservation": reservation.to_dict()}),
+        201,
+    )
+
+
+@products.route("/reservations/<int:reservation_id>/commit", methods=["POST"])
+@jwt_required()
+def commit_product_reservation(reservation_id):
+    """Endpoint to complete the checkout of one of the current user's reservations."""
+    try:
+        reservation = commit_reservation(reservation_id, get_jwt_identity())
+    except ReservationError as e:
+        return make_response(jsonify({"error": str(e)}), e.status_code)
+    return make_response(
+        jsonify(
+            {"message": "Reservation committed", "reservation": reservation.to_dict()}
+        ),
+        200,
+    )
+
+
+@products.route("/reservations/<int:reservation_id>/release", methods=["POST"])
+@jwt_required()
+def release_product_reservation(reservation_id):
+    """Endpoint to give back the units of one of the current user's reservations."""
+    try:
+        reservation = release_reservation(reservation_id, get_jwt_identity())
+    except ReservationError as e:
+        return make_response(jsonify({"error": str(e)}), e.status_code)
+    return make_response(
+        jsonify(
+            {"message": "Reservation released", "reservation": reservation.to_dict()}
+        ),
+        200,
+    )
+
+
 @products.route("/langchain/query", methods=["POST"])
 # @jwt_required("")
 def query():
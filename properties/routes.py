@@ -5,15 +5,30 @@ from models import (
     Category,
     EntityMedia,
     EntityMediaType,
-    Product,
     Property,
     PropertyType,
 )
 
 # from flask_jwt_extended import jwt_required
+from cache import reference_cache
 from config import db
-from werkzeug.utils import secure_filename
-from products.utils import upload_file_to_azure
+from media import (
+    MediaUploadError,
+    attach_media,
+    discard_media,
+    queue_ingest,
+    stage_media,
+)
+from geo import nearby, nearby_items, parse_coordinates, parse_nearby
+from utils import (
+    batch_get,
+    catalog_validator,
+    load_fields,
+    not_modified,
+    parse_batch_ids,
+    parse_fields,
+    set_validators,
+)
 
 property = Blueprint("property", __name__, url_prefix="/api/v1/property")
 
@@ -49,16 +64,29 @@ def create_property():
             ),
             400,
         )
-    try:
-        property_type = PropertyType.query.filter_by(name=data["propertyType"]).first()
-        if not property_type:
-            return make_response(jsonify({"error": "Property type not found"}))
+    (latitude, longitude), error = parse_coordinates(data)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    property_type = reference_cache.by_name(PropertyType, data["propertyType"])
+    if not property_type:
+        return make_response(jsonify({"error": "Property type not found"}))
+
+    business = Business.query.filter_by(name=data["businessName"]).first()
+    if not business:
+        current_app.logger.warning({"warning": "Business not found"})
+        return make_response(jsonify({"error": "Business not found"}), 404)
+
+    entity_type = reference_cache.by_name(EntityMediaType, "property")
+    if not entity_type:
+        return make_response(jsonify({"error": "Entity type not found"}), 404)
 
-        business = Business.query.filter_by(name=data["businessName"]).first()
-        if not business:
-            current_app.logger.warning({"warning": "Business not found"})
-            return make_response(jsonify({"error": "Business not found"}), 404)
+    # Upload (or spool) before opening the write transaction; undo it if that fails.
+    try:
+        staged = stage_media(request.files.getlist("media"))
+    except MediaUploadError as e:
+        return make_response(jsonify({"error": str(e)}), 500)
 
+    try:
         prop = Property(
             name=data["name"],
             business_id=business.id,
@@ -68,78 +96,80 @@ def create_property():
             land_size=data["landSize"],
             price=data["price"],
             location=data["location"],
+            latitude=latitude,
+            longitude=longitude,
             status=data["status"],
             year_built=data["year_built"],
         )
         db.session.add(prop)
         db.session.flush()
-        entity_type = EntityMediaType.query.filter_by(name="property").first()
-        if not entity_type:
-            return make_response(jsonify({"error": "Entity type not found"}), 404)
-
-        files = request.files.getlist("media")
-        for idx, file_obj in enumerate(files):
-            safe_filename = secure_filename(file_obj.filename)
-            blob_name = f"properties/{prop.id}/{idx}_{safe_filename}"
-            result = upload_file_to_azure(file_obj, blob_name)
-            if isinstance(result, dict) and result.get("url"):
-                url = result.get("url")
-                entity_media = EntityMedia(
-                    entity_id=prop.id,
-                    entity_type_id=entity_type.id,
-                    url=url,
-                    storage_type=2,
-                )
-                db.session.add(entity_media)
+        attach_media(prop.id, entity_type.id, staged)
         db.session.commit()
-
-        return make_response(
-            jsonify(
-                {
-                    "message": "Property created successfully",
-                    "product": prop.to_dict(),
-                }
-            ),
-            201,
-        )
-
     except Exception as e:
         current_app.logger.error(e)
+        db.session.rollback()
+        discard_media(staged)
         return make_response(jsonify({"error": str(e)}), 500)
 
+    return make_response(
+        jsonify(
+            {
+                "message": "Property created successfully",
+                "product": prop.to_dict(),
+            }
+        ),
+        202 if queue_ingest(staged) else 201,
+    )
+
 
 @property.route("/getone/<int:property_id>", methods=["GET"])
 def get_property(property_id):
     """
-    Endpoint to retrieve a property by its ID.
+    Endpoint to retrieve a property by its ID, supports a sparse ``fields`` list.
     """
-    property = Product.query.get(property_id)
-    if not property:
+    fields, error = parse_fields(Property)
+    if error:
+        return error
+
+    query = Property.query.filter_by(id=property_id)
+    prop = load_fields(query, Property, fields).first()
+    if not prop:
         return make_response(jsonify({"error": "Property not found"}), 404)
 
     media = EntityMedia.query.filter_by(
-        entity_id=property.id,
-        entity_type=EntityMediaType.query.filter_by(name="property").first().id,
+        entity_id=prop.id,
+        entity_type_id=reference_cache.by_name(EntityMediaType, "property").id,
+        status="ready",
     ).all()
-    property.media = [m.url for m in media]
+    etag, last_modified = catalog_validator(Property, [prop], related=media)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    prop.media = [m.url for m in media]
 
-    if not property.media:
-        property.media = []
-    return make_response(jsonify(property.to_dict()))
+    if not prop.media:
+        prop.media = []
+    return set_validators(
+        make_response(jsonify(prop.to_dict(only=fields or ()))), etag, last_modified
+    )
 
 
 @property.route("/getall", methods=["GET"])
 def get_properties():
     """
-    Endpoint to retrieve paginated properties, supports filtering by category.
+    Endpoint to retrieve paginated properties, supports filtering by category
+    and a sparse ``fields`` list.
     """
     page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 10, type=int)
     category = request.args.get("category", type=int)
+    fields, error = parse_fields(Property)
+    if error:
+        return error
 
     existing_category = None
     if category:
-        existing_category = Category.query.filter_by(name=category).first()
+        existing_category = reference_cache.by_name(Category, category)
         if not existing_category:
             return make_response(jsonify({"error": "Category not found"}), 404)
 
@@ -147,10 +177,18 @@ def get_properties():
     if existing_category:
         query = query.filter_by(category_id=existing_category.id)
 
-    property_pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-    properties = [property.to_dict() for product in property_pagination.items]
+    property_pagination = load_fields(query, Property, fields).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    etag, last_modified = catalog_validator(
+        Property, property_pagination.items, property_pagination.total
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    properties = [prop.to_dict(only=fields or ()) for prop in property_pagination.items]
 
-    return make_response(
+    response = make_response(
         jsonify(
             {
                 "items": properties,
@@ -163,6 +201,41 @@ def get_properties():
             }
         )
     )
+    return set_validators(response, etag, last_modified)
+
+
+@property.route("/nearby", methods=["GET"])
+def get_properties_nearby():
+    """
+    Endpoint to find the properties closest to ``lat``/``lng``, optionally
+    within ``radius_km`` and limited to the ``k`` nearest.
+    """
+    params, error = parse_nearby()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Property)
+    if error:
+        return error
+
+    items = nearby_items(Property, nearby(Property, **params), fields)
+    return make_response(jsonify({"items": items, "total": len(items)}), 200)
+
+
+@property.route("/batch", methods=["POST"])
+def get_properties_batch():
+    """
+    Endpoint to retrieve several properties and their media in one call,
+    returned in the order the ids were requested.
+    """
+    ids, error = parse_batch_ids()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Property)
+    if error:
+        return error
+
+    items, missing = batch_get(Property, "property", ids, fields)
+    return make_response(jsonify({"items": items, "missing": missing}), 200)
 
 
 @property.route("/patch/<int:property_id>", methods=["PATCH"])
@@ -178,6 +251,11 @@ def update_product(property_id):
     prop = Property.query.get(property_id)
     if not prop:
         return make_response(jsonify({"error": "Product not found"}), 404)
+    (latitude, longitude), error = parse_coordinates(
+        data, (prop.latitude, prop.longitude)
+    )
+    if error:
+        return make_response(jsonify({"error": error}), 400)
 
     prop.name = data.get("name", prop.name)
     prop.description = data.get("description", prop.description)
@@ -186,6 +264,7 @@ def update_product(property_id):
     prop.land_size = int(data.get("land_size", prop.land_size))
     prop.price = float(data.get("price", prop.price))
     prop.location = float(data.get("location", prop.location))
+    prop.latitude, prop.longitude = latitude, longitude
     prop.status = float(data.get("status", prop.status))
     prop.year_built = float(data.get("year_built", prop.year_built))
 
@@ -0,0 +1,135 @@
+import threading
+import time
+import zlib
+
+from sqlalchemy import text
+
+from config import db
+from models import TOP_PRODUCTS_DEPTH
+
+TOP_PRODUCTS_COLUMNS = (
+    "id, business_id, category_id, category_name, name, description, price, "
+    "rating, image_url"
+)
+
+# Default answer of the natural language endpoints, served from the read model.
+TOP_RATED_QUERY = (
+    "SELECT id, name, image_url, description, price, rating, category_name "
+    "FROM top_products ORDER BY overall_rank LIMIT 10;"
+)
+
+_SCOPES = {
+    None: ("overall_rank", None),
+    "category": ("category_rank", "category_id"),
+    "business": ("business_rank", "business_id"),
+}
+
+
+class ViewRefresher:
+    """
+    Keeps a materialized view fresh from a background thread.
+    Writes mark the view dirty and it is refreshed within ``interval`` seconds;
+    it is also refreshed every ``max_staleness`` seconds to pick up changes made
+    by other workers or outside the app. A transaction-scoped advisory lock
+    stops workers from refreshing the same view at once.
+    """
+
+    def __init__(self, view, interval=5.0, max_staleness=300.0):
+        self.view = view
+        self.interval = interval
+        self.max_staleness = max_staleness
+        self.lock_key = zlib.crc32(view.encode())
+        self.refreshed_at = 0.0
+        self._dirty = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def mark_dirty(self):
+        self._dirty.set()
+
+    def refresh(self):
+        """
+        Refresh the view without blocking readers.
+        :return: True when refreshed, False when another worker holds the lock.
+        """
+        self._dirty.clear()
+        with db.engine.begin() as conn:
+            locked = conn.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": self.lock_key}
+            ).scalar()
+            if locked:
+                conn.execute(
+                    text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self.view}")
+                )
+            else:
+                # Another worker is mid-refresh and may have missed our writes.
+                self._dirty.set()
+        self.refreshed_at = time.monotonic()
+        return bool(locked)
+
+    def _run(self, app):
+        while True:
+            self._dirty.wait(self.interval)
+            # At most one refresh per interval, writes meanwhile are coalesced.
+            time.sleep(max(0.0, self.refreshed_at + self.interval - time.monotonic()))
+            if (
+                self._dirty.is_set()
+                or time.monotonic() - self.refreshed_at >= self.max_staleness
+            ):
+                with app.app_context():
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        app.logger.error(f"Refreshing {self.view} failed: {e}")
+                        self.refreshed_at = time.monotonic()
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is None:
+                self.refreshed_at = time.monotonic()
+                self._thread = threading.Thread(
+                    target=self._run, args=(app,), name=f"refresh-{self.view}"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+
+top_products_refresher = ViewRefresher("top_products")
+
+
+def top_products(scope=None, key=None, limit=10):
+    """
+    Read the best rated products from the top_products read model.
+    :param scope: None for the whole catalog, "category" or "business".
+    :param key: Category id or business id for a scoped ranking.
+    :param limit: Number of products, at most TOP_PRODUCTS_DEPTH.
+    :return: List of product dicts in rank order.
+    """
+    rank, column = _SCOPES[scope]
+    where = f"WHERE {column} = :key AND" if column else "WHERE"
+    rows = db.session.execute(
+        text(
+            f"SELECT {TOP_PRODUCTS_COLUMNS}, {rank} AS rank FROM top_products "
+            f"{where} {rank} <= :limit ORDER BY {rank}"
+        ),
+        {"key": key, "limit": min(limit, TOP_PRODUCTS_DEPTH)},
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def init_rankings(app):
+    """
+    Start refreshing the read models with the first request of each worker,
+    so CLI commands and forked masters do not run the thread.
+    """
+    top_products_refresher.interval = app.config["TOP_PRODUCTS_REFRESH_INTERVAL"]
+    top_products_refresher.max_staleness = app.config["TOP_PRODUCTS_MAX_STALENESS"]
+
+    @app.before_request
+    def start_refresher():
+        if not top_products_refresher.started:
+            top_products_refresher.start(app)
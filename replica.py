@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "db_primary_pin"
+
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """)
+
+
+class ReplicaMonitor:
+    """
+    Tracks replication lag of the ``replica`` bind.
+    The lag is sampled at most once per ``check_interval`` seconds per worker;
+    an unreachable replica or one lagging past ``max_lag`` is treated as unusable.
+    """
+
+    def __init__(self, max_lag=1.0, check_interval=1.0):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._usable = False
+        self.lag = None
+
+    def usable(self, engine):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return self._usable
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                try:
+                    with engine.connect() as conn:
+                        self.lag = conn.execute(LAG_QUERY).scalar()
+                    self._usable = self.lag is not None and self.lag <= self.max_lag
+                except Exception:
+                    self.lag = None
+                    self._usable = False
+                self._checked_at = time.monotonic()
+        return self._usable
+
+
+class PrimaryPins:
+    """
+    Users whose reads stay on the primary until a moment after their last
+    write, kept per worker for the ``maxsize`` most recent writers.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._until = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pin(self, user_id, seconds):
+        with self._lock:
+            self._until.pop(user_id, None)
+            self._until[user_id] = time.monotonic() + seconds
+            if len(self._until) > self.maxsize:
+                self._until.popitem(last=False)
+
+    def pinned(self, user_id):
+        return self._until.get(user_id, 0.0) > time.monotonic()
+
+
+def use_primary():
+    """
+    Send the rest of the current request to the primary. Call before writing
+    through text() on a path that may run in a safe request; ORM flushes and
+    insert/update/delete statements switch on their own.
+    """
+    if has_request_context():
+        g.use_replica = False
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads of safe requests to the ``replica`` bind.
+    The first write moves the rest of the request to the primary, and every
+    request not marked by ``init_replica`` keeps using the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if clause is not None and clause.is_dml:
+            use_primary()
+        if bind is None and has_request_context() and g.get("use_replica"):
+            return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _flush_to_primary(session, flush_context, instances):
+    use_primary()
+
+
+def _request_identity():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        # Bad tokens are answered by the view itself.
+        return None
+
+
+def init_replica(app, db):
+    """
+    Route safe requests to the replica bind when one is configured.
+    Successful writes pin the client's following reads to the primary for
+    REPLICA_PIN_SECONDS so it always reads its own writes: signed-in users by
+    their token's identity in this worker, and any client that keeps cookies
+    by a short-lived cookie in every worker.
+    """
+    if "replica" not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+
+    monitor = ReplicaMonitor(
+        app.config["REPLICA_MAX_LAG"], app.config["REPLICA_LAG_CHECK_INTERVAL"]
+    )
+    app.extensions["replica_monitor"] = monitor
+    pins = PrimaryPins()
+
+    @app.before_request
+    def choose_bind():
+        g.replica_identity = _request_identity()
+        g.use_replica = (
+            request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.cookies
+            and not (g.replica_identity and pins.pinned(g.replica_identity))
+            and monitor.usable(db.engines["replica"])
+        )
+
+    @app.after_request
+    def pin_writer(response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            seconds = app.config["REPLICA_PIN_SECONDS"]
+            if g.get("replica_identity"):
+                pins.pin(g.replica_identity, seconds)
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax"
+            )
+        return response
@@ -0,0 +1,164 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, delete, exists, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from cache import BloomFilter, LRUCache
+from config import db, jwt
+from models import RevokedToken
+
+revoked_tokens = RevokedToken.__table__
+
+# Revocations committed this long before the last sync are read again, so a
+# transaction that committed late is not missed.
+SYNC_MARGIN = timedelta(seconds=30)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RevocationStore:
+    """
+    Revoked JWT ids shared by every worker through the ``revoked_tokens``
+    table, with a per-worker Bloom filter and LRU in front of it.
+    A token the filter has never seen is not revoked and costs no query;
+    the rare filter hit is settled by the LRU, then by the table. Each worker
+    reads the revocations of the others at most once per ``sync_interval``
+    seconds, and rebuilds its filter from the unexpired rows every
+    ``rebuild_interval`` seconds or when it fills up, deleting expired rows.
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        capacity=100000,
+        error_rate=0.001,
+        lru_size=10000,
+        sync_interval=1.0,
+        rebuild_interval=3600.0,
+    ):
+        self._engine = engine
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.known = LRUCache(lru_size)
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_to = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    @property
+    def engine(self):
+        return self._engine or db.engine
+
+    def revoke(self, jti, token_type, user_id, expires):
+        """
+        Revoke a token until it expires.
+        :param expires: The token's ``exp`` claim, seconds since the epoch.
+        """
+        expires_at = datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    insert(revoked_tokens).values(
+                        jti=jti,
+                        token_type=token_type,
+                        user_id=user_id,
+                        expires_at=expires_at,
+                    )
+                )
+        except IntegrityError:
+            pass  # already revoked
+        self._sync()
+        self._bloom.add(jti)
+        self.known.set(jti, True)
+
+    def is_revoked(self, jti):
+        self._sync()
+        if jti not in self._bloom:
+            return False
+        revoked = self.known.get(jti)
+        if revoked is None:
+            with self.engine.connect() as conn:
+                revoked = conn.execute(
+                    select(exists().where(revoked_tokens.c.jti == jti))
+                ).scalar()
+            self.known.set(jti, revoked)
+        return revoked
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._bloom is not None and now - self._checked_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._bloom is not None and now - self._checked_at < self.sync_interval:
+                return
+            if (
+                self._bloom is None
+                or self._bloom.full
+                or now - self._built_at >= self.rebuild_interval
+            ):
+                self.rebuild()
+            else:
+                self._read_new()
+            self._checked_at = time.monotonic()
+
+    def _read_new(self):
+        with self.engine.connect() as conn:
+            db_now = conn.execute(select(func.now())).scalar()
+            jtis = conn.execute(
+                select(revoked_tokens.c.jti).where(
+                    revoked_tokens.c.created_at >= self._synced_to - SYNC_MARGIN
+                )
+            ).scalars()
+            for jti in jtis:
+                self._bloom.add(jti)
+                # A cached "not revoked" for a false positive may be stale now.
+                self.known.set(jti, True)
+        self._synced_to = db_now
+
+    def rebuild(self):
+        """
+        Drop expired revocations and load the rest into a new filter, sized
+        for twice as many.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(revoked_tokens).where(revoked_tokens.c.expires_at < _utcnow())
+            )
+            db_now = conn.execute(select(func.now())).scalar()
+            jtis = conn.execute(select(revoked_tokens.c.jti)).scalars().all()
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        bloom.update(jtis)
+        self.known.clear()
+        self._bloom, self._synced_to = bloom, db_now
+        self._built_at = time.monotonic()
+
+
+revocation_store = RevocationStore()
+
+
+def init_revocation(app):
+    """
+    Check every JWT against the revocation store. REVOCATION_DATABASE_URL
+    puts the store in its own database, e.g. an SQLite file shared by the
+    workers of one host; it defaults to the app's database.
+    """
+    store = revocation_store
+    store.capacity = app.config["REVOCATION_BLOOM_CAPACITY"]
+    store.error_rate = app.config["REVOCATION_BLOOM_ERROR_RATE"]
+    store.known.maxsize = app.config["REVOCATION_LRU_SIZE"]
+    store.sync_interval = app.config["REVOCATION_SYNC_INTERVAL"]
+    store.rebuild_interval = app.config["REVOCATION_REBUILD_INTERVAL"]
+    if app.config["REVOCATION_DATABASE_URL"]:
+        store._engine = create_engine(app.config["REVOCATION_DATABASE_URL"])
+        revoked_tokens.create(store._engine, checkfirst=True)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_is_revoked(jwt_header, jwt_payload):
+        return store.is_revoked(jwt_payload["jti"])
@@ -1,20 +1,52 @@
 import uuid
 
-from flask import Blueprint, current_app, jsonify, make_response, request
+from flask import (
+    Blueprint,
+    current_app,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+)
 from flask_jwt_extended import (
     get_jwt_identity,
     jwt_required,
 )
 
+from cache import reference_cache
 from config import db
-from models import Business, BusinessType, Category, User
+from geo import nearby, nearby_items, parse_coordinates, parse_nearby
+from identity import current_identity, invalidate_business, role_required
+from rankings import top_products_refresher
+from models import (
+    Accommodation,
+    Business,
+    BusinessType,
+    Category,
+    Food,
+    Product,
+    Property,
+    User,
+)
+from utils import (
+    catalog_counts,
+    catalog_validator,
+    contains_pattern,
+    csv_lines,
+    export_rows,
+    load_fields,
+    ndjson_lines,
+    not_modified,
+    parse_fields,
+    set_validators,
+)
 
 category = Blueprint("categories", __name__, url_prefix="/api/v1/categories")
 business = Blueprint("business", __name__, url_prefix="/api/v1/business")
 
 
 @business.route("/create", methods=["POST"])
-@jwt_required("business_owner")
+@role_required("business_owner")
 def create_business():
     """Endpoint to create a new business profile."""
     data = request.get_json()
@@ -30,9 +62,12 @@ def create_business():
             ),
             400,
         )
+    (latitude, longitude), error = parse_coordinates(data)
+    if error:
+        return make_response(jsonify({"error": error}), 400)
 
     try:
-        busines_type = BusinessType.query.filter_by(name=data["businessType"]).first()
+        busines_type = reference_cache.by_name(BusinessType, data["businessType"])
         if not busines_type:
             return make_response(
                 jsonify(
@@ -48,6 +83,8 @@ def create_business():
             id=str(uuid.uuid4())[:9],
             name=data["name"],
             location=data["location"],
+            latitude=latitude,
+            longitude=longitude,
             hospitality_type=data.get("hospitalityType"),
             email=data.get("email", user.email),
             phone_number=data.get("phoneNumber"),
@@ -66,23 +103,120 @@ def create_business():
 
 @business.route("/getall", methods=["GET"])
 def get_all_businesses():
-    """Endpoint to get all businesses."""
+    """
+    Endpoint to get businesses one keyset page at a time.
+    Supports ``type`` and ``location`` filters, a sparse ``fields`` list and
+    ``counts=true`` for per-business catalog counts.
+    """
+    per_page = max(
+        1,
+        min(
+            request.args.get("per_page", 20, type=int),
+            current_app.config["MAX_PER_PAGE"],
+        ),
+    )
+    cursor = request.args.get("cursor", type=str)
+    business_type = request.args.get("type", type=str)
+    location = request.args.get("location", type=str)
+    with_counts = request.args.get("counts", "false", type=str).lower() == "true"
+    fields, error = parse_fields(Business)
+    if error:
+        return error
     try:
-        businesses = Business.query.all()
-        return make_response(
-            jsonify({"businesses": [b.to_dict() for b in businesses]}), 200
+        query = Business.query
+        if business_type:
+            existing_type = reference_cache.by_name(BusinessType, business_type)
+            if not existing_type:
+                return make_response(jsonify({"error": "Invalid business type"}), 400)
+            query = query.filter_by(business_type_id=existing_type.id)
+        if location:
+            query = query.filter(
+                Business.location.ilike(contains_pattern(location), escape="\\")
+            )
+
+        # Counted on the first page only, later pages stay index range scans.
+        total = None if cursor else query.order_by(None).count()
+        if cursor:
+            query = query.filter(Business.id > cursor)
+        businesses = (
+            load_fields(query, Business, fields)
+            .order_by(Business.id)
+            .limit(per_page + 1)
+            .all()
+        )
+        has_next = len(businesses) > per_page
+        businesses = businesses[:per_page]
+        # Counts come from the catalog tables: they are part of the tag, and
+        # the businesses' Last-Modified says nothing about them.
+        counts = catalog_counts([b.id for b in businesses]) if with_counts else None
+        etag, last_modified = catalog_validator(
+            Business, businesses, total, has_next, counts
+        )
+        if with_counts:
+            last_modified = None
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+
+        items = [b.to_dict(only=fields or ()) for b in businesses]
+        if with_counts:
+            for item, b in zip(items, businesses):
+                item["counts"] = counts[b.id]
+
+        response = make_response(
+            jsonify(
+                {
+                    "businesses": items,
+                    "total": total,
+                    "per_page": per_page,
+                    "next_cursor": businesses[-1].id if has_next else None,
+                    "has_next": has_next,
+                }
+            ),
+            200,
         )
-        pass
+        return set_validators(response, etag, last_modified)
     except Exception as e:
         return make_response(jsonify({"message": str(e)}), 400)
 
 
+@business.route("/nearby", methods=["GET"])
+def get_businesses_nearby():
+    """
+    Endpoint to find the businesses closest to ``lat``/``lng``, optionally
+    within ``radius_km`` and limited to the ``k`` nearest.
+    """
+    params, error = parse_nearby()
+    if error:
+        return make_response(jsonify({"error": error}), 400)
+    fields, error = parse_fields(Business)
+    if error:
+        return error
+
+    items = nearby_items(Business, nearby(Business, **params), fields)
+    return make_response(jsonify({"items": items, "total": len(items)}), 200)
+
+
 @business.route("/getone/<string:business_id>", methods=["GET"])
 def get_business_by_id(business_id):
-    """Endpoint to get a business by its ID."""
+    """Endpoint to get a business by its ID, supports a sparse ``fields`` list."""
+    fields, error = parse_fields(Business)
+    if error:
+        return error
     try:
-        business = Business.query.get_or_404(business_id)
-        return make_response(jsonify(business.to_dict()), 200)
+        query = Business.query.filter_by(id=business_id)
+        business = load_fields(query, Business, fields).first()
+        if not business:
+            return make_response(jsonify({"error": "Business not found"}), 404)
+        etag, last_modified = catalog_validator(Business, [business])
+        cached = not_modified(etag, last_modified)
+        if cached:
+            return cached
+        return set_validators(
+            make_response(jsonify(business.to_dict(only=fields or ())), 200),
+            etag,
+            last_modified,
+        )
     except Exception as e:
         return make_response(jsonify({"message": str(e)}), 400)
 
@@ -96,11 +230,16 @@ def patch_business(business_id):
         business = Business.query.filter_by(id=business_id).first()
         if not business:
             return make_response(jsonify({"error": "Business not found"}), 404)
+        (latitude, longitude), error = parse_coordinates(
+            data, (business.latitude, business.longitude)
+        )
+        if error:
+            return make_response(jsonify({"error": error}), 400)
         business_type = None
         if data.get("businessType"):
-            business_type = BusinessType.query.filter_by(
-                name=data.get("businessType")
-            ).first()
+            business_type = reference_cache.by_name(
+                BusinessType, data.get("businessType")
+            )
             if not business_type:
                 return make_response(
                     jsonify(
@@ -113,6 +252,7 @@ def patch_business(business_id):
                 )
         business.name = data.get("name", business.name)
         business.location = data.get("location", business.location)
+        business.latitude, business.longitude = latitude, longitude
         business.hospitality_type = data.get(
             "hospitalityType", business.hospitality_type
         )
@@ -122,6 +262,7 @@ def patch_business(business_id):
             business_type.id if business_type else business.business_type_id
         )
         db.session.commit()
+        invalidate_business(business.user_id)
 
         return make_response(
             jsonify(
@@ -141,36 +282,99 @@ def patch_business(business_id):
 @business.route("/profile", methods=["GET"])
 @jwt_required()
 def get_profile():
-    """Endpoint to get the current user's profile."""
-    current_user_id = get_jwt_identity()
-    current_app.logger.info(f"Current User ID: {current_user_id}")
-    if not current_user_id:
+    """
+    Endpoint to get the current user's business profile, served from the
+    identity cache.
+    """
+    identity = current_identity()
+    current_app.logger.info(f"Current User ID: {identity.id}")
+    if not identity.id:
         return make_response(jsonify({"error": "User not authenticated"}), 401)
-    user = User.query.get(current_user_id)
-    if not user:
-        return make_response(jsonify({"error": "User not found"}), 404)
-    profile = Business.query.filter_by(user_id=user.id).first()
+    profile = identity.business
     if not profile:
         return make_response(jsonify({"error": "Business not found"}), 404)
 
-    return make_response(jsonify(profile.to_dict()), 200)
+    return make_response(jsonify(profile), 200)
+
+
+@business.route("/<string:business_id>/export", methods=["GET"])
+@jwt_required()
+def export_business_catalog(business_id):
+    """
+    Endpoint to stream a business's products, foods, properties and
+    accommodations as NDJSON or CSV. Only the owner may export.
+    """
+    export_format = request.args.get("format", "ndjson", type=str)
+    if export_format not in ("ndjson", "csv"):
+        return make_response(jsonify({"error": "format must be ndjson or csv"}), 400)
+
+    business = db.session.get(Business, business_id)
+    if not business:
+        return make_response(jsonify({"error": "Business not found"}), 404)
+    if business.user_id != get_jwt_identity():
+        return make_response(jsonify({"error": "Not the business owner"}), 403)
+
+    sources = [
+        (kind, model, model.query.filter_by(business_id=business_id))
+        for kind, model in (
+            ("product", Product),
+            ("food", Food),
+            ("property", Property),
+            ("accommodation", Accommodation),
+        )
+    ]
+    rows = export_rows(sources, current_app.config["EXPORT_BATCH_SIZE"])
+    if export_format == "csv":
+        fieldnames = list(
+            dict.fromkeys(f for _, model, _ in sources for f in model.serialize_only)
+        )
+        body, mimetype = csv_lines(rows, fieldnames), "text/csv"
+    else:
+        body, mimetype = ndjson_lines(rows), "application/x-ndjson"
+
+    response = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename={business_id}-catalog.{export_format}"
+    )
+    return response
 
 
 @category.route("/categories", methods=["GET"])
 def get_categories():
-    categories = Category.query.all()
+    fields, error = parse_fields(Category)
+    if error:
+        return error
+
+    categories = load_fields(Category.query, Category, fields).all()
+    etag, last_modified = catalog_validator(Category, categories)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
 
-    return jsonify({"categories": [category.to_dict() for category in categories]}), 200
+    response = jsonify(
+        {"categories": [category.to_dict(only=fields or ()) for category in categories]}
+    )
+    return set_validators(response, etag, last_modified), 200
 
 
 @category.route("/<int:category_id>", methods=["GET"])
 def get_category(category_id):
-    category = Category.query.get(category_id)
+    fields, error = parse_fields(Category)
+    if error:
+        return error
 
+    query = Category.query.filter_by(id=category_id)
+    category = load_fields(query, Category, fields).first()
     if not category:
         return jsonify({"error": "Category not found"}), 404
 
-    return jsonify(category.to_dict()), 200
+    etag, last_modified = catalog_validator(Category, [category])
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    response = jsonify(category.to_dict(only=fields or ()))
+    return set_validators(response, etag, last_modified), 200
 
 
 @category.route("/create", methods=["POST"])
@@ -187,6 +391,7 @@ def create_category():
 
     try:
         db.session.add(category)
+        reference_cache.bump()
         db.session.commit()
 
         return (
@@ -220,7 +425,9 @@ def patch_category(category_id):
         category.description = data["description"]
 
     try:
+        reference_cache.bump()
         db.session.commit()
+        top_products_refresher.mark_dirty()
 
         return (
             jsonify(
@@ -0,0 +1,172 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from flask import current_app
+
+STORAGE_DRIVERS = ("azure", "filesystem", "memory")
+# EntityMedia.storage_type of the files each driver stores.
+STORAGE_TYPES = {"filesystem": 1, "azure": 2, "memory": 3}
+
+
+class AzureBlobStorage:
+    """
+    Azure Blob Storage container behind one long-lived client.
+    The client keeps a pool of ``pool_size`` HTTP connections that every
+    upload of the worker reuses. Files above ``chunk_size`` are sent in blocks
+    of that size, ``max_concurrency`` blocks at a time.
+    """
+
+    def __init__(
+        self,
+        account_url,
+        credential,
+        container,
+        pool_size=8,
+        chunk_size=4 * 1024 * 1024,
+        max_concurrency=1,
+        base_url=None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.base_url = (base_url or f"{account_url.rstrip('/')}/{container}").rstrip(
+            "/"
+        )
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.client = BlobServiceClient(
+            account_url=account_url,
+            credential=credential,
+            transport=RequestsTransport(session=session, session_owner=False),
+            max_single_put_size=chunk_size,
+            max_block_size=chunk_size,
+        )
+        self.container_client = self.client.get_container_client(container)
+
+    def upload_fileobj(self, file_obj, blob_name):
+        self.container_client.upload_blob(
+            name=blob_name,
+            data=file_obj,
+            overwrite=True,
+            max_concurrency=self.max_concurrency,
+        )
+        return f"{self.base_url}/{blob_name}"
+
+    def delete_blob(self, blob_name):
+        self.container_client.delete_blob(blob_name, delete_snapshots="include")
+
+
+class FilesystemStorage:
+    """
+    Blob storage on a local directory, with the same interface as
+    AzureBlobStorage. Used for development and tests in place of Azure.
+    """
+
+    def __init__(self, root, base_url=None, chunk_size=1024 * 1024):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = (base_url or self.root.resolve().as_uri()).rstrip("/")
+        self.chunk_size = chunk_size
+
+    def _path(self, blob_name):
+        path = (self.root / blob_name).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid blob name: {blob_name}")
+        return path
+
+    def upload_fileobj(self, file_obj, blob_name):
+        path = self._path(blob_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the target and rename, so readers never see half a file.
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            shutil.copyfileobj(file_obj, tmp, self.chunk_size)
+        os.replace(tmp.name, path)
+        return f"{self.base_url}/{blob_name}"
+
+    def delete_blob(self, blob_name):
+        try:
+            self._path(blob_name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class MemoryStorage:
+    """
+    Blob storage in a dict of the worker's memory, for tests and benchmarks.
+    """
+
+    def __init__(self, base_url="memory://media"):
+        self.base_url = base_url.rstrip("/")
+        self.blobs = {}
+        self._lock = threading.Lock()
+
+    def upload_fileobj(self, file_obj, blob_name):
+        data = file_obj.read()
+        with self._lock:
+            self.blobs[blob_name] = data
+        return f"{self.base_url}/{blob_name}"
+
+    def delete_blob(self, blob_name):
+        with self._lock:
+            self.blobs.pop(blob_name, None)
+
+    def open(self, blob_name):
+        return io.BytesIO(self.blobs[blob_name])
+
+
+def create_storage(config):
+    """
+    Build the storage driver named by MEDIA_STORAGE.
+    :param config: Flask app config.
+    """
+    driver = config["MEDIA_STORAGE"]
+    if driver == "azure":
+        if not config["AZURE_STORAGE_CREDENTIAL"]:
+            raise ValueError(
+                "MEDIA_STORAGE=azure needs AZURE_STORAGE_SAS_TOKEN, or set "
+                "MEDIA_STORAGE to filesystem or memory"
+            )
+        return AzureBlobStorage(
+            config["AZURE_STORAGE_ACCOUNT_URL"],
+            config["AZURE_STORAGE_CREDENTIAL"],
+            config["AZURE_STORAGE_CONTAINER"],
+            pool_size=config["MEDIA_UPLOAD_WORKERS"],
+            chunk_size=config["MEDIA_UPLOAD_CHUNK_SIZE"],
+            max_concurrency=config["MEDIA_UPLOAD_CONCURRENCY"],
+            base_url=config["MEDIA_BASE_URL"],
+        )
+    if driver == "filesystem":
+        return FilesystemStorage(
+            config["MEDIA_FILESYSTEM_ROOT"],
+            config["MEDIA_BASE_URL"],
+            chunk_size=config["MEDIA_UPLOAD_CHUNK_SIZE"],
+        )
+    if driver == "memory":
+        return MemoryStorage(config["MEDIA_BASE_URL"] or "memory://media")
+    raise ValueError(f"MEDIA_STORAGE must be one of {STORAGE_DRIVERS}")
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """
+    Return the worker's storage driver, created on first use and shared by
+    all its threads.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage(current_app.config)
+    return _storage
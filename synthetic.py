@@ -0,0 +1,642 @@
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import text
+
+from config import db
+from models import (
+    BusinessType,
+    Category,
+    EntityMediaType,
+    PropertyType,
+    RoomType,
+    UserType,
+)
+from passwords import password_hasher
+from rankings import top_products_refresher
+
+# Share of the generated catalog rows per table, and the business type of
+# the businesses that own them.
+CATALOG_SHARES = {
+    "products": 0.4,
+    "food": 0.25,
+    "property": 0.15,
+    "accomodation": 0.2,
+}
+BUSINESS_KINDS = {
+    "products": "ecommerce",
+    "food": "restaurant",
+    "property": "property",
+    "accomodation": "hotel",
+}
+MEDIA_TYPES = {
+    "products": "product",
+    "food": "food",
+    "property": "property",
+    "accomodation": "accommodation",
+}
+TABLES = ("app_users", "m_business", *CATALOG_SHARES, "entity_media")
+
+CITIES = {
+    "Nairobi": (-1.2921, 36.8219),
+    "Mombasa": (-4.0435, 39.6682),
+    "Kisumu": (-0.0917, 34.7680),
+    "Nakuru": (-0.3031, 36.0800),
+    "Eldoret": (0.5143, 35.2698),
+    "Malindi": (-3.2192, 40.1169),
+    "Naivasha": (-0.7172, 36.4310),
+    "Nyeri": (-0.4201, 36.9476),
+    "Machakos": (-1.5177, 37.2634),
+    "Kitale": (1.0157, 35.0062),
+}
+NEIGHBOURHOODS = ("CBD", "Westlands", "Karen", "Kilimani", "Lavington", "Runda")
+FIRST_NAMES = ("John", "Jane", "Michael", "Sarah", "David", "Emma", "James", "Lisa")
+LAST_NAMES = ("Smith", "Otieno", "Wanjiru", "Kamau", "Mwangi", "Achieng", "Brown")
+BUSINESS_WORDS = {
+    "ecommerce": (
+        ("Tech", "Smart", "Prime", "Metro", "Urban"),
+        ("Mart", "Store", "Hub"),
+    ),
+    "restaurant": (
+        ("Tasty", "Gourmet", "Fresh", "Golden"),
+        ("Kitchen", "Cafe", "Grill"),
+    ),
+    "property": (
+        ("Premium", "Luxury", "Elite", "Royal"),
+        ("Homes", "Estates", "Realty"),
+    ),
+    "hotel": (
+        ("Comfort", "Grand", "Majestic", "Imperial"),
+        ("Hotel", "Suites", "Lodge"),
+    ),
+}
+# (adjectives, nouns, price range) per seeded category; other categories
+# fall back to GENERIC_WORDS.
+CATEGORY_WORDS = {
+    "main_course": (
+        ("Grilled", "Roasted", "Braised"),
+        ("Chicken", "Beef", "Tilapia"),
+        (500, 2000),
+    ),
+    "appetizers": (
+        ("Crispy", "Spicy", "Homemade"),
+        ("Samosas", "Wings", "Calamari"),
+        (200, 700),
+    ),
+    "beverages": (
+        ("Iced", "Hot", "Fresh"),
+        ("Coffee", "Tea", "Juice", "Smoothie"),
+        (100, 500),
+    ),
+    "desserts": (
+        ("Classic", "Homemade"),
+        ("Cheesecake", "Ice Cream", "Tiramisu"),
+        (300, 900),
+    ),
+    "breakfast": (
+        ("Full", "Light", "Farmhouse"),
+        ("Breakfast", "Pancakes", "Omelette"),
+        (300, 1200),
+    ),
+    "salads": (("Garden", "Greek", "Chef's"), ("Salad", "Bowl"), (300, 900)),
+    "soups": (("Creamy", "Spicy", "House"), ("Soup", "Broth"), (200, 600)),
+    "sides": (("Seasoned", "Steamed"), ("Fries", "Rice", "Greens"), (100, 400)),
+    "electronics": (
+        ("Smart", "Wireless", "Pro"),
+        ("Headphones", "Laptop", "Speaker"),
+        (2000, 120000),
+    ),
+    "furniture": (
+        ("Modern", "Classic", "Designer"),
+        ("Sofa", "Chair", "Table", "Bed"),
+        (5000, 60000),
+    ),
+    "fashion": (
+        ("Casual", "Formal", "Vintage"),
+        ("Jacket", "Dress", "Sneakers"),
+        (800, 15000),
+    ),
+    "beauty": (
+        ("Organic", "Herbal", "Daily"),
+        ("Serum", "Lotion", "Shampoo"),
+        (300, 5000),
+    ),
+    "sports": (
+        ("Pro", "Training", "Outdoor"),
+        ("Ball", "Racket", "Yoga Mat"),
+        (500, 20000),
+    ),
+    "books": (
+        ("Illustrated", "Pocket", "Collected"),
+        ("Novel", "Cookbook", "Atlas"),
+        (300, 4000),
+    ),
+    "home_appliances": (
+        ("Compact", "Digital", "Steel"),
+        ("Blender", "Kettle", "Microwave"),
+        (1500, 40000),
+    ),
+    "toys": (
+        ("Wooden", "Educational", "Remote"),
+        ("Puzzle", "Car", "Blocks"),
+        (200, 6000),
+    ),
+}
+GENERIC_WORDS = (
+    ("Premium", "Classic", "Everyday"),
+    ("Item", "Set", "Kit"),
+    (100, 10000),
+)
+FOOD_CATEGORIES = (
+    "main_course",
+    "appetizers",
+    "beverages",
+    "desserts",
+    "breakfast",
+    "salads",
+    "soups",
+    "sides",
+)
+PROPERTY_STATUSES = ("for_sale", "for_rent", "sold", "leased")
+ACCOMMODATION_STATUSES = ("available", "unavailable", "booked", "maintenance")
+
+# Fixed so that the same seed generates the same rows on every run.
+EPOCH = datetime(2026, 1, 1)
+
+
+class CatalogGenerator:
+    """
+    Generate a large, reproducible catalog on top of the seeded reference data.
+    Every table draws from its own random stream derived from ``seed``, so
+    a table's rows depend only on the seed and its own size. Rows are
+    streamed into Postgres with COPY, ``batch_size`` rows per round trip. The
+    ids of each table are reserved up front, so media rows can point at their
+    entities without reading them back; only the ids depend on the database.
+    """
+
+    def __init__(self, prefix="gen_", seed=42, batch_size=50000, password="password"):
+        self.prefix = prefix
+        self.seed = seed
+        self.batch_size = batch_size
+        # One hash for every generated owner, hashing millions would dominate.
+        self.password_hash = password_hasher.hash(password)
+        self.connection = db.session.connection()
+
+        self.user_type_id = self._reference(UserType, "business_owner")
+        self.business_types = {
+            kind: self._reference(BusinessType, kind, required=False)
+            for kind in BUSINESS_KINDS.values()
+        }
+        self.media_types = {
+            table: self._reference(EntityMediaType, name)
+            for table, name in MEDIA_TYPES.items()
+        }
+        self.property_types = [id for id, in db.session.query(PropertyType.id)]
+        self.room_types = [id for id, in db.session.query(RoomType.id)]
+        categories = db.session.query(Category.id, Category.name).all()
+        self.food_categories = [c for c in categories if c.name in FOOD_CATEGORIES]
+        self.product_categories = [
+            c for c in categories if c.name not in FOOD_CATEGORIES
+        ]
+        if not (self.property_types and self.room_types and categories):
+            raise click.ClickException(
+                "Seed the property types, room types and categories first"
+            )
+        self.food_categories = self.food_categories or categories
+        self.product_categories = self.product_categories or categories
+        self.businesses = {}
+
+    @staticmethod
+    def _reference(model, name, required=True):
+        id = db.session.query(model.id).filter_by(name=name).scalar()
+        if id is None and required:
+            raise click.ClickException(f"Seed the {model.__tablename__} first")
+        return id
+
+    def _rng(self, table):
+        return random.Random(f"{self.seed}:{table}")
+
+    def _copy(self, table, columns, rows):
+        """COPY rows into table in batches. :return: Number of rows copied."""
+        cursor = self.connection.connection.cursor()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = pending = 0
+
+        def flush():
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            buffer.seek(0)
+            buffer.truncate()
+
+        for row in rows:
+            writer.writerow(["" if v is None else v for v in row])
+            count += 1
+            pending += 1
+            if pending >= self.batch_size:
+                flush()
+                pending = 0
+        if pending:
+            flush()
+        return count
+
+    def _reserve_ids(self, table, count):
+        """
+        Take count consecutive ids from the table's sequence.
+        :return: The first id.
+        """
+        self.connection.execute(text(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE"))
+        return self.connection.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                "nextval(pg_get_serial_sequence(:table, 'id')) + :count - 1) "
+                "- :count + 1"
+            ),
+            {"table": table, "count": count},
+        ).scalar()
+
+    def _created(self, rng):
+        created = EPOCH - timedelta(seconds=rng.randrange(2 * 365 * 86400))
+        return created, created
+
+    def _place(self, rng):
+        city = rng.choice(list(CITIES))
+        lat, lon = CITIES[city]
+        return (
+            f"{city}, {rng.choice(NEIGHBOURHOODS)}",
+            round(lat + rng.gauss(0, 0.05), 6),
+            round(lon + rng.gauss(0, 0.05), 6),
+        )
+
+    def media_url(self, table, n, index):
+        # Built from the row number, not the id, so reruns yield the same URLs.
+        return (
+            f"https://picsum.photos/seed/{self.prefix}{MEDIA_TYPES[table]}"
+            f"{n}_{index}/800/600"
+        )
+
+    def users(self, count):
+        rng = self._rng("app_users")
+        for n in range(1, count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            login = f"{self.prefix}{first.lower()}.{last.lower()}{n}"
+            yield (
+                f"{self.prefix}usr_{n:07d}",
+                first,
+                last,
+                login,
+                f"{login}@example.com",
+                self.user_type_id,
+                self.password_hash,
+                *self._created(rng),
+            )
+
+    def business_rows(self, count, owners):
+        rng = self._rng("m_business")
+        kinds = list(BUSINESS_KINDS.values())
+        weights = list(CATALOG_SHARES.values())
+        for n in range(1, count + 1):
+            # Every kind gets a business before the rest are drawn by share.
+            kind = kinds[n - 1] if n <= len(kinds) else rng.choices(kinds, weights)[0]
+            id = f"{self.prefix}biz_{n:07d}"
+            self.businesses.setdefault(kind, []).append(id)
+            adjectives, nouns = BUSINESS_WORDS[kind]
+            yield (
+                id,
+                f"{rng.choice(adjectives)} {rng.choice(nouns)} {n}",
+                self.business_types[kind],
+                *self._place(rng),
+                rng.randint(1, 3) if kind in ("restaurant", "hotel") else None,
+                f"+2547{rng.randrange(10**8):08d}",
+                f"{self.prefix}business{n}@example.com",
+                f"{self.prefix}usr_{rng.randint(1, owners):07d}",
+                *self._created(rng),
+            )
+
+    def _owner_picker(self, rng, table):
+        # A few businesses own most of the rows, like a real marketplace.
+        owners = self.businesses[BUSINESS_KINDS[table]]
+        cumulative, total = [], 0.0
+        for rank in range(len(owners)):
+            total += 1 / (rank + 1) ** 0.8
+            cumulative.append(total)
+        return lambda: rng.choices(owners, cum_weights=cumulative)[0]
+
+    def _catalog_item(self, rng, category):
+        adjectives, nouns, (low, high) = CATEGORY_WORDS.get(
+            category.name, GENERIC_WORDS
+        )
+        name = f"{rng.choice(adjectives)} {rng.choice(nouns)}"
+        price = round(rng.uniform(low, high), 2)
+        return name, f"{name} from our {category.name.replace('_', ' ')} range", price
+
+    def products(self, first_id, count, with_media):
+        rng = self._rng("products")
+        owner = self._owner_picker(rng, "products")
+        for n, id in enumerate(range(first_id, first_id + count), 1):
+            category = rng.choice(self.product_categories)
+            name, description, price = self._catalog_item(rng, category)
+            yield (
+                id,
+                owner(),
+                f"{name} {n}",
+                description,
+                price,
+                category.id,
+                rng.randint(0, 500),
+                self.media_url("products", n, 1) if with_media else None,
+                min(5, max(0, round(rng.gauss(3.5, 1.2)))),
+                *self._created(rng),
+            )
+
+    def foods(self, first_id, count):
+        rng = self._rng("food")
+        owner = self._owner_picker(rng, "food")
+        for n, id in enumerate(range(first_id, first_id + count), 1):
+            category = rng.choice(self.food_categories)
+            name, description, price = self._catalog_item(rng, category)
+            yield (
+                id,
+                owner(),
+                category.id,
+                name,
+                description,
+                price,
+                rng.random() < 0.9,
+                *self._created(rng),
+            )
+
+    def properties(self, first_id, count):
+        rng = self._rng("property")
+        owner = self._owner_picker(rng, "property")
+        for n, id in enumerate(range(first_id, first_id + count), 1):
+            bedrooms = rng.randint(1, 6)
+            yield (
+                id,
+                owner(),
+                rng.choice(self.property_types),
+                f"{rng.choice(('Sunset', 'Riverside', 'Garden', 'Park'))} "
+                f"{rng.choice(('View', 'Heights', 'Court', 'Residences'))} {n}",
+                f"{bedrooms} bedroom property with "
+                f"{rng.choice(('a garden', 'a pool', 'secure parking', 'a view'))}",
+                bedrooms,
+                rng.randint(1, bedrooms),
+                f"{rng.randint(50, 550)} sq.m",
+                round(rng.lognormvariate(16, 0.6), 2),
+                *self._place(rng),
+                rng.choice(PROPERTY_STATUSES),
+                str(rng.randint(1990, 2025)),
+                *self._created(rng),
+            )
+
+    def accommodations(self, first_id, count):
+        rng = self._rng("accomodation")
+        owner = self._owner_picker(rng, "accomodation")
+        for n, id in enumerate(range(first_id, first_id + count), 1):
+            bedrooms = rng.randint(1, 3)
+            yield (
+                id,
+                owner(),
+                rng.choice(self.room_types),
+                f"{rng.choice(('Deluxe', 'Standard', 'Executive'))} "
+                f"{rng.choice(('Room', 'Suite', 'Studio'))} {n}",
+                f"Accommodation with {rng.choice(('scenic views', 'a balcony'))}",
+                bedrooms,
+                round(rng.uniform(3000, 8000) * bedrooms, 2),
+                *self._place(rng),
+                rng.choices(ACCOMMODATION_STATUSES, (80, 5, 10, 5))[0],
+                rng.choice(("12:00", "13:00", "14:00")),
+                rng.choice(("10:00", "11:00")),
+                *self._created(rng),
+            )
+
+    def media(self, table, first_id, count):
+        rng = self._rng(f"entity_media:{table}")
+        entity_type_id = self.media_types[table]
+        for n, id in enumerate(range(first_id, first_id + count), 1):
+            for index in range(1, rng.randint(1, 3) + 1):
+                url = self.media_url(table, n, index)
+                yield entity_type_id, id, url, 1, "ready"
+
+    def run(self, rows, businesses, with_media=True, echo=None):
+        """
+        Generate the catalog and commit.
+        :param rows: Catalog rows across products, food, property and
+            accommodations, split by CATALOG_SHARES.
+        :param businesses: Number of businesses, owned by half as many users.
+        :return: Dict of table name to rows generated.
+        """
+        echo = echo or (lambda message: None)
+        counts = {}
+        owners = max(1, businesses // 2)
+        generators = {
+            "app_users": (
+                (
+                    "id",
+                    "first_name",
+                    "last_name",
+                    "username",
+                    "email",
+                    "user_type_id",
+                    "password",
+                    "created_at",
+                    "updated_at",
+                ),
+                self.users(owners),
+            ),
+            "m_business": (
+                (
+                    "id",
+                    "name",
+                    "business_type_id",
+                    "location",
+                    "latitude",
+                    "longitude",
+                    "hospitality_type",
+                    "phone_number",
+                    "email",
+                    "user_id",
+                    "created_at",
+                    "updated_at",
+                ),
+                self.business_rows(max(businesses, len(BUSINESS_KINDS)), owners),
+            ),
+        }
+        for table, (columns, generated) in generators.items():
+            start = time.perf_counter()
+            counts[table] = self._copy(table, columns, generated)
+            echo(f"{table}: {counts[table]} rows in {time.perf_counter() - start:.1f}s")
+
+        catalog = {
+            "products": (
+                (
+                    "id",
+                    "business_id",
+                    "name",
+                    "description",
+                    "price",
+                    "category_id",
+                    "stock",
+                    "image_url",
+                    "rating",
+                    "created_at",
+                    "updated_at",
+                ),
+                lambda first, count: self.products(first, count, with_media),
+            ),
+            "food": (
+                (
+                    "id",
+                    "business_id",
+                    "category_id",
+                    "name",
+                    "description",
+                    "price",
+                    "is_available",
+                    "created_at",
+                    "updated_at",
+                ),
+                self.foods,
+            ),
+            "property": (
+                (
+                    "id",
+                    "business_id",
+                    "property_type_id",
+                    "name",
+                    "description",
+                    "bedrooms",
+                    "bathrooms",
+                    "land_size",
+                    "price",
+                    "location",
+                    "latitude",
+                    "longitude",
+                    "status",
+                    "year_built",
+                    "created_at",
+                    "updated_at",
+                ),
+                self.properties,
+            ),
+            "accomodation": (
+                (
+                    "id",
+                    "business_id",
+                    "room_type_id",
+                    "name",
+                    "description",
+                    "bedrooms",
+                    "price",
+                    "location",
+                    "latitude",
+                    "longitude",
+                    "status",
+                    "check_in_time",
+                    "check_out_time",
+                    "created_at",
+                    "updated_at",
+                ),
+                self.accommodations,
+            ),
+        }
+        counts["entity_media"] = 0
+        for table, share in CATALOG_SHARES.items():
+            columns, generate = catalog[table]
+            count = round(rows * share)
+            start = time.perf_counter()
+            first_id = self._reserve_ids(table, count) if count else 0
+            counts[table] = self._copy(table, columns, generate(first_id, count))
+            if with_media and count:
+                counts["entity_media"] += self._copy(
+                    "entity_media",
+                    ("entity_type_id", "entity_id", "url", "storage_type", "status"),
+                    self.media(table, first_id, count),
+                )
+            echo(f"{table}: {counts[table]} rows in {time.perf_counter() - start:.1f}s")
+        db.session.commit()
+        return counts
+
+
+def purge_catalog(prefix):
+    """
+    Delete what CatalogGenerator generated with prefix, then commit.
+    :return: Dict of table name to rows deleted.
+    """
+    like = {"pattern": prefix.replace("_", r"\_").replace("%", r"\%") + "%"}
+    deleted = {"entity_media": 0}
+    for table, media_type in MEDIA_TYPES.items():
+        deleted["entity_media"] += db.session.execute(
+            text(f"""
+                DELETE FROM entity_media m
+                USING {table} t, entity_media_types mt
+                WHERE m.entity_id = t.id AND m.entity_type_id = mt.id
+                    AND mt.name = :media_type AND t.business_id LIKE :pattern
+                """),
+            {**like, "media_type": media_type},
+        ).rowcount
+    for table in CATALOG_SHARES:
+        deleted[table] = db.session.execute(
+            text(f"DELETE FROM {table} WHERE business_id LIKE :pattern"), like
+        ).rowcount
+    deleted["m_business"] = db.session.execute(
+        text("DELETE FROM m_business WHERE id LIKE :pattern"), like
+    ).rowcount
+    deleted["app_users"] = db.session.execute(
+        text("DELETE FROM app_users WHERE id LIKE :pattern"), like
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def init_generate_cli(app):
+    """Register the ``flask generate-catalog`` command."""
+
+    @app.cli.command("generate-catalog")
+    @click.option("--rows", type=int, default=100000, help="Catalog rows in total.")
+    @click.option("--businesses", type=int, help="Defaults to one per 250 rows.")
+    @click.option("--seed", type=int, default=42)
+    @click.option("--prefix", default="gen_", help="Prefix of generated ids.")
+    @click.option("--media/--no-media", default=True, help="Add 1-3 media per row.")
+    @click.option("--password", default="password", help="Password of the owners.")
+    @click.option("--purge", is_flag=True, help="Delete the prefix's rows instead.")
+    def generate_catalog_command(
+        rows, businesses, seed, prefix, media, password, purge
+    ):
+        """Generate a large synthetic catalog for performance testing."""
+        if purge:
+            deleted = purge_catalog(prefix)
+            click.echo(", ".join(f"{n} {table}" for table, n in deleted.items()))
+            return
+        exists = db.session.execute(
+            text("SELECT 1 FROM m_business WHERE id = :id"),
+            {"id": f"{prefix}biz_0000001"},
+        ).scalar()
+        if exists:
+            raise click.ClickException(
+                f"A catalog with prefix {prefix!r} exists, run with --purge first"
+            )
+
+        start = time.perf_counter()
+        generator = CatalogGenerator(
+            prefix, seed, app.config["GENERATE_BATCH_SIZE"], password
+        )
+        counts = generator.run(
+            rows, businesses or max(1, rows // 250), media, click.echo
+        )
+        for table in TABLES:
+            db.session.execute(text(f"ANALYZE {table}"))
+        db.session.commit()
+        top_products_refresher.refresh()
+        elapsed = time.perf_counter() - start
+        total = sum(counts.values())
+        click.echo(
+            f"{total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)"
+        )
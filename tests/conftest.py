@@ -0,0 +1,119 @@
+"""
+Fixtures for the tests that need Postgres. Point TEST_DATABASE_URL at an empty
+throwaway database; the app creates its tables there on import. Without it
+every test is skipped.
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# The tests sweep themselves, a background sweep would race them.
+os.environ["RESERVATION_SWEEP_INTERVAL"] = "3600"
+# products/utils.py prompts for the key on import when it is unset.
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "unused")
+os.environ.setdefault("MEDIA_STORAGE", "memory")
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("Set TEST_DATABASE_URL to run the Postgres tests")
+    from app import app
+
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _reference(model, name):
+    from config import db
+
+    row = model.query.filter_by(name=name).first()
+    if row is None:
+        row = model(name=name)
+        db.session.add(row)
+        db.session.flush()
+    return row
+
+
+@pytest.fixture
+def owner(app):
+    """A business_owner with a business, as (user, business, auth headers)."""
+    from flask_jwt_extended import create_access_token
+
+    from config import db
+    from models import Business, BusinessType, User, UserType
+
+    suffix = uuid.uuid4().hex[:8]
+    user = User(
+        id=f"test-{suffix}",
+        first_name="Test",
+        last_name="Owner",
+        username=f"owner-{suffix}",
+        email=f"owner-{suffix}@example.com",
+        password="unused",
+        user_type_id=_reference(UserType, "business_owner").id,
+    )
+    business = Business(
+        id=suffix,
+        name=f"Business {suffix}",
+        location="Nairobi",
+        user_id=user.id,
+        business_type_id=_reference(BusinessType, "ecommerce").id,
+    )
+    db.session.add_all([user, business])
+    db.session.commit()
+    token = create_access_token(
+        identity=user.id,
+        additional_claims={"email": user.email, "role": "business_owner"},
+    )
+    return user, business, {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def product(owner):
+    """A product with one unit in stock."""
+    from config import db
+    from models import Category, Product
+
+    _, business, _ = owner
+    product = Product(
+        name=f"Product {uuid.uuid4().hex[:8]}",
+        price=10,
+        stock=1,
+        business_id=business.id,
+        category_id=_reference(Category, "electronics").id,
+    )
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+@pytest.fixture
+def accommodation(owner):
+    """A bookable accommodation of the owner's business."""
+    from config import db
+    from models import Accommodation, RoomType
+
+    _, business, _ = owner
+    accommodation = Accommodation(
+        name="Test room",
+        price=50,
+        business_id=business.id,
+        room_type_id=_reference(RoomType, "single").id,
+    )
+    db.session.add(accommodation)
+    db.session.commit()
+    return accommodation
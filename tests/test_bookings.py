@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+
+def _book(client, accommodation_id, headers, check_in, check_out):
+    return client.post(
+        f"/api/v1/accommodations/{accommodation_id}/book",
+        json={"check_in": check_in, "check_out": check_out},
+        headers=headers,
+    )
+
+
+def test_overlapping_booking_is_409(client, owner, accommodation):
+    _, _, headers = owner
+    first = _book(client, accommodation.id, headers, "2030-01-10", "2030-01-15")
+    assert first.status_code == 201
+
+    overlapping = _book(client, accommodation.id, headers, "2030-01-14", "2030-01-20")
+    assert overlapping.status_code == 409
+    inside = _book(client, accommodation.id, headers, "2030-01-11", "2030-01-12")
+    assert inside.status_code == 409
+    # Stays are half-open, checking in on the day of check-out is fine.
+    adjacent = _book(client, accommodation.id, headers, "2030-01-15", "2030-01-18")
+    assert adjacent.status_code == 201
+
+
+def test_cancelled_booking_frees_its_dates(client, owner, accommodation):
+    _, _, headers = owner
+    booking = _book(client, accommodation.id, headers, "2030-02-01", "2030-02-05")
+    booking_id = booking.get_json()["booking"]["id"]
+    cancel = client.post(
+        f"/api/v1/accommodations/bookings/{booking_id}/cancel", headers=headers
+    )
+    assert cancel.status_code == 200
+    again = _book(client, accommodation.id, headers, "2030-02-02", "2030-02-04")
+    assert again.status_code == 201
+
+
+def test_concurrent_bookings_of_the_same_dates(app, owner, accommodation):
+    _, _, headers = owner
+    # Plain values: the threads have no app context to load attributes in.
+    accommodation_id = accommodation.id
+    attempts = 8
+    barrier = threading.Barrier(attempts)
+    statuses = []
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        response = _book(client, accommodation_id, headers, "2030-03-01", "2030-03-08")
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=book) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [409] * (attempts - 1)
+
+
+@pytest.mark.parametrize(
+    "query", ["min_price=cheap", "max_price=inf", "bedrooms=2.5", "bedrooms=two"]
+)
+def test_available_rejects_malformed_filters(client, query):
+    response = client.get(
+        f"/api/v1/accommodations/available?check_in=2030-04-01"
+        f"&check_out=2030-04-03&{query}"
+    )
+    assert response.status_code == 400
+
+
+def test_available_skips_booked_accommodations(client, owner, accommodation):
+    _, _, headers = owner
+    accommodation_id = accommodation.id
+    url = (
+        "/api/v1/accommodations/available?check_in=2030-05-01"
+        "&check_out=2030-05-03&min_price=50&max_price=50&per_page=100"
+    )
+    ids = [item["id"] for item in client.get(url).get_json()["items"]]
+    assert accommodation_id in ids
+
+    _book(client, accommodation_id, headers, "2030-05-02", "2030-05-04")
+    ids = [item["id"] for item in client.get(url).get_json()["items"]]
+    assert accommodation_id not in ids
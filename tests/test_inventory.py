@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from config import db
+from inventory import (
+    ReservationError,
+    commit_reservation,
+    reservation_sweeper,
+    reserve_stock,
+)
+from models import Product, StockReservation
+
+
+def _stock(product_id):
+    db.session.rollback()
+    return db.session.get(Product, product_id).stock
+
+
+def test_concurrent_reservations_never_oversell(app, owner, product):
+    user, _, _ = owner
+    # Plain values: the threads must not refresh the main thread's instances.
+    product_id, user_id = product.id, user.id
+    attempts = 8
+    barrier = threading.Barrier(attempts)
+    outcomes = []
+
+    def reserve():
+        with app.app_context():
+            barrier.wait()
+            try:
+                reserve_stock(product_id, 1, user_id, 600)
+                outcomes.append(201)
+            except ReservationError as e:
+                outcomes.append(e.status_code)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=reserve) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == [201] + [409] * (attempts - 1)
+    assert _stock(product_id) == 0
+    held = StockReservation.query.filter_by(product_id=product_id).all()
+    assert [(r.status, r.quantity) for r in held] == [("held", 1)]
+
+
+def test_expired_reservation_is_restocked_by_the_sweep(app, owner, product):
+    user, _, _ = owner
+    reservation = reserve_stock(product.id, 1, user.id, 600)
+    assert _stock(product.id) == 0
+    db.session.execute(
+        text(
+            "UPDATE stock_reservations SET expires_at = now() - interval '1 second' "
+            "WHERE id = :id"
+        ),
+        {"id": reservation.id},
+    )
+    db.session.commit()
+
+    # Past its expiry the hold can no longer be committed, even before a sweep.
+    with pytest.raises(ReservationError) as error:
+        commit_reservation(reservation.id, user.id)
+    assert error.value.status_code == 409
+
+    while reservation_sweeper.sweep():
+        pass
+    assert _stock(product.id) == 1
+    assert db.session.get(StockReservation, reservation.id).status == "expired"
+    # Swept once only.
+    assert reservation_sweeper.sweep() == 0
+    assert _stock(product.id) == 1
+
+
+def test_reserve_endpoint_answers_409_when_sold_out(client, owner, product):
+    _, _, headers = owner
+    url = f"/api/v1/products/{product.id}/reserve"
+    assert client.post(url, json={"quantity": 1}, headers=headers).status_code == 201
+    response = client.post(url, json={"quantity": 1}, headers=headers)
+    assert response.status_code == 409
+    assert (
+        client.post(
+            "/api/v1/products/0/reserve", json={"quantity": 1}, headers=headers
+        ).status_code
+        == 404
+    )
@@ -0,0 +1,33 @@
+import multiprocessing
+
+import pytest
+
+from passwords import PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=3)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_every_worker_starts_with_the_executor(hasher):
+    before = set(multiprocessing.active_children())
+    hasher._executor()
+    started = set(multiprocessing.active_children()) - before
+    assert len(started) == 3
+
+    # A burst finds them all there and starts no more.
+    hashes = [hasher.hash(f"password{i}") for i in range(6)]
+    assert all(hasher.verify(h, f"password{i}") for i, h in enumerate(hashes))
+    assert set(multiprocessing.active_children()) - before == started
+
+
+@pytest.mark.parametrize("username", [42, ["ab"], {"name": "ab"}])
+def test_signin_rejects_a_username_that_is_not_a_string(client, username):
+    response = client.post(
+        "/api/v1/auth/signin", json={"username": username, "password": "pw"}
+    )
+    assert response.status_code == 400
+    assert response.get_json()["invalid_fields"] == ["username"]
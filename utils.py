@@ -0,0 +1,296 @@
+import csv
+import hashlib
+import io
+import json
+import math
+from datetime import timezone
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import func, inspect, literal, union_all
+from sqlalchemy.orm import joinedload, load_only, noload
+
+from cache import reference_cache
+from config import db
+from models import (
+    Accommodation,
+    EntityMedia,
+    EntityMediaType,
+    Food,
+    Product,
+    Property,
+)
+
+
+def parse_fields(model):
+    """
+    Parse the ``fields`` query parameter for a sparse fieldset.
+    :param model: Model whose ``serialize_only`` lists the allowed fields.
+    :return: Tuple of (fields, error). fields is None when not requested; error
+        is a ready 400 response naming the unknown fields, or None.
+    """
+    raw = request.args.get("fields", "", type=str)
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    if not fields:
+        return None, None
+    invalid = [f for f in fields if f not in model.serialize_only]
+    if invalid:
+        return fields, make_response(
+            jsonify({"error": "Invalid fields", "invalid_fields": invalid}), 400
+        )
+    return fields, None
+
+
+def number_arg(name, convert):
+    """
+    Read a numeric query parameter. Unlike request.args.get(type=...), a
+    malformed or non-finite value is reported instead of ignored.
+    :param convert: int or float.
+    :return: Tuple of (value or None when absent, error).
+    """
+    raw = request.args.get(name, type=str)
+    if raw is None or raw == "":
+        return None, None
+    error = f"{name} must be {'an integer' if convert is int else 'a number'}"
+    try:
+        value = convert(raw)
+    except ValueError:
+        return None, error
+    if not math.isfinite(value):
+        return None, error
+    return value, None
+
+
+def contains_pattern(value):
+    """
+    ILIKE pattern matching value anywhere, with its own ``%`` and ``_``
+    taken literally. Use with ``escape="\\"``.
+    """
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def load_fields(query, model, fields=None):
+    """
+    Restrict a query to the columns and relationships needed to serialize fields.
+    Computed fields such as ``category`` are resolved through the model's
+    ``serialize_relations`` map and joined in, every other relationship is skipped.
+    :param query: Query over model.
+    :param model: Model being queried.
+    :param fields: Fields to serialize, defaults to ``serialize_only``.
+    :return: Query with loader options applied.
+    """
+    mapper = inspect(model)
+    relations = getattr(model, "serialize_relations", {})
+    column_keys = {attr.key for attr in mapper.column_attrs}
+
+    columns = {attr.key for attr in mapper.column_attrs if attr.columns[0].primary_key}
+    if "updated_at" in column_keys:
+        # Always loaded, catalog_validator needs it.
+        columns.add("updated_at")
+    wanted = set()
+    for field in fields or model.serialize_only:
+        if field in column_keys:
+            columns.add(field)
+        elif field in relations:
+            wanted.add(relations[field])
+
+    options = []
+    for rel in mapper.relationships:
+        if rel.key in wanted:
+            columns.update(
+                mapper.get_property_by_column(c).key for c in rel.local_columns
+            )
+            options.append(joinedload(getattr(model, rel.key)))
+        else:
+            options.append(noload(getattr(model, rel.key)))
+
+    return query.options(load_only(*(getattr(model, c) for c in columns)), *options)
+
+
+def _row_modified(row):
+    # The row's own updated_at and that of the loaded rows it serializes
+    # names from, e.g. a product's category and business.
+    state = inspect(row)
+    stamps = [state.dict.get("updated_at")]
+    for key in set(getattr(row, "serialize_relations", {}).values()):
+        related = state.dict.get(key)
+        if related is not None:
+            stamps.append(inspect(related).dict.get("updated_at"))
+    return max(filter(None, stamps), default=None)
+
+
+def catalog_validator(model, rows, *parts, related=()):
+    """
+    Compute the validators of a representation from the rows it is built of,
+    so no extra query is needed. Rows must be loaded through load_fields.
+    :param model: Model being served.
+    :param rows: The rows in the body, e.g. one page.
+    :param parts: Further values the body depends on, such as a page total.
+    :param related: Other rows in the body carrying ``updated_at``, e.g. media.
+    :return: Tuple of (etag, last_modified).
+    """
+    stamps = [(row.id, _row_modified(row)) for row in rows]
+    stamps += [(type(row).__name__, row.id, row.updated_at) for row in related]
+    last_modified = max((stamp[-1] for stamp in stamps if stamp[-1]), default=None)
+    return make_etag(model, *parts, stamps), last_modified
+
+
+def make_etag(model, *parts):
+    """
+    Build an ETag for a representation of model.
+    The request arguments (filters, page, fields) are always part of the tag.
+    :param model: Model being served.
+    :param parts: Validator values such as an id, last_modified and count.
+    :return: Hex digest usable as an entity tag.
+    """
+    args = sorted(request.args.items(multi=True))
+    raw = "|".join(str(part) for part in (model.__tablename__, *parts, args))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _http_datetime(value):
+    return value.replace(tzinfo=value.tzinfo or timezone.utc, microsecond=0)
+
+
+def set_validators(response, etag, last_modified, weak=False):
+    """
+    Attach ETag and Last-Modified headers to a response. The ETag is strong;
+    compression.py weakens it when it compresses the body.
+    """
+    response.set_etag(etag, weak=weak)
+    if last_modified:
+        response.last_modified = _http_datetime(last_modified)
+    return response
+
+
+def not_modified(etag, last_modified):
+    """
+    Answer a conditional GET when the client's copy is still current.
+    If-None-Match takes precedence over If-Modified-Since.
+    :return: 304 response, or None when the representation must be sent.
+    """
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif not (
+        request.if_modified_since
+        and last_modified
+        and _http_datetime(last_modified) <= request.if_modified_since
+    ):
+        return None
+    # Answer with the tag as the client holds it: weak after a compressed 200.
+    weak = bool(request.if_none_match) and not request.if_none_match.contains(etag)
+    return set_validators(make_response("", 304), etag, last_modified, weak)
+
+
+def parse_batch_ids():
+    """
+    Read the ``ids`` list of a batch request body.
+    :return: Tuple of (ids, error). ids are unique integers in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return None, "ids must be a non-empty list"
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+    except (TypeError, ValueError):
+        return None, "ids must be integers"
+    # Repeated ids cost nothing, only distinct ones count against the limit.
+    limit = current_app.config["BATCH_MAX_IDS"]
+    if len(ids) > limit:
+        return None, f"At most {limit} ids can be requested at once"
+    return ids, None
+
+
+def batch_get(model, media_type, ids, fields=None):
+    """
+    Load several rows and their media with one query per table.
+    :param model: Model to load.
+    :param media_type: EntityMediaType name the media rows are stored under.
+    :param ids: Primary keys in the order they should be returned.
+    :param fields: Optional sparse fieldset.
+    :return: Tuple of (items, missing_ids), items carry a ``media`` url list.
+    """
+    rows = load_fields(model.query, model, fields).filter(model.id.in_(ids)).all()
+    found = {row.id: row for row in rows}
+
+    media = {}
+    entity_type = reference_cache.by_name(EntityMediaType, media_type)
+    if entity_type and found:
+        for entity_id, url in (
+            EntityMedia.query.with_entities(EntityMedia.entity_id, EntityMedia.url)
+            .filter(
+                EntityMedia.entity_type_id == entity_type.id,
+                EntityMedia.entity_id.in_(list(found)),
+                EntityMedia.status == "ready",
+            )
+            .order_by(EntityMedia.id)
+        ):
+            media.setdefault(entity_id, []).append(url)
+
+    items = []
+    for id in ids:
+        if id in found:
+            item = found[id].to_dict(only=fields or ())
+            item["media"] = media.get(id, [])
+            items.append(item)
+    return items, [id for id in ids if id not in found]
+
+
+def export_rows(sources, batch_size):
+    """
+    Stream serialized rows from several queries through server-side cursors.
+    :param sources: Iterable of (kind, model, query) tuples.
+    :param batch_size: Rows fetched per round trip.
+    :return: Generator of (kind, row dict) tuples.
+    """
+    for kind, model, query in sources:
+        for row in load_fields(query, model).order_by(model.id).yield_per(batch_size):
+            yield kind, row.to_dict()
+
+
+def ndjson_lines(rows):
+    """Encode (kind, row) tuples as newline delimited JSON."""
+    for kind, row in rows:
+        yield json.dumps({"type": kind, **row}, default=str) + "\n"
+
+
+def csv_lines(rows, fieldnames):
+    """Encode (kind, row) tuples as CSV, one line per yielded chunk."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, ["type", *fieldnames], extrasaction="ignore")
+    writer.writeheader()
+    for kind, row in rows:
+        writer.writerow({"type": kind, **row})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def catalog_counts(business_ids):
+    """
+    Count products, foods, properties and accommodations per business.
+    All four tables are counted in one UNION ALL aggregate query.
+    :return: Dict of business id to a dict of counts.
+    """
+    kinds = {
+        "products": Product,
+        "foods": Food,
+        "properties": Property,
+        "accommodations": Accommodation,
+    }
+    counts = {id: dict.fromkeys(kinds, 0) for id in business_ids}
+    if not business_ids:
+        return counts
+    statement = union_all(
+        *(
+            db.select(model.business_id, literal(kind), func.count())
+            .where(model.business_id.in_(business_ids))
+            .group_by(model.business_id)
+            for kind, model in kinds.items()
+        )
+    )
+    for business_id, kind, count in db.session.execute(statement):
+        counts[business_id][kind] = count
+    return counts